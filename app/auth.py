@@ -0,0 +1,138 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+# --- TOKEN CONFIG ---
+# Without a configured key every worker signs with its own random key,
+# so tokens only validate on the worker that issued them
+AUTH_SECRET_KEY = (os.getenv("AUTH_SECRET_KEY") or secrets.token_hex(32)).encode("utf-8")
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", "900"))
+REFRESH_TOKEN_TTL = int(os.getenv("REFRESH_TOKEN_TTL", str(7 * 24 * 3600)))
+
+# Shared secret (X-Staff-Key header) for staff operations such as cohort
+# re-scoring; unset disables them
+STAFF_API_KEY = os.getenv("STAFF_API_KEY")
+
+ACCESS = "access"
+REFRESH = "refresh"
+
+
+class Principal(NamedTuple):
+    role: str  # "student" or "doctor"
+    subject_id: int
+    jti: str
+    expires_at: int
+
+
+# jti -> expiry; entries are dropped once the token would have expired anyway
+_revoked: dict = {}
+_revoked_lock = threading.Lock()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(body: str) -> str:
+    return _b64encode(hmac.new(AUTH_SECRET_KEY, body.encode("ascii"), hashlib.sha256).digest())
+
+
+def create_token(role: str, subject_id: int, token_type: str, ttl: int) -> str:
+    payload = {
+        "sub": subject_id,
+        "role": role,
+        "typ": token_type,
+        "exp": int(time.time()) + ttl,
+        "jti": secrets.token_urlsafe(12),
+    }
+    body = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    return f"{body}.{_sign(body)}"
+
+
+def issue_tokens(role: str, subject_id: int) -> dict:
+    return {
+        "access_token": create_token(role, subject_id, ACCESS, ACCESS_TOKEN_TTL),
+        "refresh_token": create_token(role, subject_id, REFRESH, REFRESH_TOKEN_TTL),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_TTL,
+    }
+
+
+def decode_token(token: str, token_type: str) -> Optional[Principal]:
+    """
+    Verify signature, type, expiry and revocation in memory.
+    Returns None for any invalid token.
+    """
+    try:
+        body, signature = token.split(".")
+        # Bytes, since compare_digest rejects non-ASCII str with TypeError
+        if not hmac.compare_digest(signature.encode("utf-8"), _sign(body).encode("ascii")):
+            return None
+        payload = json.loads(_b64decode(body))
+    except (ValueError, UnicodeError):
+        return None
+
+    if payload.get("typ") != token_type or payload["exp"] < time.time():
+        return None
+    if payload["jti"] in _revoked:
+        return None
+    return Principal(payload["role"], payload["sub"], payload["jti"], payload["exp"])
+
+
+def revoke(principal: Principal) -> None:
+    now = time.time()
+    with _revoked_lock:
+        for jti in [jti for jti, exp in _revoked.items() if exp < now]:
+            del _revoked[jti]
+        _revoked[principal.jti] = principal.expires_at
+
+
+# --- FASTAPI DEPENDENCIES ---
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+def get_current_principal(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+) -> Principal:
+    principal = decode_token(credentials.credentials, ACCESS) if credentials else None
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired access token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+
+def require_owner(principal: Principal, role: str, subject_id: int) -> Principal:
+    """403 unless the principal is the `role` account `subject_id`."""
+    if principal.role != role or principal.subject_id != subject_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Not allowed for this {role}")
+    return principal
+
+
+def require_student(student_id: int, principal: Principal = Depends(get_current_principal)) -> Principal:
+    """Only the student named in the path may act on their own data."""
+    return require_owner(principal, "student", student_id)
+
+
+def require_doctor(doctor_id: int, principal: Principal = Depends(get_current_principal)) -> Principal:
+    """Only the doctor named in the path may act on their own data."""
+    return require_owner(principal, "doctor", doctor_id)
+
+
+def is_staff(staff_key: Optional[str]) -> bool:
+    return bool(STAFF_API_KEY and staff_key and hmac.compare_digest(staff_key, STAFF_API_KEY))
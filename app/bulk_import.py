@@ -0,0 +1,278 @@
+"""
+Streaming bulk import of student accounts and optional profiles.
+
+Rows are read line by line (CSV with a header, or NDJSON), validated against
+StudentCreate / StudentInfoBase, hashed in parallel on the bcrypt pool and
+inserted in large executemany batches. Bad rows are reported, not fatal.
+
+CLI:  python -m app.bulk_import students.csv [--format ndjson]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .database import Student, StudentInfo, StudentCreate, StudentInfoBase
+from .features import store_features
+from .hashing import hash_passwords
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+# Row errors kept in the report; the rest are only counted
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", "1000"))
+
+ACCOUNT_FIELDS = tuple(StudentCreate.model_fields)
+PROFILE_FIELDS = tuple(StudentInfoBase.model_fields)
+# students_info.year_range_check
+ACADEMIC_YEAR_RANGE = (0, 5)
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.profiles = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def fail(self, row: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": error})
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "profiles_created": self.profiles,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_omitted": self.failed - len(self.errors),
+        }
+
+
+# --- PARSING ---
+
+def iter_records(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, object]]:
+    """
+    Yield (row_number, dict) per record, or (row_number, error message) for
+    rows that cannot be parsed. Row numbers are 1-based data rows.
+    """
+    if fmt == "ndjson":
+        row = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row, f"Invalid JSON: {e}"
+                continue
+            yield row, record if isinstance(record, dict) else "Expected a JSON object"
+    else:
+        reader = csv.DictReader(lines)
+        for row, record in enumerate(reader, start=1):
+            yield row, record
+
+
+def csv_records(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Re-join physical lines into CSV records when a quoted field spans
+    newlines (an odd number of quotes means the record is still open).
+    """
+    pending = ""
+    for line in lines:
+        pending += line
+        if pending.count('"') % 2 == 0:
+            yield pending
+            pending = ""
+    if pending:
+        yield pending
+
+
+def _clean(record: dict) -> dict:
+    # CSV gives "" for empty cells; treat them as missing
+    return {key: value for key, value in record.items() if key and value not in ("", None)}
+
+
+def _validate(record: dict) -> Tuple[StudentCreate, Optional[StudentInfoBase]]:
+    record = _clean(record)
+    account = StudentCreate(**{key: record.get(key) for key in ACCOUNT_FIELDS})
+    profile = None
+    if any(key in record for key in PROFILE_FIELDS):
+        profile = StudentInfoBase(**{key: record[key] for key in PROFILE_FIELDS if key in record})
+    return account, profile
+
+
+def _check_constraints(profile: Optional[StudentInfoBase]) -> Optional[str]:
+    # Mirrors the students_info CHECK constraints, so one bad row cannot reject its chunk
+    low, high = ACADEMIC_YEAR_RANGE
+    if profile is not None and not low <= profile.academic_year <= high:
+        return f"academic_year: must be between {low} and {high}"
+    return None
+
+
+def _error_text(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()
+    )
+
+
+# --- LOADING ---
+
+def prepare_chunk(db: Session, records: List[Tuple[int, object]], report: ImportReport) -> list:
+    """
+    Validate a chunk and drop rows that clash with existing accounts.
+    Returns the accepted (row, account, profile) tuples.
+
+    Earlier chunks are committed before the next one is prepared, so the
+    database query below catches duplicates across chunks; only this
+    chunk's usernames and emails are held in memory.
+    """
+    valid = []
+    seen_usernames = set()
+    seen_emails = set()
+    for row, record in records:
+        report.rows += 1
+        if isinstance(record, str):
+            report.fail(row, record)
+            continue
+        try:
+            account, profile = _validate(record)
+        except ValidationError as e:
+            report.fail(row, _error_text(e))
+            continue
+        violation = _check_constraints(profile)
+        if violation:
+            report.fail(row, violation)
+            continue
+        if account.username in seen_usernames or account.email in seen_emails:
+            report.fail(row, "Duplicate username or email in import")
+            continue
+        seen_usernames.add(account.username)
+        seen_emails.add(account.email)
+        valid.append((row, account, profile))
+
+    if not valid:
+        return []
+
+    # One query for every conflict with existing accounts
+    taken = db.query(Student.username, Student.email).filter(or_(
+        Student.username.in_([account.username for _, account, _ in valid]),
+        Student.email.in_([account.email for _, account, _ in valid]),
+    )).all()
+    taken_usernames = {username for username, _ in taken}
+    taken_emails = {email for _, email in taken}
+
+    accepted = []
+    for row, account, profile in valid:
+        if account.username in taken_usernames or account.email in taken_emails:
+            report.fail(row, "Username or Email already registered")
+        else:
+            accepted.append((row, account, profile))
+    return accepted
+
+
+def _insert_rows(db: Session, accepted: list, hashes: List[str]) -> Tuple[list, list]:
+    student_ids = db.execute(
+        insert(Student).returning(Student.id, sort_by_parameter_order=True),
+        [
+            {"username": account.username, "email": account.email, "hashed_password": hashed}
+            for (_, account, _), hashed in zip(accepted, hashes)
+        ],
+    ).scalars().all()
+
+    profile_rows = [
+        {"student_id": student_id, **profile.model_dump()}
+        for (_, _, profile), student_id in zip(accepted, student_ids)
+        if profile is not None
+    ]
+    if profile_rows:
+        db.execute(insert(StudentInfo), profile_rows)
+        store_features(db, (StudentInfo(**row) for row in profile_rows))
+    return student_ids, profile_rows
+
+
+def insert_chunk(db: Session, accepted: list, hashes: List[str], report: ImportReport) -> None:
+    """
+    Insert accepted accounts and their profiles with one commit. If the
+    database rejects the chunk, its rows are retried one savepoint each so
+    only the offending rows fail.
+    """
+    try:
+        student_ids, profile_rows = _insert_rows(db, accepted, hashes)
+        db.commit()
+    except IntegrityError:
+        # A concurrent registration or a constraint we do not pre-check
+        db.rollback()
+    else:
+        report.created += len(student_ids)
+        report.profiles += len(profile_rows)
+        return
+
+    for item, hashed in zip(accepted, hashes):
+        try:
+            with db.begin_nested():
+                student_ids, profile_rows = _insert_rows(db, [item], [hashed])
+        except IntegrityError as e:
+            report.fail(item[0], f"Rejected by database: {e.orig}")
+            continue
+        report.created += len(student_ids)
+        report.profiles += len(profile_rows)
+    db.commit()
+
+
+def import_chunk(db: Session, records: List[Tuple[int, object]], report: ImportReport) -> None:
+    accepted = prepare_chunk(db, records, report)
+    if accepted:
+        hashes = hash_passwords([account.password for _, account, _ in accepted])
+        insert_chunk(db, accepted, hashes, report)
+
+
+def import_students(db: Session, lines: Iterable[str], fmt: str = "csv") -> ImportReport:
+    report = ImportReport()
+    if fmt == "csv":
+        lines = csv_records(lines)
+    chunk = []
+    for record in iter_records(lines, fmt):
+        chunk.append(record)
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            import_chunk(db, chunk, report)
+            chunk = []
+    if chunk:
+        import_chunk(db, chunk, report)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Bulk import student accounts and profiles")
+    parser.add_argument("path", help="CSV or NDJSON file, '-' for stdin")
+    parser.add_argument("--format", choices=("csv", "ndjson"), default=None)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    db = SessionLocal()
+    try:
+        report = import_students(db, stream, fmt)
+    finally:
+        db.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+    json.dump(report.as_dict(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
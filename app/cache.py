@@ -0,0 +1,250 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+# --- READ-THROUGH CACHE ---
+
+class CacheBackend:
+    """
+    Storage used by ReadThroughCache. The default keeps entries in this
+    process; a shared cache (e.g. Redis) implements the same coroutines so
+    every worker sees the same entries and invalidations.
+    """
+
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def incr(self, key: str) -> int:
+        """Atomically increment a counter (starting from 0); counters never expire."""
+        raise NotImplementedError
+
+    async def counter(self, key: str) -> int:
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class LocalCacheBackend(CacheBackend):
+    """In-process LRU with TTL and a size bound, backed by TTLCache."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Kept out of the LRU: an evicted generation would revive stale entries
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Any:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.cache.set(key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        self.cache.delete(key)
+
+    async def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    async def counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    async def clear(self) -> None:
+        self.cache.clear()
+        with self._lock:
+            self._counters.clear()
+
+    def size(self) -> Optional[int]:
+        return len(self.cache)
+
+
+class ReadThroughCache:
+    """
+    Loads missing keys through the given coroutine, with single-flight:
+    concurrent misses for one key in this process share a single load, so
+    a cold key under load costs one database query.
+
+    Group invalidation (e.g. every directory page) uses a generation
+    counter in the backend: keys embed the current generation and bumping
+    it orphans the old entries, which then age out of the LRU.
+
+    Invalidating a key or group also leaves a marker for one TTL. While it
+    is there, misses go through `primary_loader` when one is given, so a
+    lagging read replica cannot re-cache the row a write just replaced.
+    """
+
+    def __init__(self, name: str, backend: CacheBackend, ttl: Optional[float] = None):
+        self.name = name
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Keys invalidated while a load was in flight; that load may be stale
+        self._invalidated_inflight = set()
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        primary_loader: Optional[Callable[[], Awaitable[Any]]] = None,
+        group: Optional[str] = None,
+    ) -> Any:
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        written = False
+        try:
+            if primary_loader is not None:
+                written = await self._recently_written(key, group)
+                if written:
+                    loader = primary_loader
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark it retrieved for the no-waiter case
+            future.exception()
+            raise
+        else:
+            if value is not None and key not in self._invalidated_inflight:
+                await self.backend.set(key, value, self.ttl)
+                if written:
+                    # Group markers stay: other keys of the group still need fresh loads
+                    await self.backend.delete(self._written_key(key))
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+            self._invalidated_inflight.discard(key)
+
+    @staticmethod
+    def _written_key(key: str) -> str:
+        return f"{key}:written"
+
+    async def _recently_written(self, key: str, group: Optional[str]) -> bool:
+        if await self.backend.get(self._written_key(key)) is not None:
+            return True
+        return group is not None and await self.backend.get(self._written_key(group)) is not None
+
+    async def invalidate(self, key: str) -> None:
+        self.invalidations += 1
+        if key in self._inflight:
+            self._invalidated_inflight.add(key)
+        await self.backend.set(self._written_key(key), True, self.ttl)
+        await self.backend.delete(key)
+
+    async def generation(self, group: str) -> int:
+        return await self.backend.counter(f"{group}:generation")
+
+    async def bump_generation(self, group: str) -> None:
+        self.invalidations += 1
+        await self.backend.set(self._written_key(group), True, self.ttl)
+        await self.backend.incr(f"{group}:generation")
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "cache": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            # Coalesced lookups were served without their own query
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "size": self.backend.size(),
+        }
+
+
+CACHES: Dict[str, ReadThroughCache] = {}
+
+
+def read_through_cache(name: str, backend: CacheBackend, ttl: Optional[float] = None) -> ReadThroughCache:
+    CACHES[name] = ReadThroughCache(name, backend, ttl)
+    return CACHES[name]
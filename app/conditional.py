@@ -0,0 +1,70 @@
+"""
+HTTP validators for versioned rows: ETag / Last-Modified on reads,
+304 for matching If-None-Match, 412 for stale If-Match.
+
+The ETag combines the row id and version, so a recreated profile never
+matches an ETag of the one it replaced.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Optional
+
+from fastapi import HTTPException, Response, status
+
+# ETag of a profile that does not exist (used by the /check/ routes)
+ABSENT_ETAG = '"absent"'
+
+
+def make_etag(row_id: int, version: int) -> str:
+    return f'"{row_id}-{version}"'
+
+
+def http_date(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    # SQLite returns naive datetimes; every stored timestamp is UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def etag_matches(header: Optional[str], etag: Optional[str], strong: bool = False) -> bool:
+    """
+    True when a comma-separated If-Match / If-None-Match header lists the
+    ETag or is "*" and the resource exists. If-None-Match uses weak
+    comparison; If-Match passes strong=True, so a W/ validator never matches.
+    """
+    if not header or etag is None:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    if "*" in candidates:
+        return etag != ABSENT_ETAG
+    if strong:
+        return etag in candidates
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def set_validators(response: Response, etag: str, updated_at: Optional[datetime] = None) -> None:
+    response.headers["ETag"] = etag
+    last_modified = http_date(updated_at)
+    if last_modified:
+        response.headers["Last-Modified"] = last_modified
+
+
+def not_modified(etag: str, updated_at: Optional[datetime] = None) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, updated_at)
+    return response
+
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Resource was modified; fetch it again before updating",
+    )
+
+
+def require_match(if_match: Optional[str], etag: str) -> None:
+    """Raise 412 when an If-Match header is present and names another version."""
+    if if_match is not None and not etag_matches(if_match, etag, strong=True):
+        raise precondition_failed()
@@ -1,27 +1,187 @@
+import logging
 import os
+import time
 import bcrypt
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Boolean, CheckConstraint
-from sqlalchemy.orm import sessionmaker, relationship, DeclarativeBase
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from datetime import datetime, timezone
+from sqlalchemy import event, exc, create_engine, Column, Integer, String, Float, ForeignKey, Boolean, CheckConstraint, DateTime, Index, JSON, LargeBinary, UniqueConstraint
+from sqlalchemy.orm import sessionmaker, relationship, DeclarativeBase, Session
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from fastapi.concurrency import run_in_threadpool
+from .metrics import InstrumentedQueuePool, InstrumentedAsyncQueuePool
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # --- DATABASE CONNECTION ---
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# DB_ASYNC=true serves requests from an AsyncSession (asyncpg / aiosqlite);
+# the sync engine stays available for CLI tools
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = "postgresql" if parsed.get_backend_name() in ("postgresql", "postgres") else parsed.get_backend_name()
+    return parsed.set(drivername=ASYNC_DRIVERS.get(backend, parsed.drivername)).render_as_string(hide_password=False)
+
+# --- CONNECTION POOL ---
+# Size pool_size + max_overflow (times workers) against Postgres max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# "always" pings on every checkout, "idle" only connections idle longer
+# than DB_POOL_PRE_PING_IDLE seconds, "never" skips the ping
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "idle").lower()
+DB_POOL_PRE_PING_IDLE = float(os.getenv("DB_POOL_PRE_PING_IDLE", "30"))
+
+def _uses_queue_pool(url: str) -> bool:
+    # In-memory SQLite gets a per-thread pool that takes no sizing options
+    parsed = make_url(url)
+    return not (parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"))
+
+def _mark_checkin(dbapi_connection, connection_record):
+    connection_record.info["checked_in_at"] = time.monotonic()
+
+def _ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+    checked_in_at = connection_record.info.get("checked_in_at")
+    if checked_in_at is None or time.monotonic() - checked_in_at < DB_POOL_PRE_PING_IDLE:
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+    except Exception:
+        # The pool discards this connection and retries with a fresh one
+        raise exc.DisconnectionError()
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+def engine_options(url: str, name: str, is_async: bool = False) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING == "always"}
+    if _uses_queue_pool(url):
+        options.update(
+            poolclass=InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+            pool_logging_name=name,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores FOREIGN KEY clauses unless enabled per connection
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def configure_pool_events(sync_engine) -> None:
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", _enable_sqlite_foreign_keys)
+    if DB_POOL_PRE_PING == "idle":
+        event.listen(sync_engine, "checkin", _mark_checkin)
+        event.listen(sync_engine, "checkout", _ping_if_idle)
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, "primary"))
+configure_pool_events(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = None
+if DB_ASYNC:
+    ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, "primary_async", is_async=True)
+    )
+    configure_pool_events(async_engine.sync_engine)
+# Objects are used after the session's greenlet returns, so never expire them on commit
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if DB_ASYNC else None
+
+# --- READ REPLICA ---
+# Optional replica for pure-read routes (get_read_db); writes and
+# read-after-write flows always use the primary
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+# After a replica connection failure, reads use the primary this long
+READ_REPLICA_RETRY_SECONDS = float(os.getenv("READ_REPLICA_RETRY_SECONDS", "30"))
+
+class ReplicaHealth:
+    def __init__(self):
+        self.failures = 0
+        self.fallbacks = 0
+        self.unhealthy_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def mark_failed(self) -> None:
+        self.failures += 1
+        self.unhealthy_until = time.monotonic() + READ_REPLICA_RETRY_SECONDS
+
+replica_health = ReplicaHealth()
+
+def _replica_error(exception_context):
+    # Disconnects during a request also divert later reads to the primary
+    if exception_context.is_disconnect:
+        replica_health.mark_failed()
+
+read_engine = None
+ReadSessionLocal = None
+if DATABASE_READ_URL:
+    read_engine = create_engine(DATABASE_READ_URL, **engine_options(DATABASE_READ_URL, "replica"))
+    configure_pool_events(read_engine)
+    event.listen(read_engine, "handle_error", _replica_error)
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+async_read_engine = None
+AsyncReadSessionLocal = None
+if DATABASE_READ_URL and DB_ASYNC:
+    ASYNC_DATABASE_READ_URL = async_database_url(DATABASE_READ_URL)
+    async_read_engine = create_async_engine(
+        ASYNC_DATABASE_READ_URL, **engine_options(ASYNC_DATABASE_READ_URL, "replica_async", is_async=True)
+    )
+    configure_pool_events(async_read_engine.sync_engine)
+    event.listen(async_read_engine.sync_engine, "handle_error", _replica_error)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
+# Connections opened at startup so the first requests skip the TCP/TLS/auth handshake
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", "0"))
+
+async def prewarm_pool(count: int = DB_POOL_PREWARM) -> int:
+    """Open `count` connections at once and return them to the pool."""
+    if count <= 0:
+        return 0
+    if async_engine is not None:
+        connections = [await async_engine.connect() for _ in range(count)]
+        for conn in connections:
+            await conn.close()
+    else:
+        connections = [engine.connect() for _ in range(count)]
+        for conn in connections:
+            conn.close()
+    return len(connections)
+
 # --- MODERN DECLARATIVE BASE ---
 class Base(DeclarativeBase):
     pass
 
 # --- PASSWORD SECURITY ---
-def get_password_hash(password: str) -> str:
+# bcrypt cost factor for new hashes; older hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+def get_password_hash(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
     pwd_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds)
     hashed = bcrypt.hashpw(pwd_bytes, salt)
     return hashed.decode('utf-8')
 
@@ -31,16 +191,109 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         hashed_password.encode('utf-8')
     )
 
+def password_hash_rounds(hashed_password: str) -> int:
+    # bcrypt hashes look like $2b$12$<salt+digest>
+    return int(hashed_password.split("$")[2])
+
 # --- DATABASE UTILS ---
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+if DB_ASYNC:
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+else:
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+# Pure-read routes depend on get_read_db: a replica session when one is
+# configured and reachable, otherwise a primary session. The connection is
+# checked out up front so an unreachable replica falls back immediately.
+if DB_ASYNC:
+    async def _open_read_session():
+        if AsyncReadSessionLocal is not None and replica_health.healthy:
+            db = AsyncReadSessionLocal()
+            try:
+                await db.connection()
+                return db
+            except exc.DBAPIError as e:
+                await db.close()
+                replica_health.mark_failed()
+                logger.warning("Read replica unavailable, using primary: %s", e)
+        if AsyncReadSessionLocal is not None:
+            replica_health.fallbacks += 1
+        return AsyncSessionLocal()
+
+    async def get_read_db():
+        db = await _open_read_session()
+        try:
+            yield db
+        finally:
+            await db.close()
+else:
+    def _open_read_session():
+        if ReadSessionLocal is not None and replica_health.healthy:
+            db = ReadSessionLocal()
+            try:
+                db.connection()
+                return db
+            except exc.DBAPIError as e:
+                db.close()
+                replica_health.mark_failed()
+                logger.warning("Read replica unavailable, using primary: %s", e)
+        if ReadSessionLocal is not None:
+            replica_health.fallbacks += 1
+        return SessionLocal()
+
+    def get_read_db():
+        db = _open_read_session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+async def run_db(db, fn, *args, **kwargs):
+    """
+    Run `fn(session, *args)` without blocking the event loop: on the
+    AsyncSession's greenlet in async mode, in the threadpool otherwise.
+    Routes keep plain synchronous ORM code in `fn`.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+def sync_session(db) -> Session:
+    """
+    The synchronous Session behind `db`, for handing a second session to a
+    run_db callback (e.g. the primary next to a replica session).
+    """
+    return db.sync_session if isinstance(db, AsyncSession) else db
+
+def dialect_insert(db: Session, model):
+    """
+    Return an INSERT construct for the session's dialect so callers can use
+    ON CONFLICT upserts on both PostgreSQL and SQLite.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def is_foreign_key_violation(error: exc.IntegrityError) -> bool:
+    """True when the statement referenced a missing parent row."""
+    # psycopg2 exposes pgcode, asyncpg sqlstate; SQLite only has the message
+    code = getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+    if code:
+        return code == "23503"
+    return "FOREIGN KEY" in str(error.orig).upper()
 
 # --- SQLALCHEMY MODELS ---
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class Student(Base):
     __tablename__ = "students"
     id = Column(Integer, primary_key=True, index=True)
@@ -73,10 +326,16 @@ class StudentInfo(Base):
     primary_language = Column(String)
     study_hours = Column(Float)
 
+    # Bumped by every ORM update; backs ETags and If-Match checks
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
     __table_args__ = (
         CheckConstraint('academic_year >= 0 AND academic_year <= 5', name='year_range_check'),
         {'extend_existing': True} # Prevents crash on redefinition
     )
+    # UPDATEs match on the loaded version, so a concurrent write raises StaleDataError
+    __mapper_args__ = {"version_id_col": version}
 
     owner = relationship("Student", back_populates="profile")
 
@@ -86,7 +345,7 @@ class Doctor(Base):
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     contact = Column(String)
-    price_per_hour = Column(Float)
+    price_per_hour = Column(Float, index=True)
 
     profile = relationship("DoctorInfo", back_populates="owner", uselist=False)
 
@@ -99,20 +358,103 @@ class DoctorInfo(Base):
     department = Column(String)
     start_teaching_year = Column(Integer)
 
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        # Directory filters narrow by faculty, then department, then university
+        Index("ix_doctor_info_faculty_department_uni", "faculty", "department", "uni_name"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
     owner = relationship("Doctor", back_populates="profile")
 
 class StdDrRate(Base):
     __tablename__ = "ratings"
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey("students.id"))
-    doctor_id = Column(Integer, ForeignKey("doctors.id"))
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), index=True)
     rating = Column(Integer)
 
+    __table_args__ = (
+        UniqueConstraint('student_id', 'doctor_id', name='uq_rating_student_doctor'),
+        CheckConstraint('rating >= 1 AND rating <= 5', name='rating_range_check'),
+    )
+
+class DoctorRatingSummary(Base):
+    # Maintained in the same transaction as every rating write
+    __tablename__ = "doctor_rating_summary"
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_avg = Column(Float, index=True)  # NULL once every rating is removed
+    stars_1 = Column(Integer, nullable=False, default=0)
+    stars_2 = Column(Integer, nullable=False, default=0)
+    stars_3 = Column(Integer, nullable=False, default=0)
+    stars_4 = Column(Integer, nullable=False, default=0)
+    stars_5 = Column(Integer, nullable=False, default=0)
+
 class StudentGPA(Base):
     __tablename__ = "student_gpa"
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey("students.id"), unique=True)
     predicted_gpa = Column(Float)
+    # SHA-256 of the features the prediction was made from; stale once it
+    # differs from student_features.feature_hash (or is NULL)
+    feature_hash = Column(String(64))
+    # Written by Core upserts, which bump these explicitly
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+class StudentFeatures(Base):
+    # Defaulted model inputs per student, kept current by profile writes (app.features)
+    __tablename__ = "student_features"
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    # build_ml_input output without student_id, ready to send to the model
+    features = Column(JSON, nullable=False)
+    feature_hash = Column(String(64), nullable=False)
+    # features.encode_vector as raw float64s, read in bulk by the local model
+    vector = Column(LargeBinary, nullable=False)
+    # features.FEATURE_VERSION the row was built with; older rows are rebuilt on read
+    version = Column(Integer, nullable=False)
+    # Scoring state for the stale re-scoring sweep: the predict_batch job it
+    # last queued for the student, and a feature_hash the ML service
+    # rejected (4xx), which is not re-queued until the features change
+    rescore_job_id = Column(Integer)
+    rejected_hash = Column(String(64))
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+class PredictionJob(Base):
+    # Background scoring work, drained by app.jobs.JobWorkerPool
+    __tablename__ = "prediction_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # predict | predict_batch | rescore_stale
+    student_id = Column(Integer, index=True)
+    payload = Column(JSON)
+    status = Column(String, nullable=False, default="queued")  # queued | running | succeeded | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    result = Column(JSON)
+    error = Column(String)
+    # Not claimed before this time; pushed back when a job is retried
+    run_after = Column(DateTime(timezone=True), default=utcnow)
+    created_at = Column(DateTime(timezone=True), default=utcnow)
+    # Identifies duplicate requests (kind, student and payload); NULL for jobs that are never deduplicated
+    dedupe_key = Column(String)
+    started_at = Column(DateTime(timezone=True))
+    # Renewed while a worker runs the job; a stale heartbeat means the worker died
+    heartbeat_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        # Workers claim the oldest due queued jobs
+        Index("ix_prediction_jobs_status_run_after", "status", "run_after"),
+        # At most one queued or running job per dedupe key
+        Index(
+            "uq_prediction_jobs_active_dedupe", "dedupe_key", unique=True,
+            postgresql_where=status.in_(("queued", "running")),
+            sqlite_where=status.in_(("queued", "running")),
+        ),
+    )
 
 # --- PYDANTIC SCHEMAS ---
 
@@ -179,21 +521,282 @@ class DoctorInfoUpdate(BaseModel):
     department: Optional[str] = None
     start_teaching_year: Optional[int] = None
 
+class RatingCreate(BaseModel):
+    doctor_id: int
+    rating: int = Field(ge=1, le=5)
+
+class RatingUpdate(BaseModel):
+    rating: int = Field(ge=1, le=5)
+
+# Upper bound on ids per batch lookup request
+MAX_BATCH_IDS = int(os.getenv("MAX_BATCH_IDS", "200"))
+
+class IdBatchRequest(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_IDS)
+
 class LoginRequest(BaseModel):
     username: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class StudentGPACreate(BaseModel):
     student_id: int
     predicted_gpa: float
 
 class StudentGPAResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     student_id: int
     predicted_gpa: float
-    
-    class Config:
-        from_attributes = True  # For Pydantic v2, use orm_mode = True for Pydantic v1
+    version: int
+    updated_at: Optional[datetime] = None
 
 class StudentGPAUpdate(BaseModel):
-    predicted_gpa: float
\ No newline at end of file
+    predicted_gpa: float
+
+class GPABatchRequest(BaseModel):
+    # Either an explicit list of ids or at least one filter must be given
+    student_ids: Optional[List[int]] = None
+    uni_name: Optional[str] = None
+    faculty: Optional[str] = None
+    department: Optional[str] = None
+    major: Optional[str] = None
+
+# --- RESPONSE SCHEMAS ---
+# Every route declares one, so responses are serialized by pydantic-core
+# straight from selected columns instead of walking ORM instance state
+
+class MessageResponse(BaseModel):
+    message: str
+
+class RegisterResponse(BaseModel):
+    message: str
+    id: int
+
+class TokenResponse(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str
+    expires_in: int
+
+class StudentLoginResponse(TokenResponse):
+    message: str
+    username: str
+    id: int
+
+class DoctorLoginResponse(TokenResponse):
+    message: str
+    doctor_id: int
+    username: str
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReportResponse(BaseModel):
+    rows: int
+    created: int
+    profiles_created: int
+    failed: int
+    errors: List[ImportRowError]
+    # Failed rows beyond IMPORT_MAX_REPORTED_ERRORS, counted but not listed
+    errors_omitted: int
+
+class StudentInfoResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    student_id: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    uni_name: Optional[str] = None
+    faculty: Optional[str] = None
+    department: Optional[str] = None
+    major: Optional[str] = None
+    dob: Optional[str] = None
+    academic_year: Optional[int] = None
+    disability: Optional[bool] = None
+    athletic_status: Optional[str] = None
+    country_of_origin: Optional[str] = None
+    country_of_residence: Optional[str] = None
+    gender: Optional[str] = None
+    primary_language: Optional[str] = None
+    study_hours: Optional[float] = None
+    version: int
+    updated_at: Optional[datetime] = None
+
+class StudentInfoEnvelope(BaseModel):
+    message: str
+    data: StudentInfoResponse
+
+class StudentProfileCheck(BaseModel):
+    exists: bool
+    student_id: int
+    profile_id: Optional[int] = None
+
+class StudentInfoBatchResponse(BaseModel):
+    profiles: List[StudentInfoResponse]
+    missing: List[int]
+
+class DoctorInfoResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    doctor_id: int
+    uni_name: Optional[str] = None
+    faculty: Optional[str] = None
+    department: Optional[str] = None
+    start_teaching_year: Optional[int] = None
+    version: int
+    updated_at: Optional[datetime] = None
+
+class DoctorInfoEnvelope(BaseModel):
+    message: str
+    data: DoctorInfoResponse
+
+class DoctorProfileCheck(BaseModel):
+    exists: bool
+    doctor_id: int
+    profile_id: Optional[int] = None
+
+class DoctorOwner(BaseModel):
+    id: int
+    username: Optional[str] = None
+    contact: Optional[str] = None
+    price_per_hour: Optional[float] = None
+
+class DoctorDirectoryEntry(DoctorInfoResponse):
+    owner: Optional[DoctorOwner] = None
+
+class DoctorInfoBatchResponse(BaseModel):
+    profiles: List[DoctorDirectoryEntry]
+    missing: List[int]
+
+class DoctorSearchResult(DoctorDirectoryEntry):
+    score: float
+
+class RecommendedDoctor(DoctorDirectoryEntry):
+    score: float
+
+class RatingResponse(BaseModel):
+    message: str
+    doctor_id: int
+    rating: int
+
+class RatingDeleteResponse(BaseModel):
+    message: str
+    doctor_id: int
+
+class RatingSummaryResponse(BaseModel):
+    doctor_id: int
+    count: int
+    average: Optional[float] = None
+    histogram: Dict[str, int]
+
+class TopRatedDoctor(BaseModel):
+    doctor_id: int
+    average: Optional[float] = None
+    count: int
+    department: Optional[str] = None
+    uni_name: Optional[str] = None
+
+class GPAPrediction(BaseModel):
+    # Extra fields from the ML service are passed through unchanged
+    model_config = ConfigDict(extra="allow")
+
+    predicted_gpa: float
+
+class GPABatchResult(BaseModel):
+    student_id: int
+    predicted_gpa: float
+    cached: bool
+
+class GPABatchFailure(BaseModel):
+    student_id: int
+    error: str
+
+class GPABatchResponse(BaseModel):
+    requested: int
+    succeeded: int
+    failed: int
+    results: List[GPABatchResult]
+    failures: List[GPABatchFailure]
+
+class JobAccepted(BaseModel):
+    job_id: int
+    status: str
+    status_url: str
+
+class JobStatus(BaseModel):
+    id: int
+    kind: str
+    student_id: Optional[int] = None
+    status: str
+    attempts: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    run_after: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class PredictionCacheStats(BaseModel):
+    lru_hits: int
+    db_hits: int
+    misses: int
+    hit_rate: float
+    lru_size: int
+    lru_maxsize: int
+
+class CacheStats(BaseModel):
+    cache: str
+    hits: int
+    misses: int
+    coalesced: int
+    invalidations: int
+    hit_rate: float
+    size: Optional[int] = None
+
+class OverloadGroupStats(BaseModel):
+    group: str
+    limit: int
+    max_queue: int
+    active: int
+    waiting: int
+    admitted: int
+    rejected_queue_full: int
+    rejected_queue_timeout: int
+    queue_seconds: "HistogramSnapshot"
+
+class OverloadStats(BaseModel):
+    groups: List[OverloadGroupStats]
+    login_rate_limited: int
+
+class HistogramSnapshot(BaseModel):
+    count: int
+    sum: float
+    p50: float
+    p95: float
+    p99: float
+
+class PoolStats(BaseModel):
+    engine: str
+    checkouts: int
+    timeouts: int
+    checkout_wait_seconds: HistogramSnapshot
+    pool_size: Optional[int] = None
+    checked_out: Optional[int] = None
+    checked_in: Optional[int] = None
+    overflow: Optional[int] = None
+    max_overflow: Optional[int] = None
+
+OverloadGroupStats.model_rebuild()
+
+class StartupStats(BaseModel):
+    schema_version: Optional[int] = None
+    prewarmed_connections: Optional[int] = None
+    lifespan_seconds: Optional[float] = None
+    startup_seconds: Optional[float] = None
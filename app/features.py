@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+from datetime import date
+from typing import Dict, Iterable, NamedTuple, Sequence
+
+import numpy as np
+from sqlalchemy import JSON, DateTime, Integer, LargeBinary, String, and_, cast, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .database import StudentFeatures, StudentInfo, dialect_insert, utcnow
+
+# StudentInfo columns that feed the GPA model; changing any of them
+# invalidates the stored prediction
+FEATURE_FIELDS = (
+    "uni_name",
+    "major",
+    "disability",
+    "dob",
+    "academic_year",
+    "study_hours",
+    "athletic_status",
+    "country_of_origin",
+    "country_of_residence",
+    "primary_language",
+    "gender",
+)
+
+# Bump when FEATURE_FIELDS, VECTOR_FIELDS or the defaults in build_ml_input
+# change; stored feature rows from an older version are rebuilt on their next read
+FEATURE_VERSION = 1
+
+# Numeric model inputs in stored vector order (float64, NaN when unparsable);
+# dob is encoded as its proleptic Gregorian ordinal day
+VECTOR_FIELDS = ("dob", "academic_year", "study_hours", "disability", "dropout")
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))
+
+# student_id -> (feature_hash, prediction)
+prediction_cache = TTLCache(maxsize=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL)
+
+# Hit/miss counters for predict_student_gpa lookups
+prediction_cache_counters = {"lru_hits": 0, "db_hits": 0, "misses": 0}
+
+
+def build_ml_input(student: StudentInfo) -> dict:
+    """
+    Build the ML container payload for a student, with defaults for missing values.
+    """
+    return {
+        "student_id": student.student_id,  # For tracking only, not a feature
+        "uni_name": student.uni_name or "Unknown",
+        "major": student.major or "Unknown",
+        "disability": student.disability if student.disability is not None else False,
+        "dob": student.dob or "2000-01-01",
+        "academic_year": student.academic_year if student.academic_year is not None else 1,
+        "study_hours": student.study_hours if student.study_hours is not None else 0.0,
+        "athletic_status": student.athletic_status or "Inactive",
+        "country_of_origin": student.country_of_origin or "Unknown",
+        "country_of_residence": student.country_of_residence or "Unknown",
+        "primary_language": student.primary_language or "Unknown",
+        "gender": student.gender or "Unknown",
+        "dropout": False  # Default to False (student is not a dropout)
+    }
+
+
+def feature_hash(ml_input: dict) -> str:
+    """
+    Stable SHA-256 of the model features (tracking fields excluded).
+    """
+    features = {key: value for key, value in ml_input.items() if key != "student_id"}
+    encoded = json.dumps(features, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _ordinal(value) -> float:
+    try:
+        return float(date.fromisoformat(str(value)).toordinal())
+    except ValueError:
+        return np.nan
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def encode_vector(ml_input: dict) -> np.ndarray:
+    """The numeric inputs of one build_ml_input payload, in VECTOR_FIELDS order."""
+    return np.array(
+        [_ordinal(ml_input.get("dob"))] + [_number(ml_input.get(name)) for name in VECTOR_FIELDS[1:]],
+        dtype=np.float64,
+    )
+
+
+def encode_vectors(ml_inputs: Sequence[dict]) -> np.ndarray:
+    """One encode_vector row per payload, for inputs that were not stored."""
+    if not ml_inputs:
+        return np.zeros((0, len(VECTOR_FIELDS)))
+    return np.vstack([encode_vector(ml_input) for ml_input in ml_inputs])
+
+
+class StoredFeatures(NamedTuple):
+    ml_input: dict
+    feature_hash: str
+    vector: np.ndarray
+
+
+def feature_row(student) -> dict:
+    """student_features row for a StudentInfo instance or column row."""
+    ml_input = build_ml_input(student)
+    return {
+        "student_id": student.student_id,
+        "features": {key: value for key, value in ml_input.items() if key != "student_id"},
+        "feature_hash": feature_hash(ml_input),
+        "vector": encode_vector(ml_input).tobytes(),
+        "version": FEATURE_VERSION,
+    }
+
+
+def _upsert_features(stmt, replace_current: bool = True):
+    return stmt.on_conflict_do_update(
+        index_elements=[StudentFeatures.student_id],
+        set_={
+            "features": stmt.excluded.features,
+            "feature_hash": stmt.excluded.feature_hash,
+            "vector": stmt.excluded.vector,
+            "version": stmt.excluded.version,
+            # ON CONFLICT updates skip column onupdate hooks
+            "updated_at": utcnow(),
+        },
+        where=None if replace_current else StudentFeatures.version < FEATURE_VERSION,
+    )
+
+
+def store_features(db: Session, students: Iterable, replace_current: bool = True) -> None:
+    """
+    Upsert the feature rows of these profiles with one statement; the
+    caller commits, so they land in the profile write's transaction.
+    Without `replace_current`, only missing or outdated rows are written.
+    """
+    rows = [feature_row(student) for student in students]
+    if rows:
+        db.execute(_upsert_features(dialect_insert(db, StudentFeatures), replace_current), rows)
+
+
+def insert_profile(db: Session, profile_insert, values: dict):
+    """
+    Run a students_info INSERT ... RETURNING built from `values` and store
+    the new profile's feature row; returns the RETURNING row (None when
+    nothing was inserted). On PostgreSQL both writes are one statement (a
+    data-modifying CTE); elsewhere the feature upsert follows in the same
+    transaction.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        created = db.execute(profile_insert).first()
+        if created is not None:
+            store_features(db, [created])
+        return created
+
+    row = feature_row(StudentInfo(**values))
+    created = profile_insert.cte("created")
+    features = _upsert_features(pg_insert(StudentFeatures).from_select(
+        ["student_id", "features", "feature_hash", "vector", "version", "updated_at"],
+        # Typed casts, since the SELECT list gives the parameters no column type
+        select(
+            created.c.student_id,
+            cast(literal(row["features"], JSON), JSON),
+            cast(literal(row["feature_hash"]), String),
+            cast(literal(row["vector"], LargeBinary), LargeBinary),
+            cast(literal(row["version"]), Integer),
+            cast(literal(utcnow(), DateTime(timezone=True)), DateTime(timezone=True)),
+        ),
+    )).cte("features")
+    return db.execute(select(created).add_cte(features)).first()
+
+
+def load_features(db: Session, *criteria) -> Dict[int, StoredFeatures]:
+    """
+    Stored inputs of every student matching `criteria` (filters on
+    StudentInfo), by student id in id order. Reads the stored rows in one
+    query; profiles without a current row are built from StudentInfo once
+    and stored.
+    """
+    rows = db.query(
+        StudentInfo.student_id, StudentFeatures.features, StudentFeatures.feature_hash, StudentFeatures.vector,
+    ).outerjoin(
+        StudentFeatures,
+        and_(StudentFeatures.student_id == StudentInfo.student_id, StudentFeatures.version == FEATURE_VERSION),
+    ).filter(*criteria).order_by(StudentInfo.student_id).all()
+
+    loaded = {}
+    missing = []
+    for row in rows:
+        if row.features is None:
+            missing.append(row.student_id)
+            loaded[row.student_id] = None
+        else:
+            loaded[row.student_id] = StoredFeatures(
+                {"student_id": row.student_id, **row.features},
+                row.feature_hash,
+                np.frombuffer(row.vector, dtype=np.float64),
+            )
+    if missing:
+        profiles = db.query(*StudentInfo.__table__.c).filter(StudentInfo.student_id.in_(missing)).all()
+        # A profile write racing this backfill keeps its own, newer row
+        store_features(db, profiles, replace_current=False)
+        db.commit()
+        for profile in profiles:
+            ml_input = build_ml_input(profile)
+            loaded[profile.student_id] = StoredFeatures(ml_input, feature_hash(ml_input), encode_vector(ml_input))
+    return {student_id: entry for student_id, entry in loaded.items() if entry is not None}
+
+
+def cached_prediction(student_id: int, features_hash: str):
+    """Return the in-process prediction if it was made from the same features."""
+    entry = prediction_cache.get(student_id)
+    if entry is not None and entry[0] == features_hash:
+        prediction_cache_counters["lru_hits"] += 1
+        return entry[1]
+    return None
+
+
+def remember_prediction(student_id: int, features_hash: str, prediction: dict) -> None:
+    prediction_cache.set(student_id, (features_hash, prediction))
+
+
+def record_lookup(hit: bool) -> None:
+    """Count the outcome of a lookup that missed the in-process cache."""
+    prediction_cache_counters["db_hits" if hit else "misses"] += 1
+
+
+def changes_features(db_info: StudentInfo, update_data: dict) -> bool:
+    """True if applying `update_data` would change any model feature."""
+    return any(
+        key in FEATURE_FIELDS and getattr(db_info, key) != value
+        for key, value in update_data.items()
+    )
+
+
+def invalidate_prediction(student_id: int) -> None:
+    prediction_cache.delete(student_id)
+
+
+def prediction_cache_stats() -> dict:
+    counters = dict(prediction_cache_counters)
+    lookups = sum(counters.values())
+    hits = counters["lru_hits"] + counters["db_hits"]
+    return {
+        **counters,
+        "hit_rate": hits / lookups if lookups else 0.0,
+        "lru_size": len(prediction_cache),
+        "lru_maxsize": prediction_cache.maxsize,
+    }
@@ -0,0 +1,86 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from .database import BCRYPT_ROUNDS, get_password_hash, verify_password, password_hash_rounds
+
+# --- BCRYPT WORKER POOL CONFIG ---
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(os.cpu_count() or 1)))
+# Hash jobs allowed to run or wait before new ones are rejected
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", str(HASH_POOL_WORKERS * 8)))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "1"))
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the bcrypt pool queue is full."""
+
+    def __init__(self, retry_after: int = HASH_RETRY_AFTER):
+        super().__init__("Password hashing capacity exhausted")
+        self.retry_after = retry_after
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending = 0
+_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Return the bcrypt process pool. Workers are spawned rather than forked
+    so they never inherit locks held by the server's threads.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=HASH_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def shutdown_pool() -> None:
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def _run(fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= HASH_QUEUE_LIMIT:
+            raise PasswordHasherBusy()
+        _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), fn, *args)
+    finally:
+        with _lock:
+            _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(get_password_hash, password, BCRYPT_ROUNDS)
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run(verify_password, plain_password, hashed_password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    return password_hash_rounds(hashed_password) != BCRYPT_ROUNDS
+
+
+
+def hash_passwords(passwords: list) -> list:
+    """
+    Hash many passwords in parallel for bulk jobs. Blocks the calling thread
+    and bypasses the request admission limit.
+    """
+    rounds = [BCRYPT_ROUNDS] * len(passwords)
+    return list(get_executor().map(get_password_hash, passwords, rounds, chunksize=16))
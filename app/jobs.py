@@ -0,0 +1,348 @@
+"""
+Persistent background jobs for GPA scoring.
+
+Jobs are rows in `prediction_jobs`, so queued work survives restarts and
+is shared by every worker process. Each process runs a JobWorkerPool of
+JOB_WORKERS tasks that claim due jobs (FOR UPDATE SKIP LOCKED on
+PostgreSQL), run the handler registered for the job's kind and record
+the result. Failed attempts are retried with exponential backoff up to
+JOB_MAX_ATTEMPTS. A running job's worker renews its lease every third of
+JOB_LEASE_SECONDS; a job whose lease lapses (its worker died) is requeued,
+and the late worker's outcome is discarded. A job can therefore run more
+than once, so handlers must be idempotent - the scoring handlers upsert.
+
+Kinds (handlers live in app.routes.ml_predictions):
+  * predict        - score one student, as POST /ml/predict-gpa/{id}
+  * predict_batch  - score a list of students, as POST /ml/predict-gpa/batch
+  * rescore_stale  - walk every profile and queue predict_batch jobs for
+                     students whose features changed since their stored
+                     prediction and who have no pending job; enqueued
+                     every JOB_RESCORE_INTERVAL_SECONDS
+"""
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .database import DB_ASYNC, AsyncSessionLocal, PredictionJob, SessionLocal, dialect_insert, run_db, utcnow
+
+logger = logging.getLogger(__name__)
+
+# Concurrent jobs per process; 0 leaves the queue to other processes
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Idle workers check for due jobs this often (enqueues in-process wake them at once)
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# First retry delay, doubled on each further attempt
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "5"))
+# A running job whose heartbeat is older than this is assumed orphaned and requeued
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+# 0 disables the scheduled stale re-scoring
+JOB_RESCORE_INTERVAL_SECONDS = float(os.getenv("JOB_RESCORE_INTERVAL_SECONDS", "3600"))
+# Profiles fetched per round trip while walking StudentInfo
+JOB_RESCORE_CHUNK_SIZE = int(os.getenv("JOB_RESCORE_CHUNK_SIZE", "1000"))
+
+ACTIVE_STATUSES = ("queued", "running")
+# Predicate of uq_prediction_jobs_active_dedupe, as literal SQL so PostgreSQL can infer the index
+_ACTIVE_PREDICATE = text("status IN ('queued', 'running')")
+
+job_counters = {"enqueued": 0, "succeeded": 0, "failed": 0, "retried": 0}
+
+Handler = Callable[[Session, object], Awaitable[Optional[dict]]]
+JOB_HANDLERS: Dict[str, Handler] = {}
+
+
+def job_handler(kind: str):
+    """Register `async fn(db, job) -> result dict` as the handler for `kind`."""
+    def register(fn: Handler) -> Handler:
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+class RetryJob(Exception):
+    """Raised by handlers for transient failures; the job runs again later."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobFailed(Exception):
+    """Raised by handlers for permanent failures; the job is not retried."""
+
+
+def _dedupe_key(kind: str, student_id: Optional[int], payload: dict) -> str:
+    return f"{kind}:{'' if student_id is None else student_id}:{json.dumps(payload, sort_keys=True)}"
+
+
+def enqueue_job(
+    db: Session,
+    kind: str,
+    student_id: Optional[int] = None,
+    payload: Optional[dict] = None,
+    dedupe: bool = False,
+) -> PredictionJob:
+    """
+    Queue a job and commit. With `dedupe`, an already queued or running job
+    of the same kind for the same student and payload is returned instead.
+    """
+    payload = payload or {}
+    if not dedupe:
+        job = PredictionJob(kind=kind, student_id=student_id, payload=payload, status="queued")
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        job_counters["enqueued"] += 1
+        return job
+    key = _dedupe_key(kind, student_id, payload)
+    active = PredictionJob.status.in_(ACTIVE_STATUSES)
+    while True:
+        # The partial unique index makes concurrent duplicates conflict instead of racing a lookup
+        stmt = dialect_insert(db, PredictionJob).values(
+            kind=kind, student_id=student_id, payload=payload, status="queued", dedupe_key=key,
+        )
+        stmt = stmt.on_conflict_do_nothing(index_elements=[PredictionJob.dedupe_key], index_where=_ACTIVE_PREDICATE)
+        job_id = db.execute(stmt.returning(PredictionJob.id)).scalar()
+        db.commit()
+        if job_id is not None:
+            job_counters["enqueued"] += 1
+            return get_job(db, job_id)
+        existing = db.query(PredictionJob).filter(PredictionJob.dedupe_key == key, active).first()
+        if existing is not None:
+            return existing
+        # The conflicting job finished in between; insert again
+
+
+def insert_jobs(db: Session, kind: str, payloads: list) -> list:
+    """Add many student-less jobs with one INSERT and return their ids; the caller commits and counts them."""
+    if not payloads:
+        return []
+    now = utcnow()
+    return db.execute(PredictionJob.__table__.insert().returning(PredictionJob.id), [
+        {"kind": kind, "payload": payload, "status": "queued", "attempts": 0, "run_after": now, "created_at": now}
+        for payload in payloads
+    ]).scalars().all()
+
+
+def _claim(db: Session, limit: int) -> list:
+    """Mark up to `limit` due jobs running and return them, oldest first."""
+    now = utcnow()
+    # Requeue jobs whose worker died mid-run
+    db.execute(
+        update(PredictionJob)
+        .where(PredictionJob.status == "running", PredictionJob.heartbeat_at < now - timedelta(seconds=JOB_LEASE_SECONDS))
+        .values(status="queued")
+    )
+    due = db.execute(
+        select(PredictionJob.id)
+        .where(PredictionJob.status == "queued", PredictionJob.run_after <= now)
+        .order_by(PredictionJob.run_after, PredictionJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not due:
+        db.commit()
+        return []
+    # The status check keeps two processes from claiming the same row where SKIP LOCKED is unavailable
+    claimed = db.execute(
+        update(PredictionJob)
+        .where(PredictionJob.id.in_(due), PredictionJob.status == "queued")
+        .values(status="running", started_at=now, heartbeat_at=now, attempts=PredictionJob.attempts + 1)
+        .returning(PredictionJob.id, PredictionJob.kind, PredictionJob.student_id, PredictionJob.payload, PredictionJob.attempts)
+    ).all()
+    db.commit()
+    return sorted(claimed, key=lambda job: due.index(job.id))
+
+
+def _owned(job):
+    # Still this attempt's job: not requeued and reclaimed after its lease lapsed
+    return PredictionJob.id == job.id, PredictionJob.status == "running", PredictionJob.attempts == job.attempts
+
+
+def _heartbeat(db: Session, job) -> bool:
+    renewed = db.execute(update(PredictionJob).where(*_owned(job)).values(heartbeat_at=utcnow())).rowcount
+    db.commit()
+    return bool(renewed)
+
+
+def _finish(db: Session, job, **values) -> None:
+    db.execute(update(PredictionJob).where(*_owned(job)).values(finished_at=utcnow(), **values))
+    db.commit()
+
+
+def _retry(db: Session, job, error: str, delay: float) -> None:
+    db.execute(update(PredictionJob).where(*_owned(job)).values(
+        status="queued", error=error, run_after=utcnow() + timedelta(seconds=delay),
+    ))
+    db.commit()
+
+
+def get_job(db: Session, job_id: int) -> Optional[PredictionJob]:
+    return db.query(PredictionJob).filter(PredictionJob.id == job_id).first()
+
+
+def _default_session_factory():
+    return AsyncSessionLocal() if DB_ASYNC else SessionLocal()
+
+
+class JobWorkerPool:
+    """
+    Up to `concurrency` jobs at a time in this process. Each job runs in
+    its own session, so a slow job never holds another job's connection.
+    """
+
+    def __init__(self, session_factory=_default_session_factory, concurrency: int = JOB_WORKERS):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self._wake = asyncio.Event()
+        self._tasks: list = []
+
+    @asynccontextmanager
+    async def _session(self):
+        db = self.session_factory()
+        try:
+            yield db
+        finally:
+            if isinstance(db, AsyncSession):
+                await db.close()
+            else:
+                db.close()
+
+    async def _keep_alive(self, job) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                async with self._session() as db:
+                    if not await run_db(db, _heartbeat, job):
+                        logger.warning("Job %s (%s) lost its lease", job.id, job.kind)
+                        return
+            except Exception:
+                logger.exception("Could not renew the lease of job %s", job.id)
+
+    async def _run(self, job) -> None:
+        keep_alive = asyncio.create_task(self._keep_alive(job))
+        try:
+            await self._execute(job)
+        finally:
+            keep_alive.cancel()
+
+    async def _execute(self, job) -> None:
+        handler = JOB_HANDLERS.get(job.kind)
+        async with self._session() as db:
+            try:
+                if handler is None:
+                    raise JobFailed(f"No handler for job kind {job.kind!r}")
+                result = await handler(db, job)
+            except JobFailed as e:
+                await run_db(db, _finish, job, status="failed", error=str(e))
+                job_counters["failed"] += 1
+            except Exception as e:
+                # RetryJob and unexpected errors (lost connections, bugs) alike
+                error = str(e) or type(e).__name__
+                if job.attempts >= JOB_MAX_ATTEMPTS:
+                    logger.warning("Job %s (%s) failed after %s attempts: %s", job.id, job.kind, job.attempts, error)
+                    await run_db(db, _finish, job, status="failed", error=error)
+                    job_counters["failed"] += 1
+                    return
+                if not isinstance(e, RetryJob):
+                    logger.exception("Job %s (%s) raised", job.id, job.kind)
+                backoff = JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+                delay = max(backoff, getattr(e, "retry_after", None) or 0)
+                await run_db(db, _retry, job, error, delay)
+                job_counters["retried"] += 1
+            else:
+                await run_db(db, _finish, job, status="succeeded", result=result, error=None)
+                job_counters["succeeded"] += 1
+
+    async def _run_next(self) -> bool:
+        async with self._session() as db:
+            claimed = await run_db(db, _claim, 1)
+        if not claimed:
+            return False
+        await self._run(claimed[0])
+        return True
+
+    async def run_once(self) -> int:
+        """Claim and run up to `concurrency` due jobs; returns how many ran."""
+        async with self._session() as db:
+            claimed = await run_db(db, _claim, max(self.concurrency, 1))
+        await asyncio.gather(*(self._run(job) for job in claimed))
+        return len(claimed)
+
+    async def drain(self) -> int:
+        """Run due jobs, including ones they enqueue, until none are left."""
+        total = 0
+        while ran := await self.run_once():
+            total += ran
+        return total
+
+    def notify(self) -> None:
+        """Wake idle workers, e.g. right after an enqueue."""
+        self._wake.set()
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                if await self._run_next():
+                    continue
+            except Exception:
+                logger.exception("Job worker could not claim jobs")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _scheduler(self) -> None:
+        while True:
+            await asyncio.sleep(JOB_RESCORE_INTERVAL_SECONDS)
+            try:
+                async with self._session() as db:
+                    await run_db(db, enqueue_job, "rescore_stale", dedupe=True)
+                self.notify()
+            except Exception:
+                logger.exception("Could not schedule stale re-scoring")
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        if JOB_RESCORE_INTERVAL_SECONDS > 0:
+            self._tasks.append(asyncio.create_task(self._scheduler()))
+
+    async def stop(self) -> None:
+        # Interrupted jobs stop renewing their lease and are requeued once it lapses
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+job_pool: Optional[JobWorkerPool] = None
+
+
+def start_job_workers() -> Optional[JobWorkerPool]:
+    global job_pool
+    if JOB_WORKERS <= 0:
+        return None
+    job_pool = JobWorkerPool()
+    job_pool.start()
+    return job_pool
+
+
+async def stop_job_workers() -> None:
+    global job_pool
+    if job_pool is not None:
+        await job_pool.stop()
+        job_pool = None
+
+
+def notify_job_workers() -> None:
+    if job_pool is not None:
+        job_pool.notify()
@@ -0,0 +1,166 @@
+"""
+In-process GPA model.
+
+Loads a linear model artifact (JSON, see LinearGPAModel) from
+ML_MODEL_PATH at startup and scores many students with one vectorized
+NumPy pass over the same inputs build_ml_input sends to the container,
+taking the numeric ones from the vectors kept in student_features.
+
+It is used
+  * as a fallback when the ML container is unavailable (circuit open or
+    retries exhausted), if ML_LOCAL_FALLBACK is on. Fallback predictions
+    are returned but not stored, so the container re-scores them later;
+  * as the batch scoring engine when ML_BATCH_ENGINE=local.
+
+The artifact is exported by the training pipeline alongside the container
+image; test/fixtures/gpa_model.json is a small example of the format.
+"""
+import json
+import logging
+import os
+from datetime import date
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from .features import VECTOR_FIELDS, encode_vectors
+
+logger = logging.getLogger(__name__)
+
+ML_MODEL_PATH = os.getenv("ML_MODEL_PATH")
+ML_LOCAL_FALLBACK = os.getenv("ML_LOCAL_FALLBACK", "true").lower() == "true"
+# "container" or "local"
+ML_BATCH_ENGINE = os.getenv("ML_BATCH_ENGINE", "container").lower()
+
+MODEL_FORMAT = "linear-v1"
+# Numeric inputs besides the derived age; booleans count as 0/1
+NUMERIC_INPUTS = tuple(name for name in VECTOR_FIELDS if name != "dob")
+
+local_model_counters = {"local_predictions": 0, "fallbacks": 0}
+
+
+class ModelArtifactError(ValueError):
+    """Raised when a model artifact cannot be used."""
+
+
+class LinearGPAModel:
+    """
+    predicted_gpa = intercept
+                  + sum(weight * (value - mean) / scale)   for numeric inputs
+                  + weights[category]                       for categorical inputs
+    clipped to `clip`. Missing numeric values score as the mean; unseen
+    categories use the column's "default" weight. Age is derived from
+    `dob` as of `age_reference_date` (today when absent).
+
+    Artifact:
+        {"format": "linear-v1", "version": "...", "intercept": 2.0, "clip": [0, 4],
+         "numeric": {"age": {"mean": 20, "scale": 2, "weight": 0.1}, ...},
+         "categorical": {"gender": {"weights": {"Female": 0.05}, "default": 0}, ...}}
+    """
+
+    def __init__(self, artifact: dict):
+        if artifact.get("format") != MODEL_FORMAT:
+            raise ModelArtifactError(f"Unsupported model format {artifact.get('format')!r}, expected {MODEL_FORMAT!r}")
+        try:
+            self.version = str(artifact.get("version", "unknown"))
+            self.intercept = float(artifact["intercept"])
+            self.clip = tuple(float(bound) for bound in artifact.get("clip", (0.0, 4.0)))
+            reference = artifact.get("age_reference_date")
+            self.age_reference = date.fromisoformat(reference) if reference else None
+
+            numeric = artifact.get("numeric", {})
+            unknown = set(numeric) - {"age", *NUMERIC_INPUTS}
+            if unknown:
+                raise ModelArtifactError(f"Unknown numeric inputs: {sorted(unknown)}")
+            self.numeric_names = tuple(numeric)
+            self.means = np.array([float(numeric[name]["mean"]) for name in self.numeric_names])
+            self.scales = np.array([float(numeric[name].get("scale", 1.0)) or 1.0 for name in self.numeric_names])
+            self.numeric_weights = np.array([float(numeric[name]["weight"]) for name in self.numeric_names])
+
+            # Per column: category -> index, with the default weight in the last slot
+            self.categorical = {}
+            for name, spec in artifact.get("categorical", {}).items():
+                categories = list(spec["weights"])
+                weights = [float(spec["weights"][category]) for category in categories]
+                weights.append(float(spec.get("default", 0.0)))
+                self.categorical[name] = ({category: i for i, category in enumerate(categories)}, np.array(weights))
+        except ModelArtifactError:
+            raise
+        except (KeyError, TypeError, ValueError) as e:
+            raise ModelArtifactError(f"Invalid model artifact: {e}") from e
+
+    @classmethod
+    def load(cls, path: str) -> "LinearGPAModel":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def encode(self, ml_inputs: Sequence[dict], vectors: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Standardized numeric inputs, one row per student (NaN -> 0, the mean).
+        `vectors` are the stored features.encode_vector rows of the same
+        students; without them the payloads are encoded here.
+        """
+        if vectors is None:
+            vectors = encode_vectors(ml_inputs)
+        reference = (self.age_reference or date.today()).toordinal()
+        columns = []
+        for name in self.numeric_names:
+            if name == "age":
+                columns.append((reference - vectors[:, VECTOR_FIELDS.index("dob")]) / 365.25)
+            else:
+                columns.append(vectors[:, VECTOR_FIELDS.index(name)])
+        matrix = np.column_stack(columns) if columns else np.zeros((len(ml_inputs), 0))
+        return np.nan_to_num((matrix - self.means) / self.scales, nan=0.0)
+
+    def predict(self, ml_inputs: Sequence[dict], vectors: Optional[np.ndarray] = None) -> np.ndarray:
+        """Predicted GPAs for many students in one pass."""
+        scores = np.full(len(ml_inputs), self.intercept)
+        if self.numeric_names:
+            scores += self.encode(ml_inputs, vectors) @ self.numeric_weights
+        for name, (index, weights) in self.categorical.items():
+            codes = np.fromiter(
+                (index.get(str(ml_input.get(name)), -1) for ml_input in ml_inputs),
+                dtype=np.intp, count=len(ml_inputs),
+            )
+            scores += weights[codes]
+        return np.clip(scores, *self.clip)
+
+    def predictions(self, ml_inputs: Sequence[dict], vectors: Optional[np.ndarray] = None) -> List[dict]:
+        """Container-shaped responses, tagged with the engine that made them."""
+        local_model_counters["local_predictions"] += len(ml_inputs)
+        return [
+            {"predicted_gpa": round(float(gpa), 4), "engine": "local", "model_version": self.version}
+            for gpa in self.predict(ml_inputs, vectors)
+        ]
+
+
+_model: Optional[LinearGPAModel] = None
+
+
+def load_local_model(path: Optional[str] = ML_MODEL_PATH) -> Optional[LinearGPAModel]:
+    """Load the artifact once per worker; a broken artifact is logged, not fatal."""
+    global _model
+    if not path:
+        return None
+    try:
+        _model = LinearGPAModel.load(path)
+    except (OSError, ValueError) as e:
+        logger.error("Could not load GPA model from %s: %s", path, e)
+        _model = None
+    else:
+        logger.info("Loaded GPA model %s from %s", _model.version, path)
+    return _model
+
+
+def get_local_model() -> Optional[LinearGPAModel]:
+    return _model
+
+
+def fallback_model() -> Optional[LinearGPAModel]:
+    """The model to answer with when the container is unavailable, if any."""
+    return _model if ML_LOCAL_FALLBACK else None
+
+
+def batch_model() -> Optional[LinearGPAModel]:
+    """The model that scores batches instead of the container, if configured."""
+    return _model if ML_BATCH_ENGINE == "local" else None
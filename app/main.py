@@ -1,19 +1,74 @@
-from fastapi import FastAPI
+import logging
+import os
+import time
+import anyio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 #from database import engine, Base
 #from routes import doctors, students, ratings ,studentInfo,doctorInfo,ml_predictions
 from fastapi.middleware.cors import CORSMiddleware
 
 # To this:
-from app.database import engine, Base
-from app.routes import doctors, students, ratings, studentInfo, doctorInfo, ml_predictions
+from app.database import engine, async_engine, async_read_engine, prewarm_pool
+from app.migrations import check_schema
+from app.metrics import STARTUP, RequestMetricsMiddleware
+from app.overload import OverloadMiddleware
+from app.logging_config import configure_logging
+from app.routes import doctors, students, ratings, studentInfo, doctorInfo, ml_predictions, auth, metrics
+from app.ml_client import get_ml_client, close_ml_client
+from app.local_model import load_local_model
+from app.jobs import start_job_workers, stop_job_workers
+from app.hashing import PasswordHasherBusy, shutdown_pool
 
-# This command triggers the creation of tables in PostgreSQL
-# It checks if they exist; if not, it createsvdf them.oos
-Base.metadata.create_all(bind=engine)
+# Tables are managed by `python -m app.migrations upgrade`, not at import time
+IMPORT_STARTED = time.perf_counter()
+# Worker threads for run_db / run_in_threadpool (anyio's default is 40)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "0"))
+logger = logging.getLogger("app")
 
-app = FastAPI(title="Health API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    # Here rather than at import, so importing app.main (tests, tools) leaves logging alone
+    configure_logging()
+    if THREADPOOL_SIZE > 0:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # One cached version query instead of reflecting every table
+    STARTUP["schema_version"] = check_schema(engine)
+    STARTUP["prewarmed_connections"] = await prewarm_pool()
+    # One pooled ML client for the lifetime of the worker
+    get_ml_client()
+    # Optional in-process model (ML_MODEL_PATH) for fallback and batch scoring
+    load_local_model()
+    # Background GPA jobs (JOB_WORKERS per process) and scheduled stale re-scoring
+    start_job_workers()
+    STARTUP["lifespan_seconds"] = time.perf_counter() - started
+    STARTUP["startup_seconds"] = time.perf_counter() - IMPORT_STARTED
+    logger.info("Startup completed in %.3fs", STARTUP["startup_seconds"])
+    yield
+    await stop_job_workers()
+    await close_ml_client()
+    shutdown_pool()
+    for pool_engine in (async_engine, async_read_engine):
+        if pool_engine is not None:
+            await pool_engine.dispose()
+
+# orjson renders the response-model output several times faster than json.dumps
+app = FastAPI(title="Health API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, please retry"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 origins = ["*"]
 
+# Innermost of the three: CORS headers still reach shed responses
+app.add_middleware(OverloadMiddleware)
+
 # 2. Add the middleware
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +77,8 @@ app.add_middleware(
     allow_methods=["*"], # Allows POST, GET, etc.
     allow_headers=["*"], # Allows Content-Type, etc.
 )
+# Outermost, so latency includes CORS handling and every response is counted
+app.add_middleware(RequestMetricsMiddleware)
 
 # Connect the files
 app.include_router(doctors.router)
@@ -29,7 +86,9 @@ app.include_router(students.router)
 app.include_router(ratings.router)
 app.include_router(studentInfo.router)
 app.include_router(doctorInfo.router)
-app.include_router(ml_predictions.router) 
+app.include_router(ml_predictions.router)
+app.include_router(auth.router)
+app.include_router(metrics.router)
 @app.get("/")
 def read_root():
     return {"status": "System Online"}
\ No newline at end of file
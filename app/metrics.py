@@ -0,0 +1,330 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Seconds; shared by every latency histogram
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (Prometheus style) with approximate quantiles.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+# Filled in by the app lifespan: time from importing app.main to ready
+STARTUP: dict = {}
+
+
+# --- CONNECTION POOL METRICS ---
+
+class PoolMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = Histogram()
+        self.pool = None  # Current pool; replaced when the engine is disposed
+
+    def snapshot(self) -> dict:
+        data = {
+            "engine": self.name,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "checkout_wait_seconds": self.wait_seconds.snapshot(),
+        }
+        if self.pool is not None:
+            data.update(
+                pool_size=self.pool.size(),
+                checked_out=self.pool.checkedout(),
+                checked_in=self.pool.checkedin(),
+                # Negative until the base pool is fully populated
+                overflow=self.pool.overflow(),
+                max_overflow=self.pool._max_overflow,
+            )
+        return data
+
+
+POOL_METRICS: dict = {}
+
+
+def pool_metrics(name: str) -> PoolMetrics:
+    if name not in POOL_METRICS:
+        POOL_METRICS[name] = PoolMetrics(name)
+    return POOL_METRICS[name]
+
+
+class _InstrumentedPoolMixin:
+    """
+    Times every checkout (including the wait for a free connection) and
+    counts pool timeouts. Metrics are keyed by the pool's logging name so
+    they survive engine.dispose(), which recreates the pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics = pool_metrics(getattr(self, "logging_name", None) or "default")
+        self._metrics.pool = self
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self._metrics.timeouts += 1
+            raise
+        finally:
+            self._metrics.checkouts += 1
+            self._metrics.wait_seconds.observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# --- REQUEST METRICS ---
+# Requests slower than this are logged with their SQL; 0 disables the log
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0"))
+SLOW_REQUEST_MAX_STATEMENTS = 20
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """SQL statements executed while serving one request."""
+
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = [] if SLOW_REQUEST_SECONDS > 0 else None
+
+
+_current_queries: ContextVar[Optional[QueryStats]] = ContextVar("current_queries", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _current_queries.get()
+    if stats is None:
+        return
+    stats.count += 1
+    stats.seconds += elapsed
+    if stats.statements is not None and len(stats.statements) < SLOW_REQUEST_MAX_STATEMENTS:
+        stats.statements.append((round(elapsed * 1000, 3), statement))
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.statuses: dict = {}
+        self.latency = Histogram()
+        self.response_bytes = 0
+        self.db_statements = 0
+        self.db_seconds = 0.0
+
+
+ROUTE_METRICS: dict = {}
+
+
+def _route_metrics(method: str, route: str) -> RouteMetrics:
+    key = (method, route)
+    if key not in ROUTE_METRICS:
+        ROUTE_METRICS[key] = RouteMetrics()
+    return ROUTE_METRICS[key]
+
+
+class RequestMetricsMiddleware:
+    """
+    Pure ASGI middleware recording per-route counts, latency, response size
+    and the SQL each request ran. Routes are labelled by their path template
+    so ids do not explode the number of series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stats = QueryStats()
+        token = _current_queries.set(stats)
+        response = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_queries.reset(token)
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            metrics = _route_metrics(scope["method"], route_path)
+            metrics.statuses[response["status"]] = metrics.statuses.get(response["status"], 0) + 1
+            metrics.latency.observe(elapsed)
+            metrics.response_bytes += response["bytes"]
+            metrics.db_statements += stats.count
+            metrics.db_seconds += stats.seconds
+
+            if SLOW_REQUEST_SECONDS > 0 and elapsed >= SLOW_REQUEST_SECONDS:
+                logger.warning(
+                    "Slow request %s %s took %.3fs",
+                    scope["method"], route_path, elapsed,
+                    extra={
+                        "route": route_path,
+                        "status": response["status"],
+                        "duration_ms": round(elapsed * 1000, 3),
+                        "db_statements": stats.count,
+                        "db_ms": round(stats.seconds * 1000, 3),
+                        "statements": stats.statements,
+                    },
+                )
+
+
+# --- PROMETHEUS EXPOSITION ---
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, histogram: Histogram, **labels) -> list:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+# Type and help text of the families rendered below; extra gauges are
+# typed by name (counter for *_total, gauge otherwise)
+METRIC_FAMILIES = {
+    "http_requests_total": ("counter", "Requests by method, route template and status."),
+    "http_request_duration_seconds": ("histogram", "Request latency by method and route template."),
+    "http_response_size_bytes_total": ("counter", "Response body bytes by method and route template."),
+    "db_statements_total": ("counter", "SQL statements executed while serving a route."),
+    "db_statement_seconds_total": ("counter", "Time spent in SQL statements while serving a route."),
+    "db_pool_checked_out": ("gauge", "Connections currently checked out of the pool."),
+    "db_pool_overflow": ("gauge", "Overflow connections in use; negative until the pool is full."),
+    "db_pool_timeouts_total": ("counter", "Pool checkouts that timed out."),
+    "db_pool_checkout_wait_seconds": ("histogram", "Time spent waiting for a pooled connection."),
+}
+
+
+def render_prometheus(extra_counters: Optional[dict] = None, extra_gauges: Optional[dict] = None) -> str:
+    # Samples per family in first-seen order; the exposition format wants each family contiguous
+    families: dict = {}
+    # Type of each extra family, as declared by the caller rather than guessed from its name
+    extra_kinds: dict = {}
+
+    def add(family: str, *samples: str) -> None:
+        families.setdefault(family, []).extend(samples)
+
+    for (method, route), metrics in sorted(ROUTE_METRICS.items()):
+        for status, count in sorted(metrics.statuses.items()):
+            add("http_requests_total", f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+        add("http_request_duration_seconds", *_histogram_lines(
+            "http_request_duration_seconds", metrics.latency, method=method, route=route,
+        ))
+        add("http_response_size_bytes_total", f"http_response_size_bytes_total{_labels(method=method, route=route)} {metrics.response_bytes}")
+        add("db_statements_total", f"db_statements_total{_labels(method=method, route=route)} {metrics.db_statements}")
+        add("db_statement_seconds_total", f"db_statement_seconds_total{_labels(method=method, route=route)} {metrics.db_seconds}")
+
+    for name, pool in sorted(POOL_METRICS.items()):
+        snapshot = pool.snapshot()
+        if "checked_out" in snapshot:
+            add("db_pool_checked_out", f"db_pool_checked_out{_labels(engine=name)} {snapshot['checked_out']}")
+            add("db_pool_overflow", f"db_pool_overflow{_labels(engine=name)} {snapshot['overflow']}")
+        add("db_pool_timeouts_total", f"db_pool_timeouts_total{_labels(engine=name)} {pool.timeouts}")
+        add("db_pool_checkout_wait_seconds", *_histogram_lines("db_pool_checkout_wait_seconds", pool.wait_seconds, engine=name))
+
+    for kind, extra in (("counter", extra_counters), ("gauge", extra_gauges)):
+        for name, value in sorted((extra or {}).items()):
+            family = name.split("{", 1)[0]
+            extra_kinds[family] = kind
+            add(family, f"{name} {value}")
+
+    lines = []
+    for family, samples in families.items():
+        kind, help_text = METRIC_FAMILIES.get(family, (extra_kinds.get(family), None))
+        if help_text:
+            lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        lines += samples
+    return "\n".join(lines) + "\n"
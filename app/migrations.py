@@ -0,0 +1,218 @@
+"""
+Versioned schema migrations.
+
+Run explicitly before starting new app versions:
+
+    python -m app.migrations upgrade     # apply pending migrations
+    python -m app.migrations current     # print the applied version
+
+App startup only compares the recorded version with LATEST_VERSION.
+Every migration must be idempotent: version 1 creates the full current
+schema on an empty database, later versions bring older databases up to it.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from .database import Base, StudentFeatures, StudentInfo
+from .features import feature_row
+
+logger = logging.getLogger(__name__)
+
+# "strict" refuses to start on an outdated schema, "warn" logs, "off" skips the check
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "strict").lower()
+
+version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime(timezone=True)),
+)
+
+
+# --- HELPERS ---
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return column in {col["name"] for col in inspect(conn).get_columns(table)}
+
+
+def _has_index(conn: Connection, table: str, name: str) -> bool:
+    inspector = inspect(conn)
+    names = {index["name"] for index in inspector.get_indexes(table)}
+    names |= {constraint["name"] for constraint in inspector.get_unique_constraints(table)}
+    return name in names
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl_type: str) -> None:
+    if not _has_column(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def _create_index(conn: Connection, table: str, name: str, columns: str, unique: bool = False) -> None:
+    if not _has_index(conn, table, name):
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        conn.execute(text(f"CREATE {kind} {name} ON {table} ({columns})"))
+
+
+# --- MIGRATIONS ---
+
+def _baseline(conn: Connection) -> None:
+    # Creates missing tables only; existing tables are upgraded below
+    Base.metadata.create_all(bind=conn)
+
+
+def _prediction_feature_hash(conn: Connection) -> None:
+    _add_column(conn, "student_gpa", "feature_hash", "VARCHAR(64)")
+
+
+def _directory_indexes(conn: Connection) -> None:
+    _create_index(conn, "doctor_info", "ix_doctor_info_faculty_department_uni", "faculty, department, uni_name")
+    _create_index(conn, "doctors", "ix_doctors_price_per_hour", "price_per_hour")
+
+
+def _rating_constraints(conn: Connection) -> None:
+    _create_index(conn, "ratings", "uq_rating_student_doctor", "student_id, doctor_id", unique=True)
+    _create_index(conn, "ratings", "ix_ratings_doctor_id", "doctor_id")
+    # SQLite cannot add constraints to an existing table; the API validates the range
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(
+            "DO $$ BEGIN "
+            "ALTER TABLE ratings ADD CONSTRAINT rating_range_check CHECK (rating >= 1 AND rating <= 5); "
+            "EXCEPTION WHEN duplicate_object THEN NULL; END $$"
+        ))
+
+
+def _row_versions(conn: Connection) -> None:
+    timestamp = "TIMESTAMP WITH TIME ZONE" if conn.dialect.name == "postgresql" else "TIMESTAMP"
+    for table in ("students_info", "doctor_info", "student_gpa"):
+        _add_column(conn, table, "version", "INTEGER NOT NULL DEFAULT 1")
+        _add_column(conn, table, "updated_at", timestamp)
+
+
+def _search_indexes(conn: Connection) -> None:
+    # Other databases search an in-process index (app/search.py)
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for table, column in (
+        ("doctors", "username"),
+        ("doctor_info", "uni_name"),
+        ("doctor_info", "faculty"),
+        ("doctor_info", "department"),
+    ):
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)"
+        ))
+
+
+def _prediction_jobs(conn: Connection) -> None:
+    Base.metadata.tables["prediction_jobs"].create(bind=conn, checkfirst=True)
+
+
+def _student_features(conn: Connection) -> None:
+    StudentFeatures.__table__.create(bind=conn, checkfirst=True)
+    # Backfill profiles that have no feature row yet, one chunk at a time
+    query = select(*StudentInfo.__table__.c).where(
+        ~select(StudentFeatures.student_id).where(StudentFeatures.student_id == StudentInfo.student_id).exists()
+    ).execution_options(yield_per=1000)
+    for partition in conn.execute(query).partitions():
+        conn.execute(StudentFeatures.__table__.insert(), [feature_row(profile) for profile in partition])
+
+
+MIGRATIONS = [
+    (1, "baseline tables", _baseline),
+    (2, "student_gpa.feature_hash", _prediction_feature_hash),
+    (3, "doctor directory indexes", _directory_indexes),
+    (4, "rating uniqueness and range", _rating_constraints),
+    (5, "row versions for conditional requests", _row_versions),
+    (6, "trigram indexes for doctor search", _search_indexes),
+    (7, "prediction job queue", _prediction_jobs),
+    (8, "student feature store", _student_features),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# --- RUNNER ---
+
+def current_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(schema_version.name):
+        return 0
+    return conn.execute(select(schema_version.c.version).order_by(schema_version.c.version.desc())).scalar() or 0
+
+
+def upgrade(engine: Engine) -> int:
+    """Apply pending migrations, each in its own transaction."""
+    with engine.begin() as conn:
+        version_metadata.create_all(bind=conn)
+        version = current_version(conn)
+
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_version.insert().values(
+                version=number, description=description, applied_at=datetime.now(timezone.utc)
+            ))
+        logger.info("Applied migration %s: %s", number, description)
+        version = number
+    return version
+
+
+_checked_version: Optional[int] = None
+
+
+def check_schema(engine: Engine) -> int:
+    """
+    Compare the database schema version with this release, once per process.
+    """
+    global _checked_version
+    if SCHEMA_CHECK == "off":
+        return LATEST_VERSION
+    if _checked_version is None:
+        try:
+            with engine.connect() as conn:
+                _checked_version = current_version(conn)
+        except SQLAlchemyError as e:
+            raise RuntimeError(f"Could not read schema version: {e}") from e
+
+    if _checked_version < LATEST_VERSION:
+        message = (
+            f"Database schema is at version {_checked_version}, this release needs {LATEST_VERSION}; "
+            "run `python -m app.migrations upgrade`"
+        )
+        if SCHEMA_CHECK == "strict":
+            raise RuntimeError(message)
+        logger.warning(message)
+    return _checked_version
+
+
+def main(argv=None) -> int:
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Manage the database schema")
+    parser.add_argument("command", choices=("upgrade", "current"))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == "upgrade":
+        version = upgrade(engine)
+    else:
+        with engine.connect() as conn:
+            version = current_version(conn)
+    print(f"schema version {version} (latest {LATEST_VERSION})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
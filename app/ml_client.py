@@ -0,0 +1,187 @@
+import asyncio
+import os
+import random
+import time
+from typing import Optional
+
+import httpx
+
+# --- ML CONTAINER CLIENT CONFIG ---
+ML_CONTAINER_URL = os.getenv("ML_CONTAINER_URL")
+ML_CONNECT_TIMEOUT = float(os.getenv("ML_CONNECT_TIMEOUT", "2.0"))
+ML_READ_TIMEOUT = float(os.getenv("ML_READ_TIMEOUT", "10.0"))
+ML_MAX_CONNECTIONS = int(os.getenv("ML_MAX_CONNECTIONS", "20"))
+ML_MAX_KEEPALIVE = int(os.getenv("ML_MAX_KEEPALIVE", "10"))
+ML_MAX_CONCURRENCY = int(os.getenv("ML_MAX_CONCURRENCY", "16"))
+ML_RETRIES = int(os.getenv("ML_RETRIES", "2"))
+ML_RETRY_BACKOFF = float(os.getenv("ML_RETRY_BACKOFF", "0.2"))
+ML_BREAKER_FAILURES = int(os.getenv("ML_BREAKER_FAILURES", "5"))
+ML_BREAKER_RESET_SECONDS = float(os.getenv("ML_BREAKER_RESET_SECONDS", "30"))
+
+
+class MLServiceUnavailable(Exception):
+    """Raised when the ML container cannot produce a prediction."""
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class MLRequestRejected(Exception):
+    """Raised when the ML container is up but rejects the input (4xx)."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    until `reset_timeout` seconds have passed; then lets one trial call through.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 0
+        remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Give up a trial call without an outcome, e.g. when it was cancelled."""
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class MLClient:
+    """
+    Pooled, non-blocking client for the ML container with bounded concurrency,
+    retries with jittered backoff and a circuit breaker.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = ML_CONTAINER_URL,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url
+        self.http = httpx.AsyncClient(
+            base_url=base_url or "",
+            timeout=httpx.Timeout(ML_READ_TIMEOUT, connect=ML_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=ML_MAX_CONNECTIONS,
+                max_keepalive_connections=ML_MAX_KEEPALIVE,
+            ),
+            transport=transport,
+        )
+        self.limiter = asyncio.Semaphore(ML_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(ML_BREAKER_FAILURES, ML_BREAKER_RESET_SECONDS)
+
+    async def predict(self, ml_input: dict) -> dict:
+        if not self.base_url:
+            raise MLServiceUnavailable("ML_CONTAINER_URL is not configured")
+        if not self.breaker.allow():
+            raise MLServiceUnavailable("circuit open", retry_after=self.breaker.retry_after())
+
+        # Every exit records an outcome or releases the half-open trial,
+        # so a cancelled call cannot leave the breaker rejecting forever
+        settled = False
+        try:
+            last_error: Optional[Exception] = None
+            for attempt in range(ML_RETRIES + 1):
+                if attempt:
+                    # Full jitter keeps retrying workers from hitting the container in lockstep
+                    await asyncio.sleep(random.uniform(0, ML_RETRY_BACKOFF * 2 ** (attempt - 1)))
+                try:
+                    async with self.limiter:
+                        response = await self.http.post("/predict", json=ml_input)
+                except httpx.TransportError as e:
+                    last_error = e
+                    continue
+
+                if response.status_code >= 500:
+                    last_error = httpx.HTTPStatusError(
+                        f"ML container returned {response.status_code}",
+                        request=response.request,
+                        response=response,
+                    )
+                    continue
+
+                if response.is_error:
+                    # A 4xx means the container is up but rejected this input
+                    self.breaker.record_success()
+                    settled = True
+                    raise MLRequestRejected(f"ML container returned {response.status_code}", response.status_code)
+                try:
+                    prediction = response.json()
+                except ValueError:
+                    last_error = ValueError("ML container returned invalid JSON")
+                    break
+                self.breaker.record_success()
+                settled = True
+                if not isinstance(prediction, dict):
+                    # Valid JSON but not an object: malformed like a missing field, not an outage
+                    raise MLRequestRejected("ML container returned a non-object body", response.status_code)
+                return prediction
+
+            self.breaker.record_failure()
+            settled = True
+            raise MLServiceUnavailable(str(last_error) or type(last_error).__name__)
+        finally:
+            if not settled:
+                self.breaker.release_trial()
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+
+_client: Optional[MLClient] = None
+
+
+def get_ml_client() -> MLClient:
+    """Return the application-wide ML client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = MLClient()
+    return _client
+
+
+async def close_ml_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,236 @@
+"""
+In-process overload protection.
+
+Requests are grouped (auth, ml, reads, writes) and each group admits at
+most OVERLOAD_<GROUP>_CONCURRENCY requests at a time. Up to
+OVERLOAD_<GROUP>_QUEUE more may wait, for at most OVERLOAD_QUEUE_TIMEOUT
+seconds; anything beyond that is answered 503 with Retry-After right away
+instead of piling up in uvicorn's backlog and the threadpool. A limit of 0
+disables the group's limiter.
+
+Login attempts are additionally rate limited per client with a token
+bucket: LOGIN_RATE_LIMIT attempts per LOGIN_RATE_WINDOW seconds, 429 after.
+The healthcheck ("/") and metrics routes are never shed.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from .cache import TTLCache
+from .metrics import Histogram
+
+OVERLOAD_QUEUE_TIMEOUT = float(os.getenv("OVERLOAD_QUEUE_TIMEOUT", "2"))
+OVERLOAD_RETRY_AFTER = int(os.getenv("OVERLOAD_RETRY_AFTER", "1"))
+
+LOGIN_RATE_LIMIT = int(os.getenv("LOGIN_RATE_LIMIT", "10"))
+LOGIN_RATE_WINDOW = float(os.getenv("LOGIN_RATE_WINDOW", "60"))
+# Only enable behind a proxy that sets X-Forwarded-For; clients can forge it
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+
+EXEMPT_PATHS = ("/metrics", "/docs", "/redoc", "/openapi.json")
+AUTH_PATHS = ("/students/login", "/students/register", "/doctors/login", "/doctors/register", "/auth/")
+LOGIN_PATHS = ("/students/login", "/doctors/login")
+
+GROUP_DEFAULTS = {"auth": 32, "ml": 64, "reads": 256, "writes": 128}
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class ConcurrencyLimiter:
+    """
+    Semaphore with a bounded FIFO wait queue and a wait timeout. Released
+    slots are handed straight to the oldest waiter.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+        self.queue_seconds = Histogram()
+        self._waiters: deque = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise Overloaded("queue_full")
+
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected["queue_timeout"] += 1
+            raise Overloaded("queue_timeout")
+        except asyncio.CancelledError:
+            # Cancelled (client gone) after being handed a slot: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self.queue_seconds.observe(time.perf_counter() - started)
+        self.admitted += 1
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes to the waiter; active stays the same
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "group": self.name,
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected["queue_full"],
+            "rejected_queue_timeout": self.rejected["queue_timeout"],
+            "queue_seconds": self.queue_seconds.snapshot(),
+        }
+
+
+def _limiter(group: str) -> Optional[ConcurrencyLimiter]:
+    limit = int(os.getenv(f"OVERLOAD_{group.upper()}_CONCURRENCY", str(GROUP_DEFAULTS[group])))
+    if limit <= 0:
+        return None
+    max_queue = int(os.getenv(f"OVERLOAD_{group.upper()}_QUEUE", str(limit)))
+    return ConcurrencyLimiter(group, limit, max_queue, OVERLOAD_QUEUE_TIMEOUT)
+
+
+LIMITERS = {group: _limiter(group) for group in GROUP_DEFAULTS}
+
+
+def route_group(method: str, path: str) -> Optional[str]:
+    """Limiter group for a request, or None for exempt paths."""
+    if path == "/" or path.startswith(EXEMPT_PATHS):
+        return None
+    if path.startswith(AUTH_PATHS):
+        return "auth"
+    if path.startswith("/ml/"):
+        return "ml"
+    if method in ("GET", "HEAD"):
+        return "reads"
+    return "writes"
+
+
+class LoginRateLimiter:
+    """Per-client token buckets holding LOGIN_RATE_LIMIT attempts."""
+
+    def __init__(self, capacity: int, window: float):
+        self.capacity = capacity
+        self.refill_per_second = capacity / window if window > 0 else float("inf")
+        self.limited = 0
+        # Idle clients drop out once their bucket would be full again
+        self._buckets = TTLCache(maxsize=100000, ttl=max(window, 1.0))
+        self._lock = threading.Lock()
+
+    def retry_after(self, tokens: float) -> int:
+        return max(1, int((1 - tokens) / self.refill_per_second + 0.999))
+
+    def allow(self, client: str) -> Optional[int]:
+        """Consume one attempt; return None if allowed, else seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (float(self.capacity), now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.refill_per_second)
+            if tokens < 1:
+                self._buckets.set(client, (tokens, now))
+                self.limited += 1
+                return self.retry_after(tokens)
+            self._buckets.set(client, (tokens - 1, now))
+            return None
+
+
+login_rate_limiter = LoginRateLimiter(LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW) if LOGIN_RATE_LIMIT > 0 else None
+
+
+def client_id(scope) -> str:
+    if TRUST_FORWARDED_FOR:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _reject(send, status: int, detail: str, retry_after: int) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class OverloadMiddleware:
+    """Pure ASGI middleware applying the login rate limit and group limiters."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        if login_rate_limiter is not None and method == "POST" and path in LOGIN_PATHS:
+            retry_after = login_rate_limiter.allow(client_id(scope))
+            if retry_after is not None:
+                await _reject(send, 429, "Too many login attempts", retry_after)
+                return
+
+        group = route_group(method, path)
+        limiter = LIMITERS.get(group) if group else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except Overloaded:
+            await _reject(send, 503, "Server overloaded, please retry", OVERLOAD_RETRY_AFTER)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+def overload_stats() -> dict:
+    return {
+        "groups": [limiter.snapshot() for limiter in LIMITERS.values() if limiter is not None],
+        "login_rate_limited": login_rate_limiter.limited if login_rate_limiter else 0,
+    }
@@ -0,0 +1,36 @@
+"""
+Read-through caches for profile and directory reads.
+
+Entries are invalidated by the create/update routes of this worker; other
+workers see changes once their entries expire, so the TTLs bound staleness
+when several workers share the local backend. Plug a shared CacheBackend
+into `.backend` to invalidate across workers.
+"""
+import os
+
+from .cache import LocalCacheBackend, read_through_cache
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "30"))
+DIRECTORY_CACHE_SIZE = int(os.getenv("DIRECTORY_CACHE_SIZE", "2000"))
+DIRECTORY_CACHE_TTL = float(os.getenv("DIRECTORY_CACHE_TTL", "30"))
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "5000"))
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "300"))
+
+# Generation group covering every cached directory page
+DIRECTORY_GROUP = "doctor-directory"
+
+student_profiles = read_through_cache(
+    "student_profiles", LocalCacheBackend(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL), PROFILE_CACHE_TTL
+)
+doctor_profiles = read_through_cache(
+    "doctor_profiles", LocalCacheBackend(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL), PROFILE_CACHE_TTL
+)
+doctor_directory = read_through_cache(
+    "doctor_directory", LocalCacheBackend(DIRECTORY_CACHE_SIZE, DIRECTORY_CACHE_TTL), DIRECTORY_CACHE_TTL
+)
+# Rankings per (catalogue version, student segment); a catalogue change
+# moves lookups to new keys, so no explicit invalidation is needed
+recommendations = read_through_cache(
+    "recommendations", LocalCacheBackend(RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CACHE_TTL), RECOMMENDATION_CACHE_TTL
+)
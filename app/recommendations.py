@@ -0,0 +1,251 @@
+"""
+Doctor recommendations for students.
+
+The doctor catalogue is held as NumPy column arrays (categorical codes,
+price, start year, rating) so one student is scored against every doctor
+in a single vectorized pass. The arrays are built on first use, patched
+in place for doctors marked dirty by profile and rating writes, and
+rebuilt every RECOMMENDATION_REFRESH_SECONDS to pick up other workers'
+writes. Rankings are cached per student segment (university, faculty,
+department, major) and catalogue version, see `read_caches.recommendations`.
+"""
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .database import Doctor, DoctorInfo, DoctorRatingSummary
+
+# 0 keeps the catalogue until restart (writes still update it)
+RECOMMENDATION_REFRESH_SECONDS = float(os.getenv("RECOMMENDATION_REFRESH_SECONDS", "300"))
+# Rankings are cached this deep; requests take the first `limit`
+RECOMMENDATION_MAX_RESULTS = 100
+
+# Each term is in [0, 1] before weighting
+MATCH_WEIGHTS = {"uni_name": 2.0, "faculty": 3.0, "department": 2.0, "major": 2.0}
+RATING_WEIGHT = 2.0
+PRICE_WEIGHT = 1.0
+EXPERIENCE_WEIGHT = 1.0
+# Doctors with few ratings are pulled toward the prior average
+RATING_PRIOR_MEAN = 3.5
+RATING_PRIOR_COUNT = 5
+# Price at which the price term is 0.5; cheaper doctors approach 1
+PRICE_REFERENCE = float(os.getenv("RECOMMENDATION_PRICE_REFERENCE", "50"))
+# Teaching years beyond this add nothing more
+EXPERIENCE_CAP_YEARS = 20
+
+# Vocabulary code for a missing doctor value; student values never use it
+_MISSING = 0
+_UNKNOWN = -1
+
+
+def _normalize(text: Optional[str]) -> str:
+    return (text or "").strip().lower()
+
+
+def student_segment(uni_name, faculty, department, major) -> Tuple[str, str, str, str]:
+    """Students with the same segment get the same ranking."""
+    return tuple(_normalize(value) for value in (uni_name, faculty, department, major))
+
+
+def quality(price, start_year, rating_avg, rating_count, current_year: int):
+    """
+    Student-independent part of the score for scalars or arrays; NaN
+    (unknown) prices and start years add nothing.
+    """
+    rating_avg = np.nan_to_num(rating_avg, nan=RATING_PRIOR_MEAN)
+    rating = (rating_avg * rating_count + RATING_PRIOR_MEAN * RATING_PRIOR_COUNT) / (rating_count + RATING_PRIOR_COUNT)
+    price_term = np.nan_to_num(PRICE_REFERENCE / (PRICE_REFERENCE + np.maximum(price, 0)), nan=0.0)
+    years = np.clip(current_year - start_year, 0, EXPERIENCE_CAP_YEARS)
+    experience = np.nan_to_num(years / EXPERIENCE_CAP_YEARS, nan=0.0)
+    return RATING_WEIGHT * rating / 5 + PRICE_WEIGHT * price_term + EXPERIENCE_WEIGHT * experience
+
+
+class _CatalogArrays:
+    """Column arrays with spare capacity, so inserts rarely reallocate."""
+
+    CODE_COLUMNS = ("uni_name", "faculty", "department")
+
+    def __init__(self, capacity: int = 0):
+        self.size = 0
+        self.row_of: Dict[int, int] = {}
+        # One vocabulary for every column, so a major can match a department
+        self.vocabulary: Dict[str, int] = {"": _MISSING}
+        self.doctor_id = np.zeros(capacity, dtype=np.int64)
+        self.codes = {column: np.zeros(capacity, dtype=np.int32) for column in self.CODE_COLUMNS}
+        self.quality = np.zeros(capacity, dtype=np.float64)
+
+    def code(self, text: Optional[str]) -> int:
+        key = _normalize(text)
+        if key not in self.vocabulary:
+            self.vocabulary[key] = len(self.vocabulary)
+        return self.vocabulary[key]
+
+    def lookup(self, text: str) -> int:
+        return self.vocabulary.get(text, _UNKNOWN) if text else _UNKNOWN
+
+    def _grow(self) -> None:
+        capacity = max(1024, 2 * len(self.doctor_id))
+        self.doctor_id = np.resize(self.doctor_id, capacity)
+        self.codes = {column: np.resize(values, capacity) for column, values in self.codes.items()}
+        self.quality = np.resize(self.quality, capacity)
+
+    def upsert(self, row, current_year: int) -> None:
+        index = self.row_of.get(row.doctor_id)
+        if index is None:
+            if self.size == len(self.doctor_id):
+                self._grow()
+            index = self.row_of[row.doctor_id] = self.size
+            self.size += 1
+        self.doctor_id[index] = row.doctor_id
+        for column in self.CODE_COLUMNS:
+            self.codes[column][index] = self.code(getattr(row, column))
+        self.quality[index] = quality(*_numeric(row), current_year)
+
+    def remove(self, doctor_id: int) -> None:
+        index = self.row_of.pop(doctor_id, None)
+        if index is None:
+            return
+        # Move the last row into the hole
+        last = self.size - 1
+        if index != last:
+            moved = int(self.doctor_id[last])
+            self.doctor_id[index] = moved
+            for values in self.codes.values():
+                values[index] = values[last]
+            self.quality[index] = self.quality[last]
+            self.row_of[moved] = index
+        self.size = last
+
+
+def _numeric(row) -> tuple:
+    def value(number):
+        return np.nan if number is None else float(number)
+    return value(row.price_per_hour), value(row.start_teaching_year), value(row.rating_avg), float(row.rating_count or 0)
+
+
+def _catalog_query(db: Session):
+    return db.query(
+        DoctorInfo.doctor_id,
+        DoctorInfo.uni_name,
+        DoctorInfo.faculty,
+        DoctorInfo.department,
+        DoctorInfo.start_teaching_year,
+        Doctor.price_per_hour,
+        DoctorRatingSummary.rating_avg,
+        DoctorRatingSummary.rating_count,
+    ).join(Doctor, Doctor.id == DoctorInfo.doctor_id).outerjoin(
+        DoctorRatingSummary, DoctorRatingSummary.doctor_id == DoctorInfo.doctor_id
+    )
+
+
+def build_arrays(rows, current_year: int) -> _CatalogArrays:
+    rows = list(rows)
+    arrays = _CatalogArrays(capacity=max(1024, len(rows)))
+    arrays.size = len(rows)
+    arrays.doctor_id[:len(rows)] = [row.doctor_id for row in rows]
+    arrays.row_of = {row.doctor_id: index for index, row in enumerate(rows)}
+    for column in arrays.CODE_COLUMNS:
+        arrays.codes[column][:len(rows)] = [arrays.code(getattr(row, column)) for row in rows]
+    if rows:
+        numeric = np.array([_numeric(row) for row in rows], dtype=np.float64)
+        arrays.quality[:len(rows)] = quality(*numeric.T, current_year)
+    return arrays
+
+
+class DoctorCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Serializes rebuilds so concurrent first requests load the table once
+        self._build_lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._arrays = _CatalogArrays()
+            self._dirty: set = set()
+            self._built_at: Optional[float] = None
+            # Part of every cached ranking's key; bumped on each change
+            self.version = 0
+
+    def mark_dirty(self, doctor_id: int) -> None:
+        """Re-read this doctor before the next ranking."""
+        with self._lock:
+            self._dirty.add(doctor_id)
+
+    def _stale(self) -> bool:
+        return self._built_at is None or (
+            RECOMMENDATION_REFRESH_SECONDS > 0
+            and time.monotonic() - self._built_at >= RECOMMENDATION_REFRESH_SECONDS
+        )
+
+    def ensure_current(self, db: Session, primary: Optional[Session] = None) -> int:
+        """
+        Build or rebuild the arrays as needed, then patch dirty doctors;
+        returns the catalogue version. Dirty doctors are read through
+        `primary` when given, as a replica `db` may not have their writes
+        yet, and stay marked across a rebuild for the same reason.
+        """
+        with self._lock:
+            stale = self._stale()
+        if stale:
+            with self._build_lock:
+                with self._lock:
+                    stale = self._stale()
+                if stale:
+                    arrays = build_arrays(_catalog_query(db).yield_per(1000), date.today().year)
+                    with self._lock:
+                        self._arrays = arrays
+                        self._built_at = time.monotonic()
+                        self.version += 1
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            if not dirty:
+                return self.version
+        rows = _catalog_query(primary if primary is not None else db).filter(DoctorInfo.doctor_id.in_(dirty)).all()
+        current_year = date.today().year
+        with self._lock:
+            for doctor_id in dirty - {row.doctor_id for row in rows}:
+                self._arrays.remove(doctor_id)
+            for row in rows:
+                self._arrays.upsert(row, current_year)
+            self.version += 1
+            return self.version
+
+    def rank(self, segment: Tuple[str, str, str, str], limit: int = RECOMMENDATION_MAX_RESULTS) -> List[Tuple[int, float]]:
+        """Best (doctor_id, score) pairs for a segment, ties by doctor id."""
+        uni_name, faculty, department, major = segment
+        with self._lock:
+            arrays = self._arrays
+            size = arrays.size
+            if size == 0:
+                return []
+            codes = {column: values[:size] for column, values in arrays.codes.items()}
+            scores = arrays.quality[:size].copy()
+            scores += MATCH_WEIGHTS["uni_name"] * (codes["uni_name"] == arrays.lookup(uni_name))
+            scores += MATCH_WEIGHTS["faculty"] * (codes["faculty"] == arrays.lookup(faculty))
+            scores += MATCH_WEIGHTS["department"] * (codes["department"] == arrays.lookup(department))
+            scores += MATCH_WEIGHTS["major"] * (codes["department"] == arrays.lookup(major))
+            doctor_ids = arrays.doctor_id[:size].copy()
+
+        limit = min(limit, size)
+        if limit < size:
+            # Everything tied with the limit-th best stays in, so ties resolve by id
+            threshold = np.partition(scores, size - limit)[size - limit]
+            candidates = np.flatnonzero(scores >= threshold)
+        else:
+            candidates = np.arange(size)
+        order = np.lexsort((doctor_ids[candidates], -scores[candidates]))[:limit]
+        picked = candidates[order]
+        return list(zip(doctor_ids[picked].tolist(), np.round(scores[picked], 4).tolist()))
+
+    def __len__(self) -> int:
+        return self._arrays.size
+
+
+doctor_catalog = DoctorCatalog()
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from ..auth import REFRESH, Principal, decode_token, get_current_principal, issue_tokens, revoke
+from ..database import RefreshRequest, MessageResponse, TokenResponse
+
+router = APIRouter(prefix="/auth", tags=["Auth"])
+
+@router.post("/refresh", response_model=TokenResponse)
+def refresh_tokens(body: RefreshRequest):
+    # Refresh tokens are single use: the old one is revoked on rotation
+    principal = decode_token(body.refresh_token, REFRESH)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token"
+        )
+    revoke(principal)
+    return issue_tokens(principal.role, principal.subject_id)
+
+@router.post("/logout", response_model=MessageResponse)
+def logout(body: Optional[RefreshRequest] = None, principal: Principal = Depends(get_current_principal)):
+    revoke(principal)
+    if body is not None:
+        refresh = decode_token(body.refresh_token, REFRESH)
+        same_owner = refresh is not None and (refresh.role, refresh.subject_id) == (principal.role, principal.subject_id)
+        if same_owner:
+            revoke(refresh)
+    return {"message": "Logged out"}
@@ -1,98 +1,361 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
-from ..database import get_db, Doctor, DoctorInfo, DoctorInfoCreate, DoctorInfoUpdate
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from ..database import get_db, get_read_db, run_db, dialect_insert, is_foreign_key_violation, Doctor, DoctorInfo, DoctorInfoCreate, DoctorInfoUpdate
+from ..database import DoctorInfoResponse, DoctorInfoEnvelope, DoctorProfileCheck, DoctorDirectoryEntry
+from ..database import DoctorInfoBatchResponse, IdBatchRequest
+from ..auth import get_current_principal, require_doctor, require_owner, Principal
+from ..conditional import ABSENT_ETAG, etag_matches, make_etag, not_modified, precondition_failed, require_match, set_validators
+from ..read_caches import DIRECTORY_GROUP, doctor_directory, doctor_profiles
+from ..recommendations import doctor_catalog
+from ..search import doctor_search
+from typing import List, Literal, Optional
+from datetime import date
+import base64
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/doctor-info", tags=["Doctor Info"])
 
+# Directory page size and the cap clients cannot exceed
+DIRECTORY_PAGE_SIZE = int(os.getenv("DIRECTORY_PAGE_SIZE", "20"))
+DIRECTORY_MAX_PAGE_SIZE = int(os.getenv("DIRECTORY_MAX_PAGE_SIZE", "100"))
+
+def _get_doctor_info_version(db: Session, doctor_id: int):
+    return db.query(DoctorInfo.id, DoctorInfo.version, DoctorInfo.updated_at).filter(
+        DoctorInfo.doctor_id == doctor_id
+    ).first()
+
+async def _invalidate_doctor(doctor_id: int) -> None:
+    # Any profile write can move the doctor between directory pages
+    await doctor_profiles.invalidate(str(doctor_id))
+    await doctor_directory.bump_generation(DIRECTORY_GROUP)
+    doctor_search.mark_dirty(doctor_id)
+    doctor_catalog.mark_dirty(doctor_id)
+
 # 1. CHECK IF PROFILE EXISTS
-@router.get("/check/{doctor_id}")
-def check_doctor_profile(doctor_id: int, db: Session = Depends(get_db)):
-    profile_exists = db.query(DoctorInfo.id).filter(DoctorInfo.doctor_id == doctor_id).first()
-    print("hi")
+# Each route runs its synchronous ORM work through run_db, so it never
+# blocks the event loop in either sync or async database mode
+@router.get("/check/{doctor_id}", response_model=DoctorProfileCheck)
+async def check_doctor_profile(
+    doctor_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+):
+    logger.debug("Doctor profile check", extra={"doctor_id": doctor_id})
+    current = await run_db(db, _get_doctor_info_version, doctor_id)
+    etag = make_etag(current.id, current.version) if current else ABSENT_ETAG
+    updated_at = current.updated_at if current else None
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, updated_at)
+    set_validators(response, etag, updated_at)
     return {
-        "exists": True if profile_exists else False,
+        "exists": current is not None,
         "doctor_id": doctor_id,
-        "profile_id": profile_exists[0] if profile_exists else None
+        "profile_id": current.id if current else None,
     }
 
 # 2. CREATE PROFILE
-@router.post("/", status_code=status.HTTP_201_CREATED)
-def create_doctor_info(details: DoctorInfoCreate, db: Session = Depends(get_db)):
-    # Check if doctor exists in main table
-    doctor = db.query(Doctor).filter(Doctor.id == details.doctor_id).first()
-    if not doctor:
-        raise HTTPException(status_code=404, detail="Doctor not found")
-    
-    # Check for duplicates
-    existing = db.query(DoctorInfo).filter(DoctorInfo.doctor_id == details.doctor_id).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Profile already exists")
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=DoctorInfoEnvelope)
+async def create_doctor_info(
+    details: DoctorInfoCreate,
+    response: Response,
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(get_current_principal),
+):
+    require_owner(principal, "doctor", details.doctor_id)
+    created = await run_db(db, _create_doctor_info, details)
+    await _invalidate_doctor(details.doctor_id)
+    set_validators(response, make_etag(created["data"]["id"], created["data"]["version"]), created["data"]["updated_at"])
+    return created
 
-    new_info = DoctorInfo(**details.model_dump())
-    db.add(new_info)
-    db.commit()
-    db.refresh(new_info)
-    return {"message": "Doctor profile created", "data": new_info}
+def _create_doctor_info(db: Session, details: DoctorInfoCreate):
+    # Single upsert statement; see _create_student_info
+    stmt = dialect_insert(db, DoctorInfo).values(**details.model_dump())
+    stmt = stmt.on_conflict_do_nothing(index_elements=[DoctorInfo.doctor_id]).returning(*DoctorInfo.__table__.c)
+    try:
+        created = db.execute(stmt).mappings().first()
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_foreign_key_violation(e):
+            raise HTTPException(status_code=404, detail="Doctor not found")
+        raise HTTPException(status_code=400, detail="Invalid profile data")
+
+    if created is None:
+        raise HTTPException(status_code=400, detail="Profile already exists")
+    return {"message": "Doctor profile created", "data": dict(created)}
 
 # 3. GET PROFILE
-@router.get("/{doctor_id}")
-def get_doctor_info(doctor_id: int, db: Session = Depends(get_db)):
-    info = db.query(DoctorInfo).filter(DoctorInfo.doctor_id == doctor_id).first()
+@router.get("/{doctor_id}", response_model=DoctorInfoResponse)
+async def get_doctor_info(
+    doctor_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+    primary_db: Session = Depends(get_db),
+):
+    """
+    Profile with ETag / Last-Modified, served through the profile cache;
+    If-None-Match hits are answered 304. Loads right after a write read
+    the primary.
+    """
+    info = await doctor_profiles.get_or_load(
+        str(doctor_id),
+        lambda: run_db(db, _get_doctor_info, doctor_id),
+        primary_loader=lambda: run_db(primary_db, _get_doctor_info, doctor_id),
+    )
+    etag = make_etag(info["id"], info["version"])
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, info["updated_at"])
+    set_validators(response, etag, info["updated_at"])
+    return info
+
+def _get_doctor_info(db: Session, doctor_id: int):
+    info = db.query(*DoctorInfo.__table__.c).filter(DoctorInfo.doctor_id == doctor_id).first()
     if not info:
         raise HTTPException(status_code=404, detail="Profile not found")
-    return info
+    return info._asdict()
 
 # 4. UPDATE PROFILE
-@router.put("/{doctor_id}")
-def update_doctor_info(doctor_id: int, updates: DoctorInfoUpdate, db: Session = Depends(get_db)):
+@router.put("/{doctor_id}", response_model=DoctorInfoEnvelope)
+async def update_doctor_info(
+    doctor_id: int,
+    updates: DoctorInfoUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(require_doctor),
+):
+    updated = await run_db(db, _update_doctor_info, doctor_id, updates, if_match, response)
+    await _invalidate_doctor(doctor_id)
+    return updated
+
+def _update_doctor_info(db: Session, doctor_id: int, updates: DoctorInfoUpdate, if_match: Optional[str], response: Response):
     db_info = db.query(DoctorInfo).filter(DoctorInfo.doctor_id == doctor_id).first()
     if not db_info:
         raise HTTPException(status_code=404, detail="Profile not found")
+    require_match(if_match, make_etag(db_info.id, db_info.version))
 
-    update_data = updates.dict(exclude_unset=True)
+    update_data = updates.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_info, key, value)
 
+    try:
+        db.flush()
+    except StaleDataError:
+        db.rollback()
+        raise precondition_failed()
+    data = {column.name: getattr(db_info, column.name) for column in DoctorInfo.__table__.c}
     db.commit()
-    db.refresh(db_info)
-    return {"message": "Doctor profile updated", "data": db_info}
+    set_validators(response, make_etag(data["id"], data["version"]), data["updated_at"])
+    return {"message": "Doctor profile updated", "data": data}
+
+def _directory_query(db: Session):
+    """Profile columns joined with the owner's public account fields."""
+    return db.query(
+        DoctorInfo.id,
+        DoctorInfo.doctor_id,
+        DoctorInfo.uni_name,
+        DoctorInfo.faculty,
+        DoctorInfo.department,
+        DoctorInfo.start_teaching_year,
+        DoctorInfo.version,
+        DoctorInfo.updated_at,
+        Doctor.id.label("owner_id"),
+        Doctor.username,
+        Doctor.contact,
+        Doctor.price_per_hour,
+    ).outerjoin(Doctor, Doctor.id == DoctorInfo.doctor_id)
+
+def _directory_entry(row) -> dict:
+    # Convert to dict with doctor information included
+    return {
+        "id": row.id,
+        "doctor_id": row.doctor_id,
+        "uni_name": row.uni_name,
+        "faculty": row.faculty,
+        "department": row.department,
+        "start_teaching_year": row.start_teaching_year,
+        "version": row.version,
+        "updated_at": row.updated_at,
+        "owner": {
+            "id": row.owner_id,
+            "username": row.username,
+            "contact": row.contact,
+            "price_per_hour": row.price_per_hour
+        } if row.owner_id is not None else None
+    }
+
+# 5. BATCH LOOKUPS
+@router.post("/check/batch", response_model=List[DoctorProfileCheck])
+async def check_doctor_profiles(batch: IdBatchRequest, db: Session = Depends(get_read_db)):
+    """
+    Existence of many profiles with one IN query, in request order.
+    """
+    ids = list(dict.fromkeys(batch.ids))
+    found = await run_db(db, lambda session: dict(session.query(DoctorInfo.doctor_id, DoctorInfo.id).filter(
+        DoctorInfo.doctor_id.in_(ids)
+    ).all()))
+    return [
+        {"exists": doctor_id in found, "doctor_id": doctor_id, "profile_id": found.get(doctor_id)}
+        for doctor_id in ids
+    ]
+
+@router.post("/batch", response_model=DoctorInfoBatchResponse)
+async def get_doctor_profiles(batch: IdBatchRequest, db: Session = Depends(get_read_db)):
+    """
+    Profiles with owner data for many doctors in one query; unknown ids are listed in `missing`.
+    """
+    ids = list(dict.fromkeys(batch.ids))
+    rows = await run_db(db, lambda session: _directory_query(session).filter(DoctorInfo.doctor_id.in_(ids)).all())
+    by_doctor = {row.doctor_id: _directory_entry(row) for row in rows}
+    return {
+        "profiles": [by_doctor[doctor_id] for doctor_id in ids if doctor_id in by_doctor],
+        "missing": [doctor_id for doctor_id in ids if doctor_id not in by_doctor],
+    }
+
+def _encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != 2:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    last_value, last_id = values
+    # Sort values are numbers (never NULL, see _get_doctors_page) and ids integers
+    if isinstance(last_value, bool) or not isinstance(last_value, (int, float)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if isinstance(last_id, bool) or not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
 
-@router.get("/filter/", response_model=List[dict]) 
-def get_doctors_by_department_and_faculty(
-    faculty: str, 
-    db: Session = Depends(get_db)
+@router.get("/filter/", response_model=List[DoctorDirectoryEntry])
+async def get_doctors_by_department_and_faculty(
+    response: Response,
+    faculty: str,
+    uni_name: Optional[str] = None,
+    department: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_experience: Optional[int] = Query(None, ge=0),
+    max_experience: Optional[int] = Query(None, ge=0),
+    sort: Literal["id", "price", "experience"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    cursor: Optional[str] = None,
+    limit: int = Query(DIRECTORY_PAGE_SIZE, ge=1, le=DIRECTORY_MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+    primary_db: Session = Depends(get_db),
 ):
-    # Query DoctorInfo with joined loading of the Doctor relationship
-    results = db.query(DoctorInfo).options(
-        joinedload(DoctorInfo.owner)
-    ).filter(
-        DoctorInfo.faculty == faculty
-    ).all()
-
-    if not results:
+    """
+    Keyset-paginated doctor directory. The next page's cursor is returned
+    in the X-Next-Cursor header (absent on the last page).
+    Doctors without a price or start year are left out of the matching
+    sort order, as keyset comparisons skip NULLs.
+    Pages are cached until the next doctor profile write; for one cache
+    TTL after a write, pages are loaded from the primary.
+    """
+    params = dict(
+        faculty=faculty, uni_name=uni_name, department=department,
+        min_price=min_price, max_price=max_price,
+        min_experience=min_experience, max_experience=max_experience,
+        sort=sort, order=order, cursor=cursor, limit=limit,
+    )
+    generation = await doctor_directory.generation(DIRECTORY_GROUP)
+    # Experience bounds depend on the current year, so it is part of the key
+    key = f"{generation}:{date.today().year}:{json.dumps(params, sort_keys=True)}"
+    page = await doctor_directory.get_or_load(
+        key,
+        lambda: run_db(db, _get_doctors_page, **params),
+        primary_loader=lambda: run_db(primary_db, _get_doctors_page, **params),
+        group=DIRECTORY_GROUP,
+    )
+
+    if not page["rows"] and cursor is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="No doctors found in this department and faculty"
         )
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["rows"]
 
-    # Convert to dict with doctor information included
-    doctors_list = []
-    for doctor_info in results:
-        doctor_dict = {
-            "id": doctor_info.id,
-            "doctor_id": doctor_info.doctor_id,
-            "uni_name": doctor_info.uni_name,
-            "faculty": doctor_info.faculty,
-            "department": doctor_info.department,
-            "start_teaching_year": doctor_info.start_teaching_year,
-            "owner": {
-                "id": doctor_info.owner.id,
-                "username": doctor_info.owner.username,
-                "contact": doctor_info.owner.contact,
-                "price_per_hour": doctor_info.owner.price_per_hour
-            } if doctor_info.owner else None
-        }
-        doctors_list.append(doctor_dict)
-
-    return doctors_list
\ No newline at end of file
+def _get_doctors_page(
+    db: Session,
+    faculty: str,
+    uni_name: Optional[str],
+    department: Optional[str],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    min_experience: Optional[int],
+    max_experience: Optional[int],
+    sort: str,
+    order: str,
+    cursor: Optional[str],
+    limit: int,
+):
+    query = _directory_query(db).filter(DoctorInfo.faculty == faculty)
+
+    if department is not None:
+        query = query.filter(DoctorInfo.department == department)
+    if uni_name is not None:
+        query = query.filter(DoctorInfo.uni_name == uni_name)
+    if min_price is not None:
+        query = query.filter(Doctor.price_per_hour >= min_price)
+    if max_price is not None:
+        query = query.filter(Doctor.price_per_hour <= max_price)
+
+    # Experience is stored as the start year, so bounds flip
+    current_year = date.today().year
+    if min_experience is not None:
+        query = query.filter(DoctorInfo.start_teaching_year <= current_year - min_experience)
+    if max_experience is not None:
+        query = query.filter(DoctorInfo.start_teaching_year >= current_year - max_experience)
+
+    sort_column = {
+        "id": DoctorInfo.id,
+        "price": Doctor.price_per_hour,
+        "experience": DoctorInfo.start_teaching_year,
+    }[sort]
+    if sort != "id":
+        # Keyset comparisons never match NULL, so a NULL ending a page would end the listing
+        query = query.filter(sort_column.isnot(None))
+    descending = order == "desc"
+    if sort == "experience":
+        # More experience means an earlier start year
+        descending = not descending
+
+    if cursor is not None:
+        last_value, last_id = _decode_cursor(cursor)
+        key = tuple_(sort_column, DoctorInfo.id)
+        query = query.filter(key < (last_value, last_id) if descending else key > (last_value, last_id))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), DoctorInfo.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), DoctorInfo.id.asc())
+
+    # Fetch one extra row to know whether another page exists
+    results = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        last_value = {
+            "id": last.id,
+            "price": last.price_per_hour,
+            "experience": last.start_teaching_year,
+        }[sort]
+        next_cursor = _encode_cursor([last_value, last.id])
+
+    return {"rows": [_directory_entry(row) for row in results], "next_cursor": next_cursor}
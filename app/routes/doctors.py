@@ -1,38 +1,98 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from ..database import get_db, Doctor, get_password_hash, verify_password, DoctorCreate, LoginRequest
+from ..database import get_db, get_read_db, run_db, sync_session, Doctor, DoctorCreate, LoginRequest, RegisterResponse, DoctorLoginResponse
+from ..database import DoctorInfo, DoctorSearchResult
+from ..search import search_doctors
+from .doctorInfo import DIRECTORY_MAX_PAGE_SIZE, DIRECTORY_PAGE_SIZE, _directory_entry, _directory_query
+from typing import List, Optional
+from ..auth import issue_tokens
+from ..hashing import hash_password, check_password, needs_rehash, PasswordHasherBusy
 
 router = APIRouter(prefix="/doctors", tags=["Doctors"])
 
-@router.post("/register")
-def register_dr(details: DoctorCreate, db: Session = Depends(get_db)):
-    # Check if doctor already existsfff43
-    existing_dr = db.query(Doctor).filter(Doctor.username == details.username).first()
-    if existing_dr:
-        raise HTTPException(status_code=400, detail="Username already registered")
-
-    hashed = get_password_hash(details.password)
+def _add_doctor(db: Session, details: DoctorCreate, hashed: str) -> Doctor:
     new_dr = Doctor(
-        username=details.username, 
-        hashed_password=hashed, 
-        contact=details.contact, 
+        username=details.username,
+        hashed_password=hashed,
+        contact=details.contact,
         price_per_hour=details.price
     )
     db.add(new_dr)
     db.commit()
     db.refresh(new_dr)
+    return new_dr
+
+def _set_password_hash(db: Session, dr: Doctor, hashed: str) -> None:
+    dr.hashed_password = hashed
+    db.commit()
+
+@router.post("/register", response_model=RegisterResponse)
+async def register_dr(details: DoctorCreate, db: Session = Depends(get_db)):
+    # Check if doctor already exists
+    existing_dr = await run_db(
+        db, lambda session: session.query(Doctor.id).filter(Doctor.username == details.username).first()
+    )
+    if existing_dr:
+        raise HTTPException(status_code=400, detail="Username already registered")
+
+    hashed = await hash_password(details.password)
+    new_dr = await run_db(db, _add_doctor, details, hashed)
     return {"message": f"Doctor {details.username} created", "id": new_dr.id}
 
-@router.post("/login")
-def login_dr(credentials: LoginRequest, db: Session = Depends(get_db)):
+@router.post("/login", response_model=DoctorLoginResponse)
+async def login_dr(credentials: LoginRequest, db: Session = Depends(get_db)):
     # 1. Find the doctor by username
-    dr = db.query(Doctor).filter(Doctor.username == credentials.username).first()
-    
+    dr = await run_db(
+        db, lambda session: session.query(Doctor).filter(Doctor.username == credentials.username).first()
+    )
+
     # 2. Check password
-    if not dr or not verify_password(credentials.password, dr.hashed_password):
+    if not dr or not await check_password(credentials.password, dr.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
         )
-    
-    return {"message": "Login successful", "doctor_id": dr.id, "username": dr.username}
\ No newline at end of file
+
+    # 3. Upgrade hashes made with an outdated cost factor; best effort under load
+    if needs_rehash(dr.hashed_password):
+        try:
+            await run_db(db, _set_password_hash, dr, await hash_password(credentials.password))
+        except PasswordHasherBusy:
+            pass
+
+    return {
+        "message": "Login successful",
+        "doctor_id": dr.id,
+        "username": dr.username,
+        **issue_tokens("doctor", dr.id)
+    }
+
+@router.get("/search", response_model=List[DoctorSearchResult])
+async def search_doctor_directory(
+    q: str = Query(..., min_length=2, max_length=100),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_experience: Optional[int] = Query(None, ge=0),
+    max_experience: Optional[int] = Query(None, ge=0),
+    limit: int = Query(DIRECTORY_PAGE_SIZE, ge=1, le=DIRECTORY_MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+    primary_db: Session = Depends(get_db),
+):
+    """
+    Doctors whose username, university, faculty or department match `q`
+    by prefix or with small typos, best match first. An empty list means
+    nothing matched.
+    """
+    # Recently written doctors are re-read from the primary (a session only connects when used)
+    return await run_db(
+        db, _search_doctor_directory, q, min_price, max_price, min_experience, max_experience, limit,
+        sync_session(primary_db),
+    )
+
+def _search_doctor_directory(db: Session, q: str, min_price, max_price, min_experience, max_experience, limit: int, primary: Session):
+    ranked = search_doctors(db, q, min_price, max_price, min_experience, max_experience, limit, primary)
+    if not ranked:
+        return []
+    rows = _directory_query(db).filter(DoctorInfo.doctor_id.in_([doctor_id for doctor_id, _ in ranked])).all()
+    by_doctor = {row.doctor_id: _directory_entry(row) for row in rows}
+    return [{**by_doctor[doctor_id], "score": score} for doctor_id, score in ranked if doctor_id in by_doctor]
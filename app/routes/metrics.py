@@ -0,0 +1,75 @@
+from typing import List
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..cache import CACHES
+from ..database import CacheStats, OverloadStats, PoolStats, StartupStats, DATABASE_READ_URL, replica_health
+from ..features import prediction_cache_counters, prediction_cache_stats
+from ..jobs import job_counters
+from ..local_model import local_model_counters
+from ..metrics import POOL_METRICS, STARTUP, render_prometheus
+from ..overload import overload_stats
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+@router.get("", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """
+    Per-route request, latency and SQL metrics plus pool, cache and job
+    counters and gauges in the Prometheus text format.
+    """
+    cache = prediction_cache_stats()
+    counters = {f"prediction_cache_{key}_total": cache[key] for key in prediction_cache_counters}
+    gauges = {f"prediction_cache_{key}": cache[key] for key in ("hit_rate", "lru_size", "lru_maxsize")}
+    for key, value in local_model_counters.items():
+        counters[f"ml_{key}_total"] = value
+    for key, value in job_counters.items():
+        counters[f"jobs_{key}_total"] = value
+    for cache in CACHES.values():
+        stats = cache.stats()
+        for key in ("hits", "misses", "coalesced", "invalidations"):
+            counters[f'read_cache_{key}_total{{cache="{cache.name}"}}'] = stats[key]
+        gauges[f'read_cache_hit_rate{{cache="{cache.name}"}}'] = stats["hit_rate"]
+    overload = overload_stats()
+    for group in overload["groups"]:
+        labels = f'{{group="{group["group"]}"}}'
+        gauges[f"overload_active{labels}"] = group["active"]
+        gauges[f"overload_waiting{labels}"] = group["waiting"]
+        counters[f"overload_admitted_total{labels}"] = group["admitted"]
+        counters[f'overload_rejected_total{{group="{group["group"]}",reason="queue_full"}}'] = group["rejected_queue_full"]
+        counters[f'overload_rejected_total{{group="{group["group"]}",reason="queue_timeout"}}'] = group["rejected_queue_timeout"]
+    counters["login_rate_limited_total"] = overload["login_rate_limited"]
+    if DATABASE_READ_URL:
+        gauges["db_replica_healthy"] = int(replica_health.healthy)
+        counters["db_replica_failures_total"] = replica_health.failures
+        counters["db_replica_fallback_sessions_total"] = replica_health.fallbacks
+    if "startup_seconds" in STARTUP:
+        gauges["app_startup_seconds"] = STARTUP["startup_seconds"]
+    return render_prometheus(counters, gauges)
+
+@router.get("/db-pool", response_model=List[PoolStats])
+def get_db_pool_stats():
+    """
+    Live connection pool usage and checkout wait times per engine.
+    """
+    return [metrics.snapshot() for metrics in POOL_METRICS.values()]
+
+@router.get("/caches", response_model=List[CacheStats])
+def get_cache_stats():
+    """
+    Hit rate, coalesced loads and invalidations of the read-through caches.
+    """
+    return [cache.stats() for cache in CACHES.values()]
+
+@router.get("/overload", response_model=OverloadStats)
+def get_overload_stats():
+    """
+    Concurrency limiter occupancy, queueing and shed requests per route group.
+    """
+    return overload_stats()
+
+@router.get("/startup", response_model=StartupStats)
+def get_startup_stats():
+    """
+    Worker startup duration, schema version and pre-warmed connections.
+    """
+    return STARTUP
@@ -1,74 +1,412 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import bindparam, or_, select, update
 from sqlalchemy.orm import Session
-from app.database import get_db
-from ..database import StudentInfo,StudentGPA,StudentGPACreate
+from app.database import get_db, run_db
+from ..database import (
+    StudentInfo, StudentFeatures, StudentGPA, StudentGPACreate, GPABatchRequest, PredictionJob, dialect_insert, utcnow,
+    GPAPrediction, GPABatchResponse, PredictionCacheStats, JobAccepted, JobStatus,
+)
+from ..auth import get_current_principal, is_staff, require_student, Principal
+from ..ml_client import get_ml_client, MLRequestRejected, MLServiceUnavailable
+from ..local_model import batch_model, fallback_model, local_model_counters
+from ..jobs import (
+    ACTIVE_STATUSES, JOB_RESCORE_CHUNK_SIZE, JobFailed, RetryJob, enqueue_job, get_job, insert_jobs, job_counters,
+    job_handler, notify_job_workers,
+)
+from ..features import (
+    FEATURE_VERSION, load_features, cached_prediction, remember_prediction,
+    record_lookup, prediction_cache_stats,
+)
+from typing import Optional
+import asyncio
 import os
-import requests
+
+import numpy as np
 
 router = APIRouter(prefix="/ml", tags=["ML Predictions"])
 
-# ML Container URL (change based on environment)
-ML_CONTAINER_URL = os.getenv("ML_CONTAINER_URL")
+# Batch scoring: students per chunk (one upsert each) and parallel ML calls
+ML_BATCH_CHUNK_SIZE = int(os.getenv("ML_BATCH_CHUNK_SIZE", "200"))
+ML_BATCH_CONCURRENCY = int(os.getenv("ML_BATCH_CONCURRENCY", "8"))
+
+
+def _load_batch_features(db: Session, batch: GPABatchRequest) -> dict:
+    criteria = []
+    if batch.student_ids is not None:
+        criteria.append(StudentInfo.student_id.in_(batch.student_ids))
+    for field in ("uni_name", "faculty", "department", "major"):
+        value = getattr(batch, field)
+        if value is not None:
+            criteria.append(getattr(StudentInfo, field) == value)
+    return load_features(db, *criteria)
+
+
+def _load_feature_hashes(db: Session, student_ids: list) -> dict:
+    rows = db.query(StudentGPA.student_id, StudentGPA.predicted_gpa, StudentGPA.feature_hash).filter(
+        StudentGPA.student_id.in_(student_ids)
+    ).all()
+    return {row.student_id: row for row in rows}
 
-@router.post("/predict-gpa/{student_id}")
-async def predict_student_gpa(student_id: int, db: Session = Depends(get_db)):
+
+def _upsert_gpas(db: Session, rows: list) -> None:
     """
-    Fetch student data and get GPA prediction from ML container
+    Write a chunk of predictions with one INSERT ... ON CONFLICT statement.
     """
-    # Get student info from database
-    student = db.query(StudentInfo).filter(StudentInfo.student_id == student_id).first()
-    
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-    
-    # Prepare data for ML container with defaults for missing values
-    ml_input = {
-        "student_id": student.student_id,  # For tracking only, not a feature
-        "uni_name": student.uni_name or "Unknown",
-        "major": student.major or "Unknown",
-        "disability": student.disability if student.disability is not None else False,
-        "dob": student.dob or "2000-01-01",
-        "academic_year": student.academic_year if student.academic_year is not None else 1,
-        "study_hours": student.study_hours if student.study_hours is not None else 0.0,
-        "athletic_status": student.athletic_status or "Inactive",
-        "country_of_origin": student.country_of_origin or "Unknown",
-        "country_of_residence": student.country_of_residence or "Unknown",
-        "primary_language": student.primary_language or "Unknown",
-        "gender": student.gender or "Unknown",
-        "dropout": False  # Default to False (student is not a dropout)
+    if not rows:
+        return
+    stmt = dialect_insert(db, StudentGPA)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StudentGPA.student_id],
+        set_={
+            "predicted_gpa": stmt.excluded.predicted_gpa,
+            "feature_hash": stmt.excluded.feature_hash,
+            # ON CONFLICT updates skip column onupdate hooks
+            "version": StudentGPA.version + 1,
+            "updated_at": utcnow(),
+        },
+    )
+    db.execute(stmt, rows)
+    db.commit()
+
+
+def _record_rejections(db: Session, rejected: dict) -> None:
+    """
+    Remember {student_id: feature_hash} inputs the ML service rejected, so
+    the stale sweep leaves those students alone until their features change.
+    """
+    if not rejected:
+        return
+    stmt = update(StudentFeatures.__table__).where(
+        StudentFeatures.student_id == bindparam("rejected_student_id")
+    ).values(rejected_hash=bindparam("rejected_feature_hash"))
+    db.execute(stmt, [
+        {"rejected_student_id": student_id, "rejected_feature_hash": features_hash}
+        for student_id, features_hash in rejected.items()
+    ])
+    db.commit()
+
+
+def _save_gpa(db: Session, student_id: int, predicted_gpa: float, features_hash: str) -> None:
+    # Upsert, so concurrent predictions for one student cannot collide
+    _upsert_gpas(db, [{"student_id": student_id, "predicted_gpa": predicted_gpa, "feature_hash": features_hash}])
+
+
+async def _predict_one(ml_input: dict, limiter: asyncio.Semaphore) -> dict:
+    async with limiter:
+        return await get_ml_client().predict(ml_input)
+
+
+def _unavailable(error: MLServiceUnavailable) -> HTTPException:
+    headers = {"Retry-After": str(error.retry_after)} if error.retry_after else None
+    return HTTPException(
+        status_code=503,
+        detail=f"ML service unavailable: {str(error)}",
+        headers=headers,
+    )
+
+
+@router.get("/cache-stats", response_model=PredictionCacheStats)
+def get_prediction_cache_stats():
+    """
+    Hit/miss counters of the feature-hash prediction cache.
+    """
+    return prediction_cache_stats()
+
+
+async def _score_batch(db: Session, batch: GPABatchRequest, force: bool) -> dict:
+    features = await run_db(db, _load_batch_features, batch)
+    ml_inputs = [entry.ml_input for entry in features.values()]
+    hashes = {student_id: entry.feature_hash for student_id, entry in features.items()}
+
+    results = []
+    failures = []
+    if batch.student_ids is not None:
+        for student_id in dict.fromkeys(batch.student_ids):
+            if student_id not in hashes:
+                failures.append({"student_id": student_id, "error": "Student not found"})
+
+    if not force and ml_inputs:
+        stored = await run_db(db, _load_feature_hashes, list(hashes))
+        unchanged = {
+            student_id for student_id, row in stored.items()
+            if row.feature_hash == hashes[student_id]
+        }
+        for student_id in sorted(unchanged):
+            results.append({
+                "student_id": student_id,
+                "predicted_gpa": stored[student_id].predicted_gpa,
+                "cached": True,
+            })
+        ml_inputs = [m for m in ml_inputs if m["student_id"] not in unchanged]
+
+    limiter = asyncio.Semaphore(ML_BATCH_CONCURRENCY)
+    # With ML_BATCH_ENGINE=local each chunk is one vectorized call instead of HTTP requests
+    local_model = batch_model()
+    for start in range(0, len(ml_inputs), ML_BATCH_CHUNK_SIZE):
+        chunk = ml_inputs[start:start + ML_BATCH_CHUNK_SIZE]
+        if local_model is not None:
+            # Stored vectors spare re-encoding the payloads
+            outcomes = local_model.predictions(chunk, np.vstack([features[m["student_id"]].vector for m in chunk]))
+        else:
+            outcomes = await asyncio.gather(
+                *(_predict_one(ml_input, limiter) for ml_input in chunk),
+                return_exceptions=True,
+            )
+
+        rows = []
+        rejected = {}
+        for ml_input, outcome in zip(chunk, outcomes):
+            student_id = ml_input["student_id"]
+            if isinstance(outcome, MLRequestRejected):
+                failures.append({"student_id": student_id, "error": f"ML service rejected the input: {outcome}"})
+                rejected[student_id] = hashes[student_id]
+                continue
+            if isinstance(outcome, Exception):
+                failures.append({"student_id": student_id, "error": f"ML service unavailable: {outcome}"})
+                continue
+            predicted_gpa = outcome.get("predicted_gpa")
+            if predicted_gpa is None:
+                failures.append({"student_id": student_id, "error": "ML response missing predicted_gpa"})
+                continue
+            rows.append({
+                "student_id": student_id,
+                "predicted_gpa": predicted_gpa,
+                "feature_hash": hashes[student_id],
+            })
+            remember_prediction(student_id, hashes[student_id], outcome)
+
+        await run_db(db, _upsert_gpas, rows)
+        await run_db(db, _record_rejections, rejected)
+        results.extend(
+            {"student_id": row["student_id"], "predicted_gpa": row["predicted_gpa"], "cached": False}
+            for row in rows
+        )
+
+    return {
+        "requested": len(results) + len(failures),
+        "succeeded": len(results),
+        "failed": len(failures),
+        "results": results,
+        "failures": failures,
     }
-    
-    # try:
-    #     # Call ML container
-    #     response = requests.post(f"{ML_CONTAINER_URL}/predict", json=ml_input, timeout=10)
-    #     response.raise_for_status()
-        
-    #     prediction = response.json()
-    #     return prediction
+
+
+@router.post("/predict-gpa/batch", response_model=GPABatchResponse)
+async def predict_gpa_batch(
+    batch: GPABatchRequest,
+    force: bool = False,
+    x_staff_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(get_current_principal),
+):
+    """
+    Re-score many students at once: one query to load the profiles,
+    concurrent ML calls per chunk and one bulk upsert per chunk.
+    Students whose features are unchanged since their stored prediction
+    are skipped unless `force` is set.
+    Other students and filters need the staff key (X-Staff-Key); without
+    it a student may only re-score themselves.
+    """
+    if not is_staff(x_staff_key):
+        own = (
+            principal.role == "student"
+            and batch.student_ids is not None
+            and set(batch.student_ids) <= {principal.subject_id}
+            and not any((batch.uni_name, batch.faculty, batch.department, batch.major))
+        )
+        if not own:
+            raise HTTPException(status_code=403, detail="Batch scoring of other students requires the staff key")
+
+    if batch.student_ids is None and not any(
+        (batch.uni_name, batch.faculty, batch.department, batch.major)
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail="Provide student_ids or at least one filter (uni_name, faculty, department, major)"
+        )
+
+    return await _score_batch(db, batch, force)
+
+
+async def _predict_and_store(db: Session, student_id: int, force: bool, allow_fallback: bool = True) -> dict:
+    # Stored, already defaulted and encoded model inputs (see features.load_features)
+    features = await run_db(db, load_features, StudentInfo.student_id == student_id)
+    if student_id not in features:
+        raise HTTPException(status_code=404, detail="Student not found")
+    ml_input, features_hash, vector = features[student_id]
+
+    if not force:
+        prediction = cached_prediction(student_id, features_hash)
+        if prediction is not None:
+            return prediction
+
+        stored = await run_db(
+            db, lambda session: session.query(StudentGPA.predicted_gpa, StudentGPA.feature_hash).filter(
+                StudentGPA.student_id == student_id
+            ).first()
+        )
+        hit = stored is not None and stored.feature_hash == features_hash
+        record_lookup(hit)
+        if hit:
+            prediction = {"predicted_gpa": stored.predicted_gpa}
+            remember_prediction(student_id, features_hash, prediction)
+            return prediction
+
     try:
-        # Call ML container
-        response = requests.post(f"{ML_CONTAINER_URL}/predict", json=ml_input, timeout=10)
-        response.raise_for_status()
-        
-        prediction = response.json()
+        # Call ML container through the shared pooled client
+        prediction = await get_ml_client().predict(ml_input)
         predicted_gpa = prediction.get("predicted_gpa")  # Adjust based on your ML response format
-        
+        if predicted_gpa is None:
+            raise HTTPException(status_code=502, detail="ML response missing predicted_gpa")
+
         # Save or update GPA in database
-        existing_gpa = db.query(StudentGPA).filter(StudentGPA.student_id == student_id).first()
-        
-        if existing_gpa:
-            # Update existing record
-            existing_gpa.predicted_gpa = predicted_gpa
-        else:
-            # Create new record
-            new_gpa = StudentGPA(student_id=student_id, predicted_gpa=predicted_gpa)
-            db.add(new_gpa)
-        
-        db.commit()
-        
+        await run_db(db, _save_gpa, student_id, predicted_gpa, features_hash)
+        remember_prediction(student_id, features_hash, prediction)
+
         return prediction
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=503, 
-            detail=f"ML service unavailable: {str(e)}"
-        )
\ No newline at end of file
+    except MLRequestRejected as e:
+        # The container is up; retrying or falling back will not help
+        await run_db(db, _record_rejections, {student_id: features_hash})
+        raise HTTPException(status_code=502, detail=f"ML service rejected the input: {e}")
+    except MLServiceUnavailable as e:
+        local_model = fallback_model() if allow_fallback else None
+        if local_model is None:
+            raise _unavailable(e)
+        # Not stored: the container re-scores this student once it is back
+        local_model_counters["fallbacks"] += 1
+        return local_model.predictions([ml_input], vector.reshape(1, -1))[0]
+
+
+def _enqueue_prediction(db: Session, student_id: int, force: bool):
+    if not db.query(StudentInfo.id).filter(StudentInfo.student_id == student_id).first():
+        raise HTTPException(status_code=404, detail="Student not found")
+    return enqueue_job(db, "predict", student_id=student_id, payload={"force": force}, dedupe=True)
+
+
+@router.post(
+    "/predict-gpa/{student_id}",
+    response_model=GPAPrediction,
+    responses={202: {"model": JobAccepted, "description": "Queued (`background=true`)"}},
+)
+async def predict_student_gpa(
+    student_id: int,
+    force: bool = False,
+    background: bool = False,
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(require_student),
+):
+    """
+    Fetch student data and get GPA prediction from ML container.
+    Unchanged features are answered from the prediction cache unless `force` is set.
+    While the container is unavailable the in-process model answers, if loaded.
+    With `background`, the prediction is queued and 202 returns a job id to poll
+    at GET /ml/jobs/{job_id}; a job already queued for the student is reused.
+    """
+    if not background:
+        return await _predict_and_store(db, student_id, force)
+
+    job = await run_db(db, _enqueue_prediction, student_id, force)
+    notify_job_workers()
+    status_url = f"{router.prefix}/jobs/{job.id}"
+    return ORJSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status, "status_url": status_url},
+        headers={"Location": status_url},
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_prediction_job(
+    job_id: int,
+    x_staff_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(get_current_principal),
+):
+    """
+    Status of a queued GPA job, with the prediction once it has succeeded.
+    Students only see their own jobs; other jobs need the staff key
+    (X-Staff-Key), as for batch scoring.
+    """
+    job = await run_db(db, get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    own = principal.role == "student" and job.student_id == principal.subject_id
+    if not own and not is_staff(x_staff_key):
+        raise HTTPException(status_code=403, detail="Not allowed to view this job")
+    return job
+
+
+@job_handler("predict")
+async def _predict_job(db: Session, job) -> dict:
+    try:
+        # The local model is not used: its answers are never stored
+        return await _predict_and_store(db, job.student_id, bool(job.payload.get("force")), allow_fallback=False)
+    except HTTPException as e:
+        if e.status_code == 503:
+            retry_after = (e.headers or {}).get("Retry-After")
+            raise RetryJob(e.detail, float(retry_after) if retry_after else None)
+        raise JobFailed(e.detail)
+
+
+@job_handler("predict_batch")
+async def _predict_batch_job(db: Session, job) -> dict:
+    batch = GPABatchRequest(student_ids=job.payload["student_ids"])
+    response = await _score_batch(db, batch, bool(job.payload.get("force")))
+    unavailable = [f for f in response["failures"] if f["error"].startswith("ML service unavailable")]
+    if unavailable:
+        # Students scored so far are unchanged on the retry and skipped
+        raise RetryJob(f"{len(unavailable)} of {response['requested']} students not scored: {unavailable[0]['error']}")
+    return {key: response[key] for key in ("requested", "succeeded", "failed", "failures")}
+
+
+def _enqueue_stale(db: Session) -> dict:
+    """
+    Queue a predict_batch job per ML_BATCH_CHUNK_SIZE students whose stored
+    prediction was not made from their current features. The comparison
+    runs in SQL and ids stream through a server-side cursor
+    (JOB_RESCORE_CHUNK_SIZE per fetch), so memory stays flat however many
+    students are stale. Profiles without a current feature row count as
+    stale; scoring them builds the row.
+
+    Students whose last queued job is still queued or running (e.g. backing
+    off while the container is down) are skipped, so repeated sweeps do not
+    pile up jobs, as are features the ML service already rejected.
+    """
+    query = select(StudentInfo.student_id).outerjoin(
+        StudentFeatures, StudentFeatures.student_id == StudentInfo.student_id
+    ).outerjoin(
+        StudentGPA, StudentGPA.student_id == StudentInfo.student_id
+    ).outerjoin(
+        PredictionJob, PredictionJob.id == StudentFeatures.rescore_job_id
+    ).where(
+        or_(
+            StudentFeatures.feature_hash.is_(None),
+            StudentFeatures.version != FEATURE_VERSION,
+            StudentGPA.feature_hash.is_(None),
+            StudentGPA.feature_hash != StudentFeatures.feature_hash,
+        ),
+        or_(PredictionJob.id.is_(None), PredictionJob.status.notin_(ACTIVE_STATUSES)),
+        or_(StudentFeatures.rejected_hash.is_(None), StudentFeatures.rejected_hash != StudentFeatures.feature_hash),
+    ).order_by(StudentInfo.student_id).execution_options(yield_per=JOB_RESCORE_CHUNK_SIZE)
+    stale = jobs = 0
+    for partition in db.execute(query).scalars().partitions(ML_BATCH_CHUNK_SIZE):
+        # Committed together at the end: a commit would close the cursor
+        job_ids = insert_jobs(db, "predict_batch", [{"student_ids": list(partition)}])
+        db.execute(
+            update(StudentFeatures.__table__)
+            .where(StudentFeatures.student_id.in_(partition))
+            .values(rescore_job_id=job_ids[0])
+        )
+        jobs += len(job_ids)
+        stale += len(partition)
+    db.commit()
+    return {"stale": stale, "jobs": jobs}
+
+
+@job_handler("rescore_stale")
+async def _rescore_stale_job(db: Session, job) -> dict:
+    result = await run_db(db, _enqueue_stale)
+    job_counters["enqueued"] += result["jobs"]
+    notify_job_workers()
+    return result
@@ -1,8 +1,195 @@
 # app/routes/ratings.py
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import Float, case, cast, delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..auth import Principal, get_current_principal
+from ..database import (
+    get_db, get_read_db, run_db, dialect_insert, Doctor, DoctorInfo, StdDrRate, DoctorRatingSummary,
+    RatingCreate, RatingUpdate, RatingResponse, RatingDeleteResponse, RatingSummaryResponse, TopRatedDoctor,
+)
+from ..recommendations import doctor_catalog
+from typing import List
 
 router = APIRouter(prefix="/ratings", tags=["Ratings"]) # Ensure this is 'router'
 
-@router.post("/")
-def create_rating():
-    return {"message": "success"}
\ No newline at end of file
+STAR_COLUMNS = {star: f"stars_{star}" for star in range(1, 6)}
+
+
+def _student_principal(principal: Principal = Depends(get_current_principal)) -> Principal:
+    if principal.role != "student":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only students can rate doctors")
+    return principal
+
+
+def _apply_to_summary(db: Session, doctor_id: int, count_delta: int, sum_delta: int, star_deltas: dict) -> None:
+    """
+    Adjust the doctor's aggregate row with one atomic upsert, so concurrent
+    rating writes never lose an update.
+    """
+    summary = DoctorRatingSummary
+    new_count = summary.rating_count + count_delta
+    new_sum = summary.rating_sum + sum_delta
+
+    initial = {"doctor_id": doctor_id, "rating_count": count_delta, "rating_sum": sum_delta,
+               "rating_avg": sum_delta / count_delta if count_delta > 0 else None}
+    updates = {
+        "rating_count": new_count,
+        "rating_sum": new_sum,
+        "rating_avg": case((new_count > 0, cast(new_sum, Float) / new_count), else_=None),
+    }
+    for star, column in STAR_COLUMNS.items():
+        initial[column] = max(star_deltas.get(star, 0), 0)
+        if star in star_deltas:
+            updates[column] = getattr(summary, column) + star_deltas[star]
+
+    stmt = dialect_insert(db, summary).values(**initial)
+    stmt = stmt.on_conflict_do_update(index_elements=[summary.doctor_id], set_=updates)
+    db.execute(stmt)
+
+
+def _summary_dict(doctor_id: int, summary) -> dict:
+    if summary is None:
+        return {"doctor_id": doctor_id, "count": 0, "average": None,
+                "histogram": {str(star): 0 for star in STAR_COLUMNS}}
+    return {
+        "doctor_id": doctor_id,
+        "count": summary.rating_count,
+        "average": summary.rating_avg,
+        "histogram": {str(star): getattr(summary, column) for star, column in STAR_COLUMNS.items()},
+    }
+
+
+def _own_rating(student_id: int, doctor_id: int) -> tuple:
+    return StdDrRate.student_id == student_id, StdDrRate.doctor_id == doctor_id
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=RatingResponse)
+async def create_rating(details: RatingCreate, db: Session = Depends(get_db), principal: Principal = Depends(_student_principal)):
+    result = await run_db(db, _create_rating, principal.subject_id, details)
+    # Ratings feed the recommendation score
+    doctor_catalog.mark_dirty(details.doctor_id)
+    return result
+
+
+def _create_rating(db: Session, student_id: int, details: RatingCreate):
+    if not db.query(Doctor.id).filter(Doctor.id == details.doctor_id).first():
+        raise HTTPException(status_code=404, detail="Doctor not found")
+
+    db.add(StdDrRate(student_id=student_id, doctor_id=details.doctor_id, rating=details.rating))
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="You already rated this doctor")
+
+    _apply_to_summary(db, details.doctor_id, 1, details.rating, {details.rating: 1})
+    db.commit()
+    return {"message": "success", "doctor_id": details.doctor_id, "rating": details.rating}
+
+
+@router.put("/{doctor_id}", response_model=RatingResponse)
+async def update_rating(doctor_id: int, details: RatingUpdate, db: Session = Depends(get_db), principal: Principal = Depends(_student_principal)):
+    result = await run_db(db, _update_rating, principal.subject_id, doctor_id, details)
+    doctor_catalog.mark_dirty(doctor_id)
+    return result
+
+
+def _update_rating(db: Session, student_id: int, doctor_id: int, details: RatingUpdate):
+    while True:
+        old_value = db.query(StdDrRate.rating).filter(*_own_rating(student_id, doctor_id)).scalar()
+        if old_value is None:
+            raise HTTPException(status_code=404, detail="Rating not found")
+        if old_value == details.rating:
+            break
+        # Compare-and-set: only the write that still sees `old_value` moves the summary
+        changed = db.execute(
+            update(StdDrRate)
+            .where(*_own_rating(student_id, doctor_id), StdDrRate.rating == old_value)
+            .values(rating=details.rating)
+            .returning(StdDrRate.id)
+        ).first()
+        if changed is not None:
+            _apply_to_summary(db, doctor_id, 0, details.rating - old_value, {old_value: -1, details.rating: 1})
+            db.commit()
+            break
+        # A concurrent write changed the rating first; start over from its value
+        db.rollback()
+    return {"message": "Rating updated", "doctor_id": doctor_id, "rating": details.rating}
+
+
+@router.delete("/{doctor_id}", response_model=RatingDeleteResponse)
+async def delete_rating(doctor_id: int, db: Session = Depends(get_db), principal: Principal = Depends(_student_principal)):
+    result = await run_db(db, _delete_rating, principal.subject_id, doctor_id)
+    doctor_catalog.mark_dirty(doctor_id)
+    return result
+
+
+def _delete_rating(db: Session, student_id: int, doctor_id: int):
+    # The deleted value comes back from the DELETE itself, so of two
+    # concurrent deletes only the one that removed the row moves the summary
+    old_value = db.execute(
+        delete(StdDrRate).where(*_own_rating(student_id, doctor_id)).returning(StdDrRate.rating)
+    ).scalar()
+    if old_value is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Rating not found")
+    _apply_to_summary(db, doctor_id, -1, -old_value, {old_value: -1})
+    db.commit()
+    return {"message": "Rating deleted", "doctor_id": doctor_id}
+
+
+@router.get("/doctor/{doctor_id}", response_model=RatingSummaryResponse)
+async def get_doctor_rating(doctor_id: int, db: Session = Depends(get_read_db)):
+    """
+    Precomputed rating count, average and 1-5 star histogram for a doctor.
+    """
+    summary = await run_db(
+        db, lambda session: session.query(
+            DoctorRatingSummary.rating_count,
+            DoctorRatingSummary.rating_avg,
+            *(getattr(DoctorRatingSummary, column) for column in STAR_COLUMNS.values()),
+        ).filter(DoctorRatingSummary.doctor_id == doctor_id).first()
+    )
+    return _summary_dict(doctor_id, summary)
+
+
+@router.get("/top", response_model=List[TopRatedDoctor])
+async def get_top_rated_doctors(
+    faculty: str,
+    min_count: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Highest average ratings in a faculty, read from the aggregate rows.
+    """
+    rows = await run_db(db, _top_rated_rows, faculty, min_count, limit)
+    return [
+        {
+            "doctor_id": row.doctor_id,
+            "average": row.rating_avg,
+            "count": row.rating_count,
+            "department": row.department,
+            "uni_name": row.uni_name,
+        }
+        for row in rows
+    ]
+
+
+def _top_rated_rows(db: Session, faculty: str, min_count: int, limit: int) -> list:
+    return db.query(
+        DoctorRatingSummary.doctor_id,
+        DoctorRatingSummary.rating_avg,
+        DoctorRatingSummary.rating_count,
+        DoctorInfo.department,
+        DoctorInfo.uni_name,
+    ).join(
+        DoctorInfo, DoctorInfo.doctor_id == DoctorRatingSummary.doctor_id
+    ).filter(
+        DoctorInfo.faculty == faculty,
+        DoctorRatingSummary.rating_count >= min_count,
+    ).order_by(
+        DoctorRatingSummary.rating_avg.desc(),
+        DoctorRatingSummary.rating_count.desc(),
+    ).limit(limit).all()
@@ -1,83 +1,220 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from ..database import get_db, Student, StudentInfo, StudentInfoCreate, StudentInfoUpdate ,  StudentGPA , StudentGPAResponse
+from sqlalchemy.orm.exc import StaleDataError
+from ..database import get_db, get_read_db, run_db, dialect_insert, is_foreign_key_violation, StudentInfo, StudentInfoCreate, StudentInfoUpdate ,  StudentGPA , StudentGPAResponse
+from ..database import StudentInfoResponse, StudentInfoEnvelope, StudentProfileCheck, StudentInfoBatchResponse, IdBatchRequest
+from ..auth import get_current_principal, require_owner, require_student, Principal
+from ..features import changes_features, insert_profile, invalidate_prediction, store_features
+from ..read_caches import student_profiles
+from ..conditional import (
+    ABSENT_ETAG, etag_matches, make_etag, not_modified, precondition_failed, require_match, set_validators,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/student-info", tags=["Student Info"])
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
-def create_student_info(details: StudentInfoCreate, db: Session = Depends(get_db)):
-    # Verify student exists
-    print(StudentInfo)
-    student = db.query(Student).filter(Student.id == details.student_id).first()
-    if not student:
-        raise HTTPException(status_code=404, detail="Student account not found")
-
-    # Prevent duplicate profiles
-    existing = db.query(StudentInfo).filter(StudentInfo.student_id == details.student_id).first()
-    if existing:
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=StudentInfoEnvelope)
+async def create_student_info(
+    details: StudentInfoCreate,
+    response: Response,
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(get_current_principal),
+):
+    require_owner(principal, "student", details.student_id)
+    created = await run_db(db, _create_student_info, details)
+    await student_profiles.invalidate(str(details.student_id))
+    set_validators(response, make_etag(created["data"]["id"], created["data"]["version"]), created["data"]["updated_at"])
+    return created
+
+def _create_student_info(db: Session, details: StudentInfoCreate):
+    # One INSERT ... ON CONFLICT DO NOTHING RETURNING: the FK rejects unknown
+    # students and the unique student_id turns a duplicate into "no row"
+    logger.debug("Creating student profile", extra={"student_id": details.student_id})
+    values = details.model_dump()
+    stmt = dialect_insert(db, StudentInfo).values(**values)
+    stmt = stmt.on_conflict_do_nothing(index_elements=[StudentInfo.student_id]).returning(*StudentInfo.__table__.c)
+    try:
+        # The feature row rides along (same statement on PostgreSQL)
+        created = insert_profile(db, stmt, values)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_foreign_key_violation(e):
+            raise HTTPException(status_code=404, detail="Student account not found")
+        raise HTTPException(status_code=400, detail="Invalid profile data")
+
+    if created is None:
         raise HTTPException(status_code=400, detail="Profile already exists for this student")
+    return {"message": "Profile created successfully", "data": dict(created._mapping)}
 
-    # FIX: Using .model_dump() instead of .dict()
-    new_info = StudentInfo(**details.model_dump())
-    db.add(new_info)
-    db.commit()
-    db.refresh(new_info)
-    return {"message": "Profile created successfully", "data": new_info}
+def _get_student_info_version(db: Session, student_id: int):
+    # Covered by the unique student_id index; no profile columns are read
+    return db.query(StudentInfo.id, StudentInfo.version, StudentInfo.updated_at).filter(
+        StudentInfo.student_id == student_id
+    ).first()
+
+@router.post("/check/batch", response_model=List[StudentProfileCheck])
+async def check_student_profiles(batch: IdBatchRequest, db: Session = Depends(get_read_db)):
+    """
+    Existence of many profiles with one IN query, in request order.
+    """
+    ids = list(dict.fromkeys(batch.ids))
+    found = await run_db(db, lambda session: dict(session.query(StudentInfo.student_id, StudentInfo.id).filter(
+        StudentInfo.student_id.in_(ids)
+    ).all()))
+    return [
+        {"exists": student_id in found, "student_id": student_id, "profile_id": found.get(student_id)}
+        for student_id in ids
+    ]
+
+@router.post("/batch", response_model=StudentInfoBatchResponse)
+async def get_student_profiles(batch: IdBatchRequest, db: Session = Depends(get_read_db)):
+    """
+    Profiles for many students with one IN query; unknown ids are listed in `missing`.
+    """
+    ids = list(dict.fromkeys(batch.ids))
+    rows = await run_db(db, lambda session: session.query(*StudentInfo.__table__.c).filter(
+        StudentInfo.student_id.in_(ids)
+    ).all())
+    by_student = {row.student_id: row._asdict() for row in rows}
+    return {
+        "profiles": [by_student[student_id] for student_id in ids if student_id in by_student],
+        "missing": [student_id for student_id in ids if student_id not in by_student],
+    }
+
+@router.get("/{student_id}", response_model=StudentInfoResponse)
+async def get_student_info(
+    student_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+    primary_db: Session = Depends(get_db),
+):
+    """
+    Profile with ETag / Last-Modified, served through the profile cache;
+    a matching If-None-Match is answered 304 without serializing the row.
+    Right after a write the profile is loaded from the primary, so a
+    lagging replica cannot re-cache the old row.
+    """
+    info = await student_profiles.get_or_load(
+        str(student_id),
+        lambda: run_db(db, _get_student_info, student_id),
+        primary_loader=lambda: run_db(primary_db, _get_student_info, student_id),
+    )
+    etag = make_etag(info["id"], info["version"])
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, info["updated_at"])
+    set_validators(response, etag, info["updated_at"])
+    return info
 
-@router.get("/{student_id}")
-def get_student_info(student_id: int, db: Session = Depends(get_db)):
-    info = db.query(StudentInfo).filter(StudentInfo.student_id == student_id).first()
+def _get_student_info(db: Session, student_id: int):
+    # Plain columns: no ORM instance or identity-map bookkeeping for a read
+    info = db.query(*StudentInfo.__table__.c).filter(StudentInfo.student_id == student_id).first()
     if not info:
         raise HTTPException(status_code=404, detail="Profile not found")
-    return info
+    return info._asdict()
+
+@router.put("/{student_id}", response_model=StudentInfoEnvelope)
+async def update_student_info(
+    student_id: int,
+    updates: StudentInfoUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(require_student),
+):
+    """
+    Partial update. Send the ETag from a previous read as If-Match to get
+    412 instead of overwriting someone else's change.
+    """
+    updated = await run_db(db, _update_student_info, student_id, updates, if_match, response)
+    await student_profiles.invalidate(str(student_id))
+    return updated
 
-@router.put("/{student_id}")
-def update_student_info(student_id: int, updates: StudentInfoUpdate, db: Session = Depends(get_db)):
+def _update_student_info(db: Session, student_id: int, updates: StudentInfoUpdate, if_match: Optional[str], response: Response):
     db_info = db.query(StudentInfo).filter(StudentInfo.student_id == student_id).first()
     if not db_info:
         raise HTTPException(status_code=404, detail="Profile not found")
+    require_match(if_match, make_etag(db_info.id, db_info.version))
 
     # Update only fields provided in the request body
     # FIX: Using .model_dump(exclude_unset=True) instead of .dict()
     update_data = updates.model_dump(exclude_unset=True)
+    features_changed = changes_features(db_info, update_data)
     for key, value in update_data.items():
         setattr(db_info, key, value)
 
+    # The new feature hash no longer matches the stored prediction's, which marks it stale
+    if features_changed:
+        store_features(db, [db_info])
+
+    try:
+        # The UPDATE matches on the version we checked above
+        db.flush()
+    except StaleDataError:
+        db.rollback()
+        # Lost the race to a concurrent update
+        raise precondition_failed()
+    # Captured before commit expires the instance, saving a refresh query
+    data = {column.name: getattr(db_info, column.name) for column in StudentInfo.__table__.c}
     db.commit()
-    db.refresh(db_info)
-    return {"message": "Profile updated successfully", "data": db_info}
+    if features_changed:
+        invalidate_prediction(student_id)
+    set_validators(response, make_etag(data["id"], data["version"]), data["updated_at"])
+    return {"message": "Profile updated successfully", "data": data}
 
-@router.get("/check/{student_id}")
-def check_student_profile_exists(student_id: int, db: Session = Depends(get_db)):
+@router.get("/check/{student_id}", response_model=StudentProfileCheck)
+async def check_student_profile_exists(
+    student_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+):
     """
     Checks if a record exists in StudentInfo for a given student_id.
     """
-    profile_exists = db.query(StudentInfo.id).filter(StudentInfo.student_id == student_id).first()
-    
-    if profile_exists:
-        return {
-            "exists": True, 
-            "student_id": student_id, 
-            "profile_id": profile_exists[0]
-        }
-    
+    current = await run_db(db, _get_student_info_version, student_id)
+    etag = make_etag(current.id, current.version) if current else ABSENT_ETAG
+    updated_at = current.updated_at if current else None
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, updated_at)
+    set_validators(response, etag, updated_at)
     return {
-        "exists": False, 
-        "student_id": student_id, 
-        "profile_id": None
+        "exists": current is not None,
+        "student_id": student_id,
+        "profile_id": current.id if current else None,
     }
 
-@router.get("/{student_id}", response_model=StudentGPAResponse)
-def get_student_gpa(student_id: int, db: Session = Depends(get_db)):
+@router.get("/{student_id}/gpa", response_model=StudentGPAResponse)
+async def get_student_gpa(
+    student_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
     """
     Fetch the predicted GPA for a specific student by their student_id.
     """
-    gpa_record = db.query(StudentGPA).filter(StudentGPA.student_id == student_id).first()
-    
+    gpa_record = await run_db(db, _get_student_gpa, student_id)
+    etag = make_etag(gpa_record["id"], gpa_record["version"])
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, gpa_record["updated_at"])
+    set_validators(response, etag, gpa_record["updated_at"])
+    return gpa_record
+
+def _get_student_gpa(db: Session, student_id: int):
+    gpa_record = db.query(
+        StudentGPA.id, StudentGPA.student_id, StudentGPA.predicted_gpa, StudentGPA.version, StudentGPA.updated_at
+    ).filter(StudentGPA.student_id == student_id).first()
+
     if not gpa_record:
         raise HTTPException(
             status_code=404, 
             detail=f"GPA record for student ID {student_id} not found"
         )
     
-    return gpa_record
\ No newline at end of file
+    return gpa_record._asdict()
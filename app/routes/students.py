@@ -1,52 +1,201 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from ..database import get_db, Student, get_password_hash, verify_password
+from typing import List, Literal, Optional
+import codecs
+import hmac
+import json
+import logging
+import os
+from ..database import (
+    get_db, get_read_db, run_db, sync_session, Student, StudentInfo, DoctorInfo,
+    RegisterResponse, StudentLoginResponse, ImportReportResponse, RecommendedDoctor,
+)
+from ..auth import issue_tokens
+from ..bulk_import import ImportReport, IMPORT_CHUNK_SIZE, prepare_chunk, insert_chunk, iter_records
+from ..hashing import hash_password, hash_passwords, check_password, needs_rehash, PasswordHasherBusy
+from ..read_caches import recommendations
+from ..recommendations import RECOMMENDATION_MAX_RESULTS, doctor_catalog, student_segment
+from .doctorInfo import _directory_entry, _directory_query
 
 router = APIRouter(prefix="/students", tags=["Students"])
 
+# Shared secret for the bulk import endpoint; unset disables it
+IMPORT_API_KEY = os.getenv("IMPORT_API_KEY")
+
+logger = logging.getLogger(__name__)
+
 # 1. REGISTER
-from ..database import get_db, Student, get_password_hash, verify_password, StudentCreate
+from ..database import get_db, Student, StudentCreate
 
-@router.post("/register")
-def register_student(details: StudentCreate, db: Session = Depends(get_db)):
-    # 1. Check if username OR email already existsfffyyt
-    print("me test staging")
-    existing_user = db.query(Student).filter(
+def _find_registered(db: Session, details: StudentCreate):
+    return db.query(Student.id).filter(
         (Student.username == details.username) | (Student.email == details.email)
     ).first()
-    
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Username or Email already registered")
 
-    hashed = get_password_hash(details.password)
-    
-    # 2. Add email to the new student object
+def _add_student(db: Session, details: StudentCreate, hashed: str) -> Student:
     new_std = Student(
-        username=details.username, 
-        email=details.email, 
+        username=details.username,
+        email=details.email,
         hashed_password=hashed
     )
-    
     db.add(new_std)
     db.commit()
     db.refresh(new_std)
+    return new_std
+
+def _set_password_hash(db: Session, user: Student, hashed: str) -> None:
+    user.hashed_password = hashed
+    db.commit()
+
+@router.post("/register", response_model=RegisterResponse)
+async def register_student(details: StudentCreate, db: Session = Depends(get_db)):
+    # 1. Check if username OR email already exists
+    # DB work goes through run_db and bcrypt through the hashing pool,
+    # so neither blocks the event loop
+    logger.debug("Student registration", extra={"username": details.username})
+    existing_user = await run_db(db, _find_registered, details)
+
+    if existing_user:
+        raise HTTPException(status_code=400, detail="Username or Email already registered")
+
+    hashed = await hash_password(details.password)
+
+    # 2. Add email to the new student object
+    new_std = await run_db(db, _add_student, details, hashed)
     return {"message": f"Student {details.username} created", "id": new_std.id}
 
 # 2. LOGIN
-@router.post("/login")
-def login_student(username: str, password: str, db: Session = Depends(get_db)):
+@router.post("/login", response_model=StudentLoginResponse)
+async def login_student(username: str, password: str, db: Session = Depends(get_db)):
     # Find user by username
-    user = db.query(Student).filter(Student.username == username).first()
-    
-    if not user or not verify_password(password, user.hashed_password):
+    user = await run_db(
+        db, lambda session: session.query(Student).filter(Student.username == username).first()
+    )
+
+    if not user or not await check_password(password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
         )
-    
+
+    # Upgrade hashes made with an outdated cost factor; best effort under load
+    if needs_rehash(user.hashed_password):
+        try:
+            await run_db(db, _set_password_hash, user, await hash_password(password))
+        except PasswordHasherBusy:
+            pass
+
     # ADD THE ID HERE
     return {
-        "message": "Login successful", 
+        "message": "Login successful",
         "username": user.username,
-        "id": user.id  # <--- THIS IS CRUCIAL
-    }
\ No newline at end of file
+        "id": user.id,  # <--- THIS IS CRUCIAL
+        **issue_tokens("student", user.id)
+    }
+
+# 3. BULK IMPORT
+async def _body_records(request: Request, fmt: str):
+    """
+    Decode the request body incrementally and yield one record (line) at a
+    time; CSV records with quoted newlines are re-joined as in csv_records.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pending = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            pending += line + "\n"
+            if fmt == "csv" and pending.count('"') % 2:
+                continue
+            yield pending
+            pending = ""
+    pending += buffer + decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+@router.post("/import", response_model=ImportReportResponse)
+async def import_students(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    x_import_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream a CSV (with header) or NDJSON body of accounts plus optional
+    profile fields, IMPORT_CHUNK_SIZE rows per batch insert.
+    Returns a per-row error report listing the first
+    IMPORT_MAX_REPORTED_ERRORS failures.
+    """
+    if not IMPORT_API_KEY or not x_import_key or not hmac.compare_digest(x_import_key, IMPORT_API_KEY):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Import not allowed")
+
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
+
+    report = ImportReport()
+    header = None
+    chunk = []
+    async for record in _body_records(request, format):
+        if format == "csv" and header is None:
+            header = record
+            continue
+        chunk.append(record)
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            await _import_records(db, chunk, format, header, report)
+            chunk = []
+    if chunk:
+        await _import_records(db, chunk, format, header, report)
+    return report.as_dict()
+
+async def _import_records(db: Session, lines: list, fmt: str, header: Optional[str], report: ImportReport):
+    if fmt == "csv":
+        lines = [header, *lines]
+    # Keep row numbers continuous across chunks
+    offset = report.rows
+    records = [(offset + row, record) for row, record in iter_records(lines, fmt)]
+    accepted = await run_db(db, prepare_chunk, records, report)
+    if accepted:
+        # Waiting on the bcrypt pool happens in a worker thread, not on the loop
+        hashes = await run_in_threadpool(hash_passwords, [account.password for _, account, _ in accepted])
+        await run_db(db, insert_chunk, accepted, hashes, report)
+
+# 4. RECOMMENDED DOCTORS
+@router.get("/{student_id}/recommended-doctors", response_model=List[RecommendedDoctor])
+async def get_recommended_doctors(
+    student_id: int,
+    limit: int = Query(10, ge=1, le=RECOMMENDATION_MAX_RESULTS),
+    db: Session = Depends(get_read_db),
+    primary_db: Session = Depends(get_db),
+):
+    """
+    Doctors ranked for the student by how well their university, faculty
+    and department match the student's profile, then by rating, price
+    and experience. Rankings are shared by students with the same
+    segment and cached until the doctor catalogue changes.
+    """
+    segment, version = await run_db(db, _recommendation_inputs, student_id, sync_session(primary_db))
+    ranked = await recommendations.get_or_load(
+        f"{version}:{json.dumps(segment)}",
+        lambda: run_in_threadpool(doctor_catalog.rank, segment),
+    )
+    return await run_db(db, _recommended_doctors, ranked[:limit])
+
+def _recommendation_inputs(db: Session, student_id: int, primary: Session):
+    profile = db.query(
+        StudentInfo.uni_name, StudentInfo.faculty, StudentInfo.department, StudentInfo.major
+    ).filter(StudentInfo.student_id == student_id).first()
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    # Doctors written since the last ranking are patched in from the primary
+    return student_segment(*profile), doctor_catalog.ensure_current(db, primary)
+
+def _recommended_doctors(db: Session, ranked: list):
+    if not ranked:
+        return []
+    rows = _directory_query(db).filter(DoctorInfo.doctor_id.in_([doctor_id for doctor_id, _ in ranked])).all()
+    by_doctor = {row.doctor_id: _directory_entry(row) for row in rows}
+    return [{**by_doctor[doctor_id], "score": score} for doctor_id, score in ranked if doctor_id in by_doctor]
@@ -0,0 +1,285 @@
+"""
+Doctor search over username, university, faculty and department.
+
+Terms are matched by trigram similarity, so prefixes and small typos still
+find the doctor. On PostgreSQL the pg_trgm GIN indexes from migration 6
+serve the query. Elsewhere (SQLite, tests) an in-process inverted index is
+built on the first search and kept current by marking doctors dirty on
+profile writes; each worker also rebuilds it every
+SEARCH_INDEX_REFRESH_SECONDS to pick up other workers' writes.
+"""
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, literal, or_
+from sqlalchemy.orm import Session
+
+from .database import Doctor, DoctorInfo
+
+# "auto" uses pg_trgm on PostgreSQL and the in-process index otherwise
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto").lower()
+# Share of the query's trigrams a field must contain to match
+SEARCH_MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE", "0.5"))
+# 0 keeps the in-process index until restart (writes still update it)
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "300"))
+
+SEARCH_COLUMNS = (Doctor.username, DoctorInfo.uni_name, DoctorInfo.faculty, DoctorInfo.department)
+
+# pg_trgm splits words on anything that is not a letter or digit
+_WORD = re.compile(r"[^\W_]+")
+
+
+def trigrams(text: Optional[str]) -> frozenset:
+    """Lowercased trigrams of each word, padded like pg_trgm ("  w", " wo", ..., "rd ")."""
+    grams = set()
+    for word in _WORD.findall((text or "").lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def _start_year_bounds(min_experience: Optional[int], max_experience: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+    # Experience is stored as the start year, so bounds flip
+    current_year = date.today().year
+    earliest = current_year - max_experience if max_experience is not None else None
+    latest = current_year - min_experience if min_experience is not None else None
+    return earliest, latest
+
+
+def _within(value, low, high) -> bool:
+    if low is None and high is None:
+        return True
+    if value is None:
+        return False
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+class _Entry:
+    __slots__ = ("values", "price", "start_year")
+
+    def __init__(self, row):
+        # Lowercased field texts; identical texts share one indexed value
+        self.values = {(getattr(row, column.key) or "").lower() for column in SEARCH_COLUMNS} - {""}
+        self.price = row.price_per_hour
+        self.start_year = row.start_teaching_year
+
+
+class _IndexData:
+    """
+    Distinct field values with trigram postings, and the doctors holding
+    each value. Faculties, departments and universities repeat across
+    doctors, so most queries only score a small vocabulary.
+    """
+
+    def __init__(self):
+        self.entries: Dict[int, _Entry] = {}
+        self.doctors_by_value: Dict[str, set] = {}
+        self.postings: Dict[str, set] = {}
+
+    def add(self, doctor_id: int, entry: _Entry) -> None:
+        self.entries[doctor_id] = entry
+        for value in entry.values:
+            doctors = self.doctors_by_value.get(value)
+            if doctors is None:
+                doctors = self.doctors_by_value[value] = set()
+                for gram in trigrams(value):
+                    self.postings.setdefault(gram, set()).add(value)
+            doctors.add(doctor_id)
+
+    def remove(self, doctor_id: int) -> None:
+        entry = self.entries.pop(doctor_id, None)
+        if entry is None:
+            return
+        for value in entry.values:
+            doctors = self.doctors_by_value[value]
+            doctors.discard(doctor_id)
+            if doctors:
+                continue
+            del self.doctors_by_value[value]
+            for gram in trigrams(value):
+                values = self.postings[gram]
+                values.discard(value)
+                if not values:
+                    del self.postings[gram]
+
+
+class DoctorSearchIndex:
+    """
+    In-process trigram index. A query counts shared trigrams per indexed
+    value from the postings, scores each value by the share of the query's
+    trigrams it contains, and ranks doctors by their best-scoring field.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Serializes rebuilds so concurrent first searches load the table once
+        self._build_lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data = _IndexData()
+            self._dirty: set = set()
+            self._built_at: Optional[float] = None
+
+    def mark_dirty(self, doctor_id: int) -> None:
+        """Re-read this doctor on the next search."""
+        with self._lock:
+            self._dirty.add(doctor_id)
+
+    def _stale(self) -> bool:
+        return self._built_at is None or (
+            SEARCH_INDEX_REFRESH_SECONDS > 0 and time.monotonic() - self._built_at >= SEARCH_INDEX_REFRESH_SECONDS
+        )
+
+    def ensure_current(self, db: Session, primary: Optional[Session] = None) -> None:
+        """
+        Build the index if missing or expired, then re-read dirty doctors.
+        Dirty doctors were just written, so when `db` is a replica session
+        they are read through `primary`; a rebuild keeps them marked, as a
+        lagging replica may still hold their old rows.
+        """
+        with self._lock:
+            stale = self._stale()
+        if stale:
+            with self._build_lock:
+                with self._lock:
+                    stale = self._stale()
+                if stale:
+                    data = _IndexData()
+                    for row in _index_query(db).yield_per(1000):
+                        data.add(row.doctor_id, _Entry(row))
+                    with self._lock:
+                        self._data = data
+                        self._built_at = time.monotonic()
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        rows = _index_query(primary if primary is not None else db).filter(DoctorInfo.doctor_id.in_(dirty)).all()
+        with self._lock:
+            for doctor_id in dirty:
+                self._data.remove(doctor_id)
+            for row in rows:
+                self._data.add(row.doctor_id, _Entry(row))
+
+    def search(
+        self,
+        query: str,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        earliest_start: Optional[int] = None,
+        latest_start: Optional[int] = None,
+        limit: int = 20,
+    ) -> List[Tuple[int, float]]:
+        """(doctor_id, score) pairs, best first, ties by doctor id."""
+        grams = trigrams(query)
+        if not grams:
+            return []
+        needed = math.ceil(SEARCH_MIN_SCORE * len(grams))
+        with self._lock:
+            data = self._data
+            shared = Counter()
+            for gram in grams:
+                shared.update(data.postings.get(gram, ()))
+            best: Dict[int, int] = {}
+            for value, count in shared.items():
+                if count < needed:
+                    continue
+                for doctor_id in data.doctors_by_value[value]:
+                    if count > best.get(doctor_id, 0):
+                        best[doctor_id] = count
+
+            filtered = (
+                min_price is not None or max_price is not None
+                or earliest_start is not None or latest_start is not None
+            )
+            matches = []
+            for doctor_id, count in best.items():
+                if filtered:
+                    entry = data.entries[doctor_id]
+                    if not (_within(entry.price, min_price, max_price)
+                            and _within(entry.start_year, earliest_start, latest_start)):
+                        continue
+                matches.append((-count, doctor_id))
+        return [(doctor_id, round(-negative / len(grams), 4)) for negative, doctor_id in heapq.nsmallest(limit, matches)]
+
+    def __len__(self) -> int:
+        return len(self._data.entries)
+
+
+doctor_search = DoctorSearchIndex()
+
+
+def _index_query(db: Session):
+    return db.query(
+        DoctorInfo.doctor_id,
+        *SEARCH_COLUMNS,
+        Doctor.price_per_hour,
+        DoctorInfo.start_teaching_year,
+    ).join(Doctor, Doctor.id == DoctorInfo.doctor_id)
+
+
+def _uses_postgres(db: Session) -> bool:
+    if SEARCH_BACKEND == "auto":
+        return db.get_bind().dialect.name == "postgresql"
+    return SEARCH_BACKEND == "postgres"
+
+
+def _search_postgres(
+    db: Session,
+    query: str,
+    min_price: Optional[float],
+    max_price: Optional[float],
+    earliest_start: Optional[int],
+    latest_start: Optional[int],
+    limit: int,
+) -> List[Tuple[int, float]]:
+    # `<%` is the indexable form of word_similarity() >= threshold
+    db.execute(func.set_config("pg_trgm.word_similarity_threshold", str(SEARCH_MIN_SCORE), True).select())
+    term = literal(query)
+    score = func.greatest(*(func.word_similarity(term, func.coalesce(column, "")) for column in SEARCH_COLUMNS))
+    rows = db.query(DoctorInfo.doctor_id, score.label("score")).join(
+        Doctor, Doctor.id == DoctorInfo.doctor_id
+    ).filter(or_(*(term.op("<%")(column) for column in SEARCH_COLUMNS)))
+
+    if min_price is not None:
+        rows = rows.filter(Doctor.price_per_hour >= min_price)
+    if max_price is not None:
+        rows = rows.filter(Doctor.price_per_hour <= max_price)
+    if earliest_start is not None:
+        rows = rows.filter(DoctorInfo.start_teaching_year >= earliest_start)
+    if latest_start is not None:
+        rows = rows.filter(DoctorInfo.start_teaching_year <= latest_start)
+
+    rows = rows.order_by(score.desc(), DoctorInfo.doctor_id).limit(limit).all()
+    return [(row.doctor_id, round(float(row.score), 4)) for row in rows]
+
+
+def search_doctors(
+    db: Session,
+    query: str,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_experience: Optional[int] = None,
+    max_experience: Optional[int] = None,
+    limit: int = 20,
+    primary: Optional[Session] = None,
+) -> List[Tuple[int, float]]:
+    """
+    Ranked (doctor_id, score) matches for `query` within the filters.
+    Pass `primary` when `db` may be a replica (see DoctorSearchIndex.ensure_current).
+    """
+    earliest_start, latest_start = _start_year_bounds(min_experience, max_experience)
+    if _uses_postgres(db):
+        return _search_postgres(db, query, min_price, max_price, earliest_start, latest_start, limit)
+    doctor_search.ensure_current(db, primary)
+    return doctor_search.search(query, min_price, max_price, earliest_start, latest_start, limit)
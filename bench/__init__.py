@@ -0,0 +1,10 @@
+"""
+Load-test and benchmark suite.
+
+    python -m bench.run --students 2000 --doctors 200 --duration 30 --output results.json
+    python -m bench.compare baseline.json results.json
+
+See bench/run.py for options. The suite seeds the database named by
+DATABASE_URL (default sqlite:///./bench.db) and replaces the ML container
+with bench/ml_stub.py unless ML_CONTAINER_URL is already set.
+"""
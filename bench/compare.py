@@ -0,0 +1,56 @@
+"""
+Compare two bench.run result files endpoint by endpoint.
+
+    python -m bench.compare baseline.json candidate.json --threshold 0.10
+
+Exits with status 1 when any endpoint's p95 latency grew, or its
+throughput dropped, by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def _change(old: float, new: float) -> float:
+    return (new - old) / old if old else 0.0
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> list:
+    """Return (endpoint, metric, old, new, relative change, regressed) rows."""
+    rows = []
+    names = sorted(set(baseline["endpoints"]) | set(candidate["endpoints"]))
+    for name in names + ["total"]:
+        old = baseline["total"] if name == "total" else baseline["endpoints"].get(name)
+        new = candidate["total"] if name == "total" else candidate["endpoints"].get(name)
+        if old is None or new is None:
+            continue
+        for metric, worse_if_higher in (("p95_ms", True), ("p99_ms", True), ("throughput_rps", False)):
+            change = _change(old[metric], new[metric])
+            regressed = change > threshold if worse_if_higher else change < -threshold
+            rows.append((name, metric, old[metric], new[metric], change, regressed))
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative change")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"baseline {baseline['meta'].get('commit')}  candidate {candidate['meta'].get('commit')}")
+    regressions = 0
+    for name, metric, old, new, change, regressed in compare(baseline, candidate, args.threshold):
+        regressions += regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<16} {metric:<15} {old:>10} -> {new:>10}  {change:+.1%}{flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
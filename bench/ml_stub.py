@@ -0,0 +1,101 @@
+"""
+Local stand-in for the ML container with configurable latency.
+
+    python -m bench.ml_stub --port 8081 --latency-ms 40 --jitter-ms 10
+
+POST /predict answers {"predicted_gpa": ...} derived from study_hours, so
+results are deterministic for the same input.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.requests = 0
+
+
+def _predicted_gpa(features: dict) -> float:
+    study_hours = float(features.get("study_hours") or 0.0)
+    return round(min(4.0, 2.0 + study_hours / 20), 2)
+
+
+def _make_handler(config: StubConfig):
+    class PredictHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length)
+            config.requests += 1
+            if self.path != "/predict":
+                self._reply(404, {"detail": "Not found"})
+                return
+
+            delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+            if delay > 0:
+                time.sleep(delay / 1000)
+            if config.error_rate and random.random() < config.error_rate:
+                self._reply(500, {"detail": "Injected failure"})
+                return
+            try:
+                features = json.loads(body)
+            except ValueError:
+                self._reply(400, {"detail": "Invalid JSON"})
+                return
+            self._reply(200, {"predicted_gpa": _predicted_gpa(features)})
+
+        def _reply(self, status: int, payload: dict):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # One line per request would dominate benchmark output
+
+    return PredictHandler
+
+
+def start_stub(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve the stub from a daemon thread; port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), _make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stub_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Stub ML prediction service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(config))
+    server.daemon_threads = True
+    print(f"ML stub listening on {stub_url(server)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
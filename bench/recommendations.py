@@ -0,0 +1,119 @@
+"""
+Micro-benchmark of recommendation scoring over synthetic catalogues.
+
+    python -m bench.recommendations --sizes 10000 50000 100000
+
+For each catalogue size, times building the NumPy arrays, ranking one
+student segment against every doctor (vectorized, as the endpoint does on
+a cache miss), patching one doctor in place, and the per-doctor Python
+loop the arrays replace.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from collections import namedtuple
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.recommendations import MATCH_WEIGHTS, build_arrays, doctor_catalog, quality, student_segment
+
+from .seed import FACULTIES, UNIVERSITIES
+
+CatalogRow = namedtuple(
+    "CatalogRow",
+    "doctor_id uni_name faculty department start_teaching_year price_per_hour rating_avg rating_count",
+)
+
+
+def synthetic_rows(size: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    rows = []
+    for doctor_id in range(1, size + 1):
+        faculty = rng.choice(tuple(FACULTIES))
+        count = rng.randrange(0, 40)
+        rows.append(CatalogRow(
+            doctor_id, rng.choice(UNIVERSITIES), faculty, rng.choice(FACULTIES[faculty]),
+            rng.randrange(1985, 2024), round(rng.uniform(10, 90), 2),
+            round(rng.uniform(1, 5), 2) if count else None, count,
+        ))
+    return rows
+
+
+def python_loop_rank(rows: list, segment: tuple, limit: int, current_year: int) -> list:
+    uni_name, faculty, department, major = segment
+    scored = []
+    for row in rows:
+        score = float(quality(
+            float("nan") if row.price_per_hour is None else row.price_per_hour,
+            float("nan") if row.start_teaching_year is None else row.start_teaching_year,
+            float("nan") if row.rating_avg is None else row.rating_avg,
+            float(row.rating_count), current_year,
+        ))
+        score += MATCH_WEIGHTS["uni_name"] * ((row.uni_name or "").lower() == uni_name)
+        score += MATCH_WEIGHTS["faculty"] * ((row.faculty or "").lower() == faculty)
+        score += MATCH_WEIGHTS["department"] * ((row.department or "").lower() == department)
+        score += MATCH_WEIGHTS["major"] * ((row.department or "").lower() == major)
+        scored.append((-score, row.doctor_id))
+    scored.sort()
+    return [doctor_id for _, doctor_id in scored[:limit]]
+
+
+def _best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def measure(size: int, repeat: int, current_year: int = 2025) -> dict:
+    rows = synthetic_rows(size)
+    segment = student_segment("LU", "Engineering", "Computer", "Computer")
+
+    started = time.perf_counter()
+    arrays = build_arrays(rows, current_year)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    doctor_catalog.clear()
+    doctor_catalog._arrays = arrays
+    vectorized = doctor_catalog.rank(segment)
+    looped = python_loop_rank(rows, segment, len(vectorized), current_year)
+    assert [doctor_id for doctor_id, _ in vectorized] == looped, "vectorized and loop rankings differ"
+
+    changed = rows[size // 2]._replace(department="Civil", price_per_hour=15.0)
+    return {
+        "doctors": size,
+        "build_ms": round(build_ms, 2),
+        "rank_ms": round(_best_ms(lambda: doctor_catalog.rank(segment), repeat), 3),
+        "upsert_ms": round(_best_ms(lambda: arrays.upsert(changed, current_year), repeat), 4),
+        "python_loop_ms": round(_best_ms(lambda: python_loop_rank(rows, segment, 100, current_year), 1), 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure recommendation scoring cost")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        result = measure(size, args.repeat)
+        results.append(result)
+        print(
+            f"{size:>7} doctors  build {result['build_ms']:9.2f} ms  rank {result['rank_ms']:8.3f} ms  "
+            f"upsert {result['upsert_ms']:7.4f} ms  python loop {result['python_loop_ms']:9.1f} ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
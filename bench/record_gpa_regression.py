@@ -0,0 +1,94 @@
+"""
+Record the local model's scores for the GPA regression fixture.
+
+    python -m bench.record_gpa_regression --model test/fixtures/gpa_model.json
+
+Builds deterministic student inputs with build_ml_input (the same payload
+/ml/predict-gpa sends), scores them with app.local_model and writes the
+inputs, the scores and the artifact path to --output. The test then pins
+local_model scoring against it; a change in encoding or defaults shows up
+as a fixture diff.
+
+This is not a parity check: the example artifact is hand-written. To see
+how far an exported artifact is from the container it ships with, pass
+--compare with the container's URL; the largest difference is printed and
+nothing is written.
+"""
+import argparse
+import json
+import os
+import random
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import httpx
+import numpy as np
+
+from app.database import StudentInfo
+from app.features import build_ml_input
+from app.local_model import LinearGPAModel
+
+from .seed import _student_profile
+
+# Profile fields blanked in some cases so the defaults are covered too
+OPTIONAL_FIELDS = ("dob", "study_hours", "academic_year", "gender", "athletic_status")
+
+
+def regression_inputs(count: int, seed_value: int = 7) -> list:
+    rng = random.Random(seed_value)
+    inputs = []
+    for student_id in range(1, count + 1):
+        profile = _student_profile(rng, student_id)
+        if student_id % 5 == 0:
+            profile[rng.choice(OPTIONAL_FIELDS)] = None
+        inputs.append(build_ml_input(StudentInfo(**profile)))
+    return inputs
+
+
+def compare(model: LinearGPAModel, inputs: list, container: str) -> float:
+    with httpx.Client(base_url=container, timeout=10.0) as client:
+        expected = []
+        for ml_input in inputs:
+            response = client.post("/predict", json=ml_input)
+            response.raise_for_status()
+            expected.append(response.json()["predicted_gpa"])
+    return float(np.abs(model.predict(inputs) - np.array(expected)).max())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Record local model scores for the regression fixture")
+    parser.add_argument("--model", default="test/fixtures/gpa_model.json", help="Linear model artifact to score with")
+    parser.add_argument("--count", type=int, default=40)
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    parser.add_argument("--output", default="test/fixtures/gpa_regression.json")
+    parser.add_argument("--compare", metavar="URL", help="Report the largest difference from this ML container instead")
+    args = parser.parse_args(argv)
+
+    model = LinearGPAModel.load(args.model)
+    inputs = regression_inputs(args.count)
+    if args.compare:
+        print(f"Largest difference from {args.compare}: {compare(model, inputs, args.compare):.6f}")
+        return 0
+
+    cases = [
+        {"input": ml_input, "predicted_gpa": round(float(score), 6)}
+        for ml_input, score in zip(inputs, model.predict(inputs))
+    ]
+    header = {
+        "model": os.path.relpath(args.model, os.path.dirname(args.output) or "."),
+        "tolerance": args.tolerance,
+    }
+    with open(args.output, "w") as f:
+        # One case per line keeps re-recorded fixtures reviewable as diffs
+        f.write("{\n")
+        for key, value in header.items():
+            f.write(f" {json.dumps(key)}: {json.dumps(value)},\n")
+        f.write(' "cases": [\n')
+        f.write(",\n".join(f"  {json.dumps(case)}" for case in cases))
+        f.write("\n ]\n}\n")
+    print(f"Recorded {len(cases)} local model scores to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,328 @@
+"""
+Run a mixed workload against the API and write per-endpoint throughput and
+latency percentiles as JSON.
+
+    python -m bench.run --duration 30 --concurrency 32 --output results.json
+    python -m bench.run --target http://localhost:8000 --mix read-heavy
+
+Without --target the app is served in-process through httpx's ASGI
+transport (one worker, client and server share the event loop); with
+--target an already running deployment is measured and DATABASE_URL must
+point at its database so seeding and id lookups hit the same data.
+ML_CONTAINER_URL defaults to a local stub started with --ml-latency-ms.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import httpx
+
+from .ml_stub import StubConfig, start_stub, stub_url
+from .seed import BENCH_PASSWORD, STUDENT_PREFIX
+
+# Relative operation weights; each worker draws from these per request
+MIXES: Dict[str, Dict[str, int]] = {
+    "default": {
+        "register": 1, "login": 4, "profile_read": 25, "profile_update": 5,
+        "doctor_filter": 25, "doctor_search": 10, "doctor_rating": 15, "top_rated": 5, "predict_gpa": 20,
+    },
+    "read-heavy": {"profile_read": 40, "doctor_filter": 30, "doctor_search": 10, "doctor_rating": 15, "top_rated": 5},
+    "auth": {"register": 1, "login": 9},
+    "predict": {"predict_gpa": 1},
+}
+
+# Logged-in students whose tokens are reused by authenticated operations
+TOKEN_POOL_SIZE = 50
+
+
+class Context:
+    def __init__(self, client: httpx.AsyncClient, student_ids: List[int], doctor_ids: List[int], faculties, run_id: str):
+        self.client = client
+        self.student_ids = student_ids
+        self.doctor_ids = doctor_ids
+        self.faculties = faculties
+        self.tokens: Dict[int, str] = {}
+        self.run_id = run_id
+        self.counter = itertools.count()
+
+
+# --- OPERATIONS ---
+# Each returns the response; expected statuses are listed in EXPECTED
+
+async def op_register(ctx: Context, rng: random.Random):
+    n = next(ctx.counter)
+    return await ctx.client.post("/students/register", json={
+        "username": f"bench_new_{ctx.run_id}_{n}",
+        "email": f"new{n}.{ctx.run_id}@bench.example.com",
+        "password": BENCH_PASSWORD,
+    })
+
+
+async def op_login(ctx: Context, rng: random.Random):
+    index = rng.randrange(len(ctx.student_ids))
+    return await ctx.client.post(
+        "/students/login", params={"username": f"{STUDENT_PREFIX}{index}", "password": BENCH_PASSWORD}
+    )
+
+
+async def op_profile_read(ctx: Context, rng: random.Random):
+    return await ctx.client.get(f"/student-info/{rng.choice(ctx.student_ids)}")
+
+
+async def op_profile_update(ctx: Context, rng: random.Random):
+    student_id, token = rng.choice(list(ctx.tokens.items()))
+    return await ctx.client.put(
+        f"/student-info/{student_id}",
+        json={"study_hours": round(rng.uniform(2, 40), 1)},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+
+async def op_doctor_filter(ctx: Context, rng: random.Random):
+    params = {"faculty": rng.choice(ctx.faculties), "sort": rng.choice(("id", "price", "experience")), "limit": 20}
+    if rng.random() < 0.5:
+        params["max_price"] = rng.choice((30, 50, 80))
+    return await ctx.client.get("/doctor-info/filter/", params=params)
+
+
+async def op_doctor_search(ctx: Context, rng: random.Random):
+    # Prefixes and single-letter typos of faculty names
+    term = rng.choice(ctx.faculties).lower()
+    if rng.random() < 0.5:
+        term = term[:max(3, len(term) // 2)]
+    else:
+        drop = rng.randrange(1, len(term))
+        term = term[:drop] + term[drop + 1:]
+    return await ctx.client.get("/doctors/search", params={"q": term, "limit": 20})
+
+
+async def op_doctor_rating(ctx: Context, rng: random.Random):
+    return await ctx.client.get(f"/ratings/doctor/{rng.choice(ctx.doctor_ids)}")
+
+
+async def op_top_rated(ctx: Context, rng: random.Random):
+    return await ctx.client.get("/ratings/top", params={"faculty": rng.choice(ctx.faculties), "limit": 10})
+
+
+async def op_predict_gpa(ctx: Context, rng: random.Random):
+    student_id, token = rng.choice(list(ctx.tokens.items()))
+    return await ctx.client.post(
+        f"/ml/predict-gpa/{student_id}",
+        params={"force": "true"} if rng.random() < 0.2 else None,
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+
+OPERATIONS = {
+    "register": op_register,
+    "login": op_login,
+    "profile_read": op_profile_read,
+    "profile_update": op_profile_update,
+    "doctor_filter": op_doctor_filter,
+    "doctor_search": op_doctor_search,
+    "doctor_rating": op_doctor_rating,
+    "top_rated": op_top_rated,
+    "predict_gpa": op_predict_gpa,
+}
+
+EXPECTED = {"register": {200}, "profile_update": {200}}
+
+
+# --- MEASUREMENT ---
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.errors: Dict[str, int] = {}
+        self.recording = False
+
+    def record(self, name: str, seconds: float, status: str, ok: bool) -> None:
+        if not self.recording:
+            return
+        self.samples.setdefault(name, []).append(seconds)
+        statuses = self.statuses.setdefault(name, {})
+        statuses[status] = statuses.get(status, 0) + 1
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples: List[float], errors: int, elapsed: float) -> dict:
+    values = sorted(samples)
+    to_ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": to_ms(sum(values) / len(values)) if values else 0.0,
+        "p50_ms": to_ms(percentile(values, 0.50)),
+        "p90_ms": to_ms(percentile(values, 0.90)),
+        "p95_ms": to_ms(percentile(values, 0.95)),
+        "p99_ms": to_ms(percentile(values, 0.99)),
+        "max_ms": to_ms(values[-1]) if values else 0.0,
+    }
+
+
+async def worker(ctx: Context, recorder: Recorder, mix: Dict[str, int], rng: random.Random, deadline: float) -> None:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            response = await OPERATIONS[name](ctx, rng)
+            status = str(response.status_code)
+            ok = response.status_code in EXPECTED.get(name, {200})
+        except httpx.HTTPError as e:
+            status, ok = type(e).__name__, False
+        recorder.record(name, time.perf_counter() - started, status, ok)
+
+
+async def login_pool(ctx: Context, size: int) -> None:
+    for index in range(min(size, len(ctx.student_ids))):
+        response = await ctx.client.post(
+            "/students/login", params={"username": f"{STUDENT_PREFIX}{index}", "password": BENCH_PASSWORD}
+        )
+        response.raise_for_status()
+        ctx.tokens[response.json()["id"]] = response.json()["access_token"]
+
+
+async def run_workload(client: httpx.AsyncClient, seeded, args, mix: Dict[str, int]) -> dict:
+    ctx = Context(client, seeded.student_ids, seeded.doctor_ids, seeded.faculties, run_id=f"{int(time.time())}")
+    await login_pool(ctx, TOKEN_POOL_SIZE)
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    deadline = start + args.warmup + args.duration
+    tasks = [
+        asyncio.create_task(worker(ctx, recorder, mix, random.Random(args.seed * 1000 + n), deadline))
+        for n in range(args.concurrency)
+    ]
+    await asyncio.sleep(args.warmup)
+    recorder.recording = True
+    measured_from = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - measured_from
+
+    endpoints = {}
+    for name in sorted(recorder.samples):
+        endpoints[name] = summarize(recorder.samples[name], recorder.errors.get(name, 0), elapsed)
+        endpoints[name]["statuses"] = recorder.statuses[name]
+    all_samples = [value for values in recorder.samples.values() for value in values]
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "total": summarize(all_samples, sum(recorder.errors.values()), elapsed),
+        "endpoints": endpoints,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _run(args, mix: Dict[str, int]) -> dict:
+    from app.database import SessionLocal, engine
+    from app.migrations import upgrade
+    from .seed import seed
+
+    upgrade(engine)
+    db = SessionLocal()
+    try:
+        seeded = seed(db, args.students, args.doctors, args.ratings_per_student, args.seed)
+    finally:
+        db.close()
+
+    timeout = httpx.Timeout(60.0)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if args.target:
+        async with httpx.AsyncClient(base_url=args.target, timeout=timeout, limits=limits) as client:
+            return await run_workload(client, seeded, args, mix)
+
+    from app.main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+            return await run_workload(client, seeded, args, mix)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the tutoring API")
+    parser.add_argument("--target", help="Base URL of a running server; default serves the app in-process")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--doctors", type=int, default=100)
+    parser.add_argument("--ratings-per-student", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before recording")
+    parser.add_argument("--ml-latency-ms", type=float, default=40.0)
+    parser.add_argument("--ml-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--ml-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench-results.json")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+    # Per-request app logs would compete with the workload for the CPU
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Every simulated user logs in from the same client address
+    os.environ.setdefault("LOGIN_RATE_LIMIT", "0")
+    stub_config = None
+    if not os.getenv("ML_CONTAINER_URL"):
+        stub_config = StubConfig(args.ml_latency_ms, args.ml_jitter_ms, args.ml_error_rate)
+        # Must be set before app.ml_client is imported
+        os.environ["ML_CONTAINER_URL"] = stub_url(start_stub(stub_config))
+
+    mix = MIXES[args.mix]
+    results = asyncio.run(_run(args, mix))
+
+    from app.database import engine
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "target": args.target or "in-process",
+            "database": engine.dialect.name,
+            "ml_container_url": os.environ["ML_CONTAINER_URL"],
+            "ml_stub_requests": stub_config.requests if stub_config else None,
+            "config": {**vars(args), "mix_weights": mix},
+        },
+        **results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    total = results["total"]
+    print(f"{total['requests']} requests, {total['throughput_rps']} req/s, "
+          f"p95 {total['p95_ms']} ms, {total['errors']} errors -> {args.output}")
+    for name, stats in results["endpoints"].items():
+        print(f"  {name:<16} {stats['throughput_rps']:>9} req/s  p50 {stats['p50_ms']:>8} ms  "
+              f"p99 {stats['p99_ms']:>8} ms  errors {stats['errors']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
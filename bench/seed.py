@@ -0,0 +1,157 @@
+"""
+Deterministic benchmark dataset: students with profiles, doctors with
+profiles, and ratings with their per-doctor summaries.
+
+    python -m bench.seed --students 2000 --doctors 200 --ratings-per-student 3
+
+Accounts are named bench_student_<n> / bench_doctor_<n> and share
+BENCH_PASSWORD. Seeding is additive: rerunning with larger counts only
+inserts the missing rows, so one database can serve repeated runs.
+"""
+import argparse
+import random
+from typing import List
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+STUDENT_PREFIX = "bench_student_"
+DOCTOR_PREFIX = "bench_doctor_"
+BENCH_PASSWORD = "bench-password"
+
+UNIVERSITIES = ("LU", "AUB", "LAU", "USJ")
+FACULTIES = {
+    "Engineering": ("Computer", "Civil", "Mechanical"),
+    "Science": ("Mathematics", "Physics", "Biology"),
+    "Business": ("Finance", "Marketing"),
+}
+COUNTRIES = ("Lebanon", "Syria", "Jordan", "France")
+LANGUAGES = ("Arabic", "English", "French")
+
+
+class SeedResult:
+    def __init__(self, student_ids: List[int], doctor_ids: List[int]):
+        self.student_ids = student_ids
+        self.doctor_ids = doctor_ids
+        self.faculties = tuple(FACULTIES)
+
+
+def _student_profile(rng: random.Random, student_id: int) -> dict:
+    faculty = rng.choice(tuple(FACULTIES))
+    department = rng.choice(FACULTIES[faculty])
+    return {
+        "student_id": student_id,
+        "first_name": f"First{student_id}",
+        "last_name": f"Last{student_id}",
+        "uni_name": rng.choice(UNIVERSITIES),
+        "faculty": faculty,
+        "department": department,
+        "major": department,
+        "dob": f"{rng.randint(1998, 2006)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "academic_year": rng.randint(1, 5),
+        "disability": rng.random() < 0.05,
+        "athletic_status": rng.choice(("none", "amateur", "varsity")),
+        "country_of_origin": rng.choice(COUNTRIES),
+        "country_of_residence": rng.choice(COUNTRIES),
+        "gender": rng.choice(("male", "female")),
+        "primary_language": rng.choice(LANGUAGES),
+        "study_hours": round(rng.uniform(2, 40), 1),
+    }
+
+
+def _doctor_profile(rng: random.Random, doctor_id: int) -> dict:
+    faculty = rng.choice(tuple(FACULTIES))
+    return {
+        "doctor_id": doctor_id,
+        "uni_name": rng.choice(UNIVERSITIES),
+        "faculty": faculty,
+        "department": rng.choice(FACULTIES[faculty]),
+        "start_teaching_year": rng.randint(1990, 2023),
+    }
+
+
+def _existing(db: Session, model, prefix: str) -> dict:
+    rows = db.query(model.username, model.id).filter(model.username.like(f"{prefix}%")).all()
+    return dict(rows)
+
+
+def seed(db: Session, students: int, doctors: int, ratings_per_student: int = 3, seed_value: int = 1) -> SeedResult:
+    from app.database import (
+        Doctor, DoctorInfo, StdDrRate, Student, StudentInfo, get_password_hash,
+    )
+    from app.routes.ratings import _apply_to_summary
+
+    rng = random.Random(seed_value)
+    # One bcrypt hash shared by every seeded account keeps seeding fast
+    # while logins still pay the production cost factor
+    hashed = get_password_hash(BENCH_PASSWORD)
+
+    existing_doctors = _existing(db, Doctor, DOCTOR_PREFIX)
+    missing = [n for n in range(doctors) if f"{DOCTOR_PREFIX}{n}" not in existing_doctors]
+    if missing:
+        new_ids = db.execute(
+            insert(Doctor).returning(Doctor.id, sort_by_parameter_order=True),
+            [
+                {"username": f"{DOCTOR_PREFIX}{n}", "hashed_password": hashed,
+                 "contact": f"doctor{n}@bench.example.com", "price_per_hour": float(rng.randint(10, 80))}
+                for n in missing
+            ],
+        ).scalars().all()
+        db.execute(insert(DoctorInfo), [_doctor_profile(rng, doctor_id) for doctor_id in new_ids])
+        existing_doctors.update(zip((f"{DOCTOR_PREFIX}{n}" for n in missing), new_ids))
+    doctor_ids = [existing_doctors[f"{DOCTOR_PREFIX}{n}"] for n in range(doctors)]
+
+    existing_students = _existing(db, Student, STUDENT_PREFIX)
+    missing = [n for n in range(students) if f"{STUDENT_PREFIX}{n}" not in existing_students]
+    if missing:
+        new_ids = db.execute(
+            insert(Student).returning(Student.id, sort_by_parameter_order=True),
+            [
+                {"username": f"{STUDENT_PREFIX}{n}", "email": f"student{n}@bench.example.com", "hashed_password": hashed}
+                for n in missing
+            ],
+        ).scalars().all()
+        db.execute(insert(StudentInfo), [_student_profile(rng, student_id) for student_id in new_ids])
+
+        ratings = []
+        for student_id in new_ids:
+            for doctor_id in rng.sample(doctor_ids, min(ratings_per_student, len(doctor_ids))):
+                ratings.append({"student_id": student_id, "doctor_id": doctor_id, "rating": rng.randint(1, 5)})
+        if ratings:
+            db.execute(insert(StdDrRate), ratings)
+            per_doctor = {}
+            for row in ratings:
+                per_doctor.setdefault(row["doctor_id"], []).append(row["rating"])
+            for doctor_id, values in per_doctor.items():
+                stars = {star: values.count(star) for star in set(values)}
+                _apply_to_summary(db, doctor_id, len(values), sum(values), stars)
+        existing_students.update(zip((f"{STUDENT_PREFIX}{n}" for n in missing), new_ids))
+
+    db.commit()
+    student_ids = [existing_students[f"{STUDENT_PREFIX}{n}"] for n in range(students)]
+    return SeedResult(student_ids, doctor_ids)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Seed the benchmark dataset")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--doctors", type=int, default=100)
+    parser.add_argument("--ratings-per-student", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    from app.database import SessionLocal, engine
+    from app.migrations import upgrade
+
+    upgrade(engine)
+    db = SessionLocal()
+    try:
+        result = seed(db, args.students, args.doctors, args.ratings_per_student, args.seed)
+    finally:
+        db.close()
+    print(f"seeded {len(result.student_ids)} students and {len(result.doctor_ids)} doctors")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of per-response serialization cost.
+
+    python -m bench.serialization --iterations 20000
+
+Compares the old path (ORM instance -> jsonable_encoder -> json.dumps, as
+JSONResponse does for untyped routes) with the current one (selected
+columns -> response model -> ORJSONResponse) for a single profile, a
+profile envelope and a 20-row directory page.
+"""
+import argparse
+import json
+import os
+import timeit
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from typing import List
+
+from app.database import (
+    DoctorDirectoryEntry, StudentInfo, StudentInfoEnvelope, StudentInfoResponse,
+)
+
+PROFILE = {
+    "id": 1, "student_id": 1, "first_name": "Maya", "last_name": "Haddad", "uni_name": "LU",
+    "faculty": "Engineering", "department": "Computer", "major": "Computer", "dob": "2003-04-05",
+    "academic_year": 3, "disability": False, "athletic_status": "none", "country_of_origin": "Lebanon",
+    "country_of_residence": "Lebanon", "gender": "female", "primary_language": "Arabic", "study_hours": 14.5,
+}
+DIRECTORY_ROW = {
+    "id": 7, "doctor_id": 7, "uni_name": "LU", "faculty": "Engineering", "department": "Computer",
+    "start_teaching_year": 2011,
+    "owner": {"id": 7, "username": "dr_seven", "contact": "7@example.com", "price_per_hour": 35.0},
+}
+
+
+def _orm_profile() -> StudentInfo:
+    return StudentInfo(**PROFILE)
+
+
+def cases():
+    directory_adapter = TypeAdapter(List[DoctorDirectoryEntry])
+    page = [dict(DIRECTORY_ROW, id=n, doctor_id=n) for n in range(20)]
+    return {
+        "student_profile": (
+            lambda: JSONResponse(jsonable_encoder(_orm_profile())),
+            lambda: ORJSONResponse(StudentInfoResponse.model_validate(PROFILE).model_dump(mode="json")),
+        ),
+        "profile_envelope": (
+            lambda: JSONResponse(jsonable_encoder({"message": "ok", "data": _orm_profile()})),
+            lambda: ORJSONResponse(StudentInfoEnvelope.model_validate(
+                {"message": "ok", "data": PROFILE}).model_dump(mode="json")),
+        ),
+        "directory_page_20": (
+            lambda: JSONResponse(jsonable_encoder(page)),
+            lambda: ORJSONResponse(directory_adapter.dump_python(
+                directory_adapter.validate_python(page), mode="json")),
+        ),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure response serialization cost")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, (before, after) in cases().items():
+        before_us = min(timeit.repeat(before, number=args.iterations, repeat=3)) / args.iterations * 1e6
+        after_us = min(timeit.repeat(after, number=args.iterations, repeat=3)) / args.iterations * 1e6
+        results[name] = {
+            "before_us": round(before_us, 2),
+            "after_us": round(after_us, 2),
+            "speedup": round(before_us / after_us, 2),
+        }
+        print(f"{name:<20} before {before_us:8.2f} us  after {after_us:8.2f} us  x{before_us / after_us:.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,19 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, StaticPool
 from sqlalchemy.orm import sessionmaker
 
 from app.main import app
-from app.database import Base, get_db
+from app.cache import CACHES
+from app.auth import ACCESS, create_token
+from app.database import Base, get_db, get_read_db
+from app.recommendations import doctor_catalog
+from app.search import doctor_search
+from app import overload
+
+# The suite logs in far more often than the per-client login rate limit allows
+overload.login_rate_limiter = None
 
 
 # --- TEST SETUP ---
@@ -25,6 +34,7 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 # Create tables BEFORE creating the test client
 Base.metadata.create_all(bind=engine)
@@ -38,12 +48,25 @@ def setup_db():
     Base.metadata.drop_all(bind=engine)
     # Create fresh tables
     Base.metadata.create_all(bind=engine)
+    # Cached reads must not leak rows from a previous test's database
+    for cache in CACHES.values():
+        asyncio.run(cache.clear())
+    doctor_search.clear()
+    doctor_catalog.clear()
     yield
     # Clean up after test
     Base.metadata.drop_all(bind=engine)
 
 # --- INTEGRATION TESTS ---
 
+def _auth_headers(username, password="password123"):
+    login = client.post("/students/login", params={"username": username, "password": password})
+    return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+def _owner_headers(role, subject_id):
+    # Minted directly where the test is not about logging in
+    return {"Authorization": f"Bearer {create_token(role, subject_id, ACCESS, 300)}"}
+
 def test_doctor_registration_and_info_link():
     # 1. Register Doctor
     dr_reg = client.post("/doctors/register", json={
@@ -62,7 +85,7 @@ def test_doctor_registration_and_info_link():
         "department": "Diagnostics",
         "start_teaching_year": 2004
     }
-    info_resp = client.post("/doctor-info/", json=dr_info)
+    info_resp = client.post("/doctor-info/", json=dr_info, headers=_owner_headers("doctor", dr_id))
     
     assert info_resp.status_code == 201
     assert info_resp.json()["data"]["department"] == "Diagnostics"
@@ -100,7 +123,7 @@ def test_student_registration_and_profile_creation():
         "study_hours": 15.5
     }
     
-    prof_resp = client.post("/student-info/", json=profile_data) 
+    prof_resp = client.post("/student-info/", json=profile_data, headers=_owner_headers("student", student_id)) 
     
     assert prof_resp.status_code == 201 
     assert prof_resp.json()["data"]["first_name"] == "John"
@@ -133,7 +156,7 @@ def test_get_and_update_student_profile():
         "gender": "Female",
         "primary_language": "French",
         "study_hours": 20.0
-    })
+    }, headers=_owner_headers("student", student_id))
 
     # 2. Test GET
     get_resp = client.get(f"/student-info/{student_id}")
@@ -145,8 +168,566 @@ def test_get_and_update_student_profile():
         "study_hours": 25.0,
         "country_of_residence": "UAE"
     }
-    put_resp = client.put(f"/student-info/{student_id}", json=update_data)
+    put_resp = client.put(f"/student-info/{student_id}", json=update_data, headers=_auth_headers("lifecycle_user"))
     
     assert put_resp.status_code == 200
     assert put_resp.json()["data"]["study_hours"] == 25.0
-    assert put_resp.json()["data"]["country_of_residence"] == "UAE"
\ No newline at end of file
+    assert put_resp.json()["data"]["country_of_residence"] == "UAE"
+
+def _create_student_with_profile(username, uni_name="Batch Uni", major="AI"):
+    reg_resp = client.post("/students/register", json={
+        "username": username,
+        "email": f"{username}@test.com",
+        "password": "password123"
+    })
+    student_id = reg_resp.json()["id"]
+    client.post("/student-info/", json={
+        "student_id": student_id,
+        "first_name": "Batch",
+        "last_name": "Student",
+        "uni_name": uni_name,
+        "faculty": "Engineering",
+        "department": "CS",
+        "major": major,
+        "dob": "2001-03-10",
+        "academic_year": 2,
+        "athletic_status": "Non-Athlete",
+        "country_of_origin": "Lebanon",
+        "country_of_residence": "Lebanon",
+        "gender": "Female",
+        "primary_language": "Arabic",
+        "study_hours": 12.0
+    }, headers=_owner_headers("student", student_id))
+    return student_id
+
+
+def _fake_ml_client(monkeypatch):
+    import json
+    import httpx
+    from app import ml_client
+
+    def handler(request):
+        payload = json.loads(request.content)
+        return httpx.Response(200, json={"predicted_gpa": 3.0 + payload["study_hours"] / 100})
+
+    fake = ml_client.MLClient(base_url="http://ml.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(ml_client, "_client", fake)
+    return fake
+
+
+def test_batch_gpa_prediction(monkeypatch):
+    from app import auth
+
+    _fake_ml_client(monkeypatch)
+
+    first = _create_student_with_profile("batch_one")
+    second = _create_student_with_profile("batch_two")
+    _create_student_with_profile("other_uni", uni_name="Elsewhere")
+
+    # Students may only re-score themselves; cohorts need the staff key
+    headers = _auth_headers("batch_one")
+    assert client.post("/ml/predict-gpa/batch", json={"uni_name": "Batch Uni"}, headers=headers).status_code == 403
+    assert client.post("/ml/predict-gpa/batch", json={"student_ids": [second]}, headers=headers).status_code == 403
+    assert client.post("/ml/predict-gpa/batch", json={"student_ids": [first]}, headers=headers).status_code == 200
+    monkeypatch.setattr(auth, "STAFF_API_KEY", "staff-secret")
+    headers["X-Staff-Key"] = "staff-secret"
+    resp = client.post("/ml/predict-gpa/batch", json={"uni_name": "Batch Uni"}, headers=headers)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["succeeded"] == 2
+    assert {row["student_id"] for row in body["results"]} == {first, second}
+
+    # Re-scoring upserts in place and reports unknown ids as failures
+    resp = client.post("/ml/predict-gpa/batch", json={"student_ids": [first, 9999]}, headers=headers)
+    body = resp.json()
+    assert body["succeeded"] == 1
+    assert body["failures"] == [{"student_id": 9999, "error": "Student not found"}]
+
+
+def test_prediction_cache_skips_unchanged_students(monkeypatch):
+    from app.features import prediction_cache, prediction_cache_counters
+
+    prediction_cache.clear()
+    monkeypatch.setattr("app.features.prediction_cache_counters", dict.fromkeys(prediction_cache_counters, 0))
+    fake = _fake_ml_client(monkeypatch)
+    calls = []
+    original_predict = fake.predict
+
+    async def counting_predict(ml_input):
+        calls.append(ml_input["student_id"])
+        return await original_predict(ml_input)
+
+    monkeypatch.setattr(fake, "predict", counting_predict)
+    student_id = _create_student_with_profile("cached_student")
+    headers = _auth_headers("cached_student")
+
+    first = client.post(f"/ml/predict-gpa/{student_id}", headers=headers)
+    second = client.post(f"/ml/predict-gpa/{student_id}", headers=headers)
+    assert first.json()["predicted_gpa"] == second.json()["predicted_gpa"]
+    assert calls == [student_id]
+
+    # Cold in-process cache falls back to the hash stored with StudentGPA
+    prediction_cache.clear()
+    client.post(f"/ml/predict-gpa/{student_id}", headers=headers)
+    assert calls == [student_id]
+
+    # Changing a feature invalidates the prediction; non-features do not
+    client.put(f"/student-info/{student_id}", json={"first_name": "Renamed"}, headers=headers)
+    client.post(f"/ml/predict-gpa/{student_id}", headers=headers)
+    assert calls == [student_id]
+    client.put(f"/student-info/{student_id}", json={"study_hours": 30.0}, headers=headers)
+    resp = client.post(f"/ml/predict-gpa/{student_id}", headers=headers)
+    assert calls == [student_id, student_id]
+    assert resp.json()["predicted_gpa"] == 3.3
+
+    stats = client.get("/ml/cache-stats").json()
+    assert stats["lru_hits"] == 2
+    assert stats["db_hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_protected_routes_require_matching_token():
+    student_id = _create_student_with_profile("token_owner")
+    other_id = _create_student_with_profile("token_other")
+    headers = _auth_headers("token_owner")
+
+    assert client.put(f"/student-info/{student_id}", json={"major": "ML"}).status_code == 401
+    assert client.put(f"/student-info/{other_id}", json={"major": "ML"}, headers=headers).status_code == 403
+    assert client.put(f"/student-info/{student_id}", json={"major": "ML"}, headers=headers).status_code == 200
+    # Malformed tokens, including non-ASCII signatures, are rejected rather than crashing
+    for token in (b"garbage", b"abc.def", "e30.sig\u00e9".encode("utf-8")):
+        bad = {"Authorization": b"Bearer " + token}
+        assert client.put(f"/student-info/{student_id}", json={"major": "ML"}, headers=bad).status_code == 401
+
+    # Profiles are created and changed only with the owner's token
+    fresh_id = client.post("/students/register", json={
+        "username": "token_fresh", "email": "token_fresh@test.com", "password": "password123"
+    }).json()["id"]
+    profile = {
+        "student_id": fresh_id, "first_name": "To", "last_name": "Ken", "uni_name": "U", "faculty": "F",
+        "department": "D", "major": "M", "dob": "2001-01-01", "academic_year": 1, "athletic_status": "None",
+        "country_of_origin": "Lebanon", "country_of_residence": "Lebanon", "gender": "Male",
+        "primary_language": "Arabic", "study_hours": 5.0,
+    }
+    assert client.post("/student-info/", json=profile).status_code == 401
+    assert client.post("/student-info/", json=profile, headers=headers).status_code == 403
+    doctor_id = _create_doctor_with_profile("token_doctor", 30.0, 2010)
+    other_doctor = _create_doctor_with_profile("token_doctor_other", 30.0, 2010)
+    doctor_headers = {"Authorization": f"Bearer {client.post('/doctors/login', json={'username': 'token_doctor', 'password': 'password123'}).json()['access_token']}"}
+    assert client.put(f"/doctor-info/{doctor_id}", json={"faculty": "Law"}).status_code == 401
+    assert client.put(f"/doctor-info/{doctor_id}", json={"faculty": "Law"}, headers=headers).status_code == 403
+    assert client.put(f"/doctor-info/{other_doctor}", json={"faculty": "Law"}, headers=doctor_headers).status_code == 403
+    assert client.put(f"/doctor-info/{doctor_id}", json={"faculty": "Law"}, headers=doctor_headers).status_code == 200
+    assert client.post("/doctor-info/", json={
+        "doctor_id": other_doctor, "uni_name": "U", "faculty": "F", "department": "D", "start_teaching_year": 2000
+    }, headers=doctor_headers).status_code == 403
+
+    # Refresh rotates the pair; logout revokes the access token
+    login = client.post("/students/login", params={"username": "token_owner", "password": "password123"}).json()
+    refreshed = client.post("/auth/refresh", json={"refresh_token": login["refresh_token"]})
+    assert refreshed.status_code == 200
+    assert client.post("/auth/refresh", json={"refresh_token": login["refresh_token"]}).status_code == 401
+
+    new_headers = {"Authorization": f"Bearer {refreshed.json()['access_token']}"}
+    assert client.post("/auth/logout", headers=new_headers).status_code == 200
+    assert client.put(f"/student-info/{student_id}", json={"major": "AI"}, headers=new_headers).status_code == 401
+
+
+def _create_doctor_with_profile(username, price, start_year, faculty="Medicine", department="Diagnostics"):
+    dr_id = client.post("/doctors/register", json={
+        "username": username,
+        "password": "password123",
+        "contact": "555-0100",
+        "price": price
+    }).json()["id"]
+    client.post("/doctor-info/", json={
+        "doctor_id": dr_id,
+        "uni_name": "Princeton-Plainsboro",
+        "faculty": faculty,
+        "department": department,
+        "start_teaching_year": start_year
+    }, headers=_owner_headers("doctor", dr_id))
+    return dr_id
+
+
+def test_doctor_directory_keyset_pagination():
+    import base64
+    import json
+
+    prices = [40.0, 80.0, 60.0, 80.0, 20.0]
+    for i, price in enumerate(prices):
+        _create_doctor_with_profile(f"dr_page_{i}", price, 2000 + i, faculty="Pharmacy")
+    _create_doctor_with_profile("dr_other_faculty", 10.0, 2010, faculty="Law")
+
+    seen = []
+    params = {"faculty": "Pharmacy", "sort": "price", "order": "desc", "limit": 2}
+    while True:
+        resp = client.get("/doctor-info/filter/", params=params)
+        assert resp.status_code == 200
+        assert len(resp.json()) <= 2
+        seen.extend(row["owner"]["price_per_hour"] for row in resp.json())
+        if "X-Next-Cursor" not in resp.headers:
+            break
+        params["cursor"] = resp.headers["X-Next-Cursor"]
+    assert seen == sorted(prices, reverse=True)
+
+    resp = client.get("/doctor-info/filter/", params={
+        "faculty": "Pharmacy", "min_price": 30, "max_price": 70, "department": "Diagnostics"
+    })
+    assert [row["owner"]["price_per_hour"] for row in resp.json()] == [40.0, 60.0]
+
+    assert client.get("/doctor-info/filter/", params={"faculty": "Pharmacy", "limit": 500}).status_code == 422
+
+    # Doctors without a start year are left out of the experience order instead of ending it early
+    from app.database import DoctorInfo
+    db = next(app.dependency_overrides[get_db]())
+    try:
+        db.query(DoctorInfo).filter(DoctorInfo.start_teaching_year == 2004).update({"start_teaching_year": None})
+        db.commit()
+    finally:
+        db.close()
+    years = []
+    params = {"faculty": "Pharmacy", "sort": "experience", "limit": 1}
+    while True:
+        resp = client.get("/doctor-info/filter/", params=params)
+        years.extend(row["start_teaching_year"] for row in resp.json())
+        if "X-Next-Cursor" not in resp.headers:
+            break
+        params["cursor"] = resp.headers["X-Next-Cursor"]
+    assert years == [2003, 2002, 2001, 2000]
+
+    bad_cursor = base64.urlsafe_b64encode(json.dumps(["a", "b"]).encode()).decode()
+    assert client.get("/doctor-info/filter/", params={"faculty": "Pharmacy", "cursor": bad_cursor}).status_code == 400
+
+
+def test_ratings_maintain_doctor_summary():
+    dr_id = _create_doctor_with_profile("dr_rated", 50.0, 2005, faculty="Dentistry")
+    for username in ("rater_one", "rater_two"):
+        client.post("/students/register", json={
+            "username": username, "email": f"{username}@test.com", "password": "password123"
+        })
+    first, second = _auth_headers("rater_one"), _auth_headers("rater_two")
+
+    assert client.post("/ratings/", json={"doctor_id": dr_id, "rating": 5}, headers=first).status_code == 201
+    assert client.post("/ratings/", json={"doctor_id": dr_id, "rating": 2}, headers=second).status_code == 201
+    assert client.post("/ratings/", json={"doctor_id": dr_id, "rating": 4}, headers=first).status_code == 400
+    assert client.post("/ratings/", json={"doctor_id": dr_id, "rating": 6}, headers=first).status_code == 422
+
+    summary = client.get(f"/ratings/doctor/{dr_id}").json()
+    assert summary["count"] == 2
+    assert summary["average"] == 3.5
+    assert summary["histogram"]["5"] == 1 and summary["histogram"]["2"] == 1
+
+    client.put(f"/ratings/{dr_id}", json={"rating": 4}, headers=second)
+    client.put(f"/ratings/{dr_id}", json={"rating": 4}, headers=second)
+    client.delete(f"/ratings/{dr_id}", headers=first)
+    # Only the write that actually changed the row moves the summary
+    assert client.delete(f"/ratings/{dr_id}", headers=first).status_code == 404
+    summary = client.get(f"/ratings/doctor/{dr_id}").json()
+    assert summary["count"] == 1
+    assert summary["average"] == 4.0
+    assert summary["histogram"] == {"1": 0, "2": 0, "3": 0, "4": 1, "5": 0}
+
+    top = client.get("/ratings/top", params={"faculty": "Dentistry"}).json()
+    assert [row["doctor_id"] for row in top] == [dr_id]
+
+
+def test_conditional_profile_requests(monkeypatch):
+    _fake_ml_client(monkeypatch)
+    student_id = _create_student_with_profile("etag_user")
+    headers = _auth_headers("etag_user")
+
+    first = client.get(f"/student-info/{student_id}")
+    etag = first.headers["ETag"]
+    assert first.json()["version"] == 1
+    assert "Last-Modified" in first.headers
+
+    cached = client.get(f"/student-info/{student_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    check = client.get(f"/student-info/check/{student_id}")
+    assert client.get(
+        f"/student-info/check/{student_id}", headers={"If-None-Match": check.headers["ETag"]}
+    ).status_code == 304
+
+    updated = client.put(
+        f"/student-info/{student_id}", json={"study_hours": 30.0}, headers={**headers, "If-Match": etag}
+    )
+    assert updated.status_code == 200
+    assert updated.json()["data"]["version"] == 2
+    assert updated.headers["ETag"] != etag
+
+    # If-Match compares strongly: the weak form of the current ETag does not match
+    current = updated.headers["ETag"]
+    assert client.get(f"/student-info/{student_id}", headers={"If-None-Match": f"W/{current}"}).status_code == 304
+    weak = client.put(
+        f"/student-info/{student_id}", json={"study_hours": 5.0}, headers={**headers, "If-Match": f"W/{current}"}
+    )
+    assert weak.status_code == 412
+
+    stale = client.put(
+        f"/student-info/{student_id}", json={"study_hours": 5.0}, headers={**headers, "If-Match": etag}
+    )
+    assert stale.status_code == 412
+    assert client.get(f"/student-info/{student_id}", headers={"If-None-Match": etag}).status_code == 200
+
+    assert client.get(f"/student-info/{student_id}/gpa").status_code == 404
+    client.post(f"/ml/predict-gpa/{student_id}", headers=headers)
+    gpa = client.get(f"/student-info/{student_id}/gpa")
+    assert gpa.status_code == 200
+    assert gpa.json()["predicted_gpa"] == 3.3
+    client.post(f"/ml/predict-gpa/{student_id}", params={"force": True}, headers=headers)
+    assert client.get(
+        f"/student-info/{student_id}/gpa", headers={"If-None-Match": gpa.headers["ETag"]}
+    ).json()["version"] == 2
+
+
+def test_doctor_search_matches_prefixes_and_typos():
+    house_id = _create_doctor_with_profile("srch_house", 50.0, 2000, faculty="Toxicology", department="Poison Control")
+    _create_doctor_with_profile("srch_wilson", 90.0, 2015, faculty="Oncology", department="Cancer Care")
+    _create_doctor_with_profile("srch_cuddy", 70.0, 2010, faculty="Administration", department="Management")
+
+    def search(**params):
+        resp = client.get("/doctors/search", params=params)
+        assert resp.status_code == 200
+        return [row["owner"]["username"] for row in resp.json()]
+
+    assert search(q="toxic") == ["srch_house"]
+    assert search(q="Oncolgy") == ["srch_wilson"]
+    assert search(q="cuddy") == ["srch_cuddy"]
+    assert search(q="srch") == ["srch_house", "srch_wilson", "srch_cuddy"]
+    assert search(q="srch", max_price=80, min_experience=12) == ["srch_house", "srch_cuddy"]
+    assert search(q="dermatology") == []
+
+    # Profile writes reach the index without a rebuild
+    client.put(f"/doctor-info/{house_id}", json={"faculty": "Dermatology"}, headers=_owner_headers("doctor", house_id))
+    assert search(q="dermatology") == ["srch_house"]
+    assert search(q="toxic") == []
+
+    results = client.get("/doctors/search", params={"q": "oncology"}).json()
+    assert results[0]["score"] == 1.0 and results[0]["faculty"] == "Oncology"
+    assert client.get("/doctors/search", params={"q": "x"}).status_code == 422
+
+
+def test_recommended_doctors_rank_profile_matches_first():
+    student_id = client.post("/students/register", json={
+        "username": "rec_student", "email": "rec@test.com", "password": "password123"
+    }).json()["id"]
+    client.post("/student-info/", json={
+        "student_id": student_id, "first_name": "Rana", "last_name": "Khalil",
+        "uni_name": "Rec Uni", "faculty": "Geology", "department": "Seismology", "major": "Volcanology",
+        "dob": "2003-01-01", "academic_year": 2, "athletic_status": "None", "country_of_origin": "Lebanon",
+        "country_of_residence": "Lebanon", "gender": "Female", "primary_language": "Arabic", "study_hours": 10.0,
+    }, headers=_owner_headers("student", student_id))
+
+    def add_doctor(username, faculty, department, price):
+        return _create_doctor_with_profile(username, price, 2010, faculty=faculty, department=department)
+
+    faculty_only = add_doctor("rec_faculty", "Geology", "Mineralogy", 40.0)
+    exact = add_doctor("rec_exact", "Geology", "Seismology", 40.0)
+    major = add_doctor("rec_major", "Geology", "Volcanology", 40.0)
+    cheaper_faculty_only = add_doctor("rec_cheap", "Geology", "Mineralogy", 10.0)
+
+    def ranked():
+        resp = client.get(f"/students/{student_id}/recommended-doctors", params={"limit": 4})
+        assert resp.status_code == 200
+        return [row["doctor_id"] for row in resp.json()]
+
+    assert ranked() == [exact, major, cheaper_faculty_only, faculty_only]
+
+    # Profile writes reach the catalogue: the major match now also matches the department
+    client.put(f"/doctor-info/{major}", json={"department": "Seismology"}, headers=_owner_headers("doctor", major))
+    assert ranked()[:2] == [exact, major]
+    client.put(f"/doctor-info/{exact}", json={"faculty": "Chemistry", "department": "Organic"}, headers=_owner_headers("doctor", exact))
+    assert ranked()[:3] == [major, cheaper_faculty_only, faculty_only]
+
+    assert client.get("/students/999999/recommended-doctors").status_code == 404
+
+
+def test_local_model_regression_fallback_and_batch_engine(monkeypatch):
+    import json
+    import os
+    import httpx
+    import numpy as np
+    from app import local_model, ml_client
+
+    # Scores of the example artifact pinned by bench/record_gpa_regression.py; a
+    # regression check of local_model, not parity with the container
+    fixtures = os.path.join(os.path.dirname(__file__), "fixtures")
+    with open(os.path.join(fixtures, "gpa_regression.json")) as f:
+        regression = json.load(f)
+    model = local_model.LinearGPAModel.load(os.path.join(fixtures, regression["model"]))
+    predicted = model.predict([case["input"] for case in regression["cases"]])
+    expected = np.array([case["predicted_gpa"] for case in regression["cases"]])
+    assert np.abs(predicted - expected).max() <= regression["tolerance"]
+
+    # Derived age, categorical weights and defaults for bad or unseen values
+    encoded = local_model.LinearGPAModel({
+        "format": "linear-v1", "intercept": 2.0, "age_reference_date": "2024-01-01",
+        "numeric": {"age": {"mean": 20, "scale": 2, "weight": 0.1}},
+        "categorical": {"gender": {"weights": {"Female": 0.2}, "default": -0.1}},
+    })
+    scores = encoded.predict([{"dob": "2000-01-01", "gender": "Female"}, {"dob": "not a date", "gender": "Other"}])
+    assert np.allclose(scores, [2.4, 1.9])
+    with pytest.raises(local_model.ModelArtifactError):
+        local_model.LinearGPAModel({"format": "pickle"})
+
+    # The container is down: the local model answers and nothing is stored
+    fake = ml_client.MLClient(base_url="http://ml.test", transport=httpx.MockTransport(lambda request: httpx.Response(503)))
+    monkeypatch.setattr(ml_client, "_client", fake)
+    monkeypatch.setattr(ml_client, "ML_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(local_model, "_model", model)
+    student_id = _create_student_with_profile("local_model_student")
+    headers = _auth_headers("local_model_student")
+
+    resp = client.post(f"/ml/predict-gpa/{student_id}", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json() == {"predicted_gpa": 2.6, "engine": "local", "model_version": "example-1"}
+    assert client.get(f"/student-info/{student_id}/gpa").status_code == 404
+
+    monkeypatch.setattr(local_model, "ML_LOCAL_FALLBACK", False)
+    assert client.post(f"/ml/predict-gpa/{student_id}", headers=headers).status_code == 503
+
+    # Batch scoring through the local engine never calls the container
+    monkeypatch.setattr(local_model, "ML_BATCH_ENGINE", "local")
+    resp = client.post("/ml/predict-gpa/batch", json={"student_ids": [student_id]}, headers=headers)
+    assert resp.json()["results"] == [{"student_id": student_id, "predicted_gpa": 2.6, "cached": False}]
+    assert client.get(f"/student-info/{student_id}/gpa").json()["predicted_gpa"] == 2.6
+
+
+def test_background_predictions_retry_and_rescore_stale(monkeypatch):
+    import httpx
+    from app import auth, jobs, ml_client
+    from app.features import prediction_cache
+
+    def app_session():
+        # Whichever module's get_db override the app is using
+        return next(app.dependency_overrides[get_db]())
+
+    prediction_cache.clear()
+    _fake_ml_client(monkeypatch)
+    # One job at a time: every test session shares a single in-memory SQLite connection
+    pool = jobs.JobWorkerPool(session_factory=app_session, concurrency=1)
+    student_id = _create_student_with_profile("job_student")
+    other_id = _create_student_with_profile("job_other")
+    headers = _auth_headers("job_student")
+
+    # Queued once per student; the status URL is private to the student
+    resp = client.post(f"/ml/predict-gpa/{student_id}", params={"background": True}, headers=headers)
+    assert resp.status_code == 202
+    job_id = resp.json()["job_id"]
+    assert resp.headers["Location"] == f"/ml/jobs/{job_id}"
+    again = client.post(f"/ml/predict-gpa/{student_id}", params={"background": True}, headers=headers)
+    assert again.json()["job_id"] == job_id
+    assert client.get(f"/ml/jobs/{job_id}", headers=headers).json()["status"] == "queued"
+    assert client.get(f"/ml/jobs/{job_id}", headers=_auth_headers("job_other")).status_code == 403
+    # Doctors hold tokens too, but only staff may read other people's jobs
+    assert client.get(f"/ml/jobs/{job_id}", headers=_owner_headers("doctor", 1)).status_code == 403
+    monkeypatch.setattr(auth, "STAFF_API_KEY", "jobs-staff-key")
+    staff = {**_owner_headers("doctor", 1), "X-Staff-Key": "jobs-staff-key"}
+    assert client.get(f"/ml/jobs/{job_id}", headers=staff).status_code == 200
+    # A forced re-score is not folded into the queued non-forced job
+    forced = client.post(f"/ml/predict-gpa/{student_id}", params={"background": True, "force": True}, headers=headers)
+    assert forced.json()["job_id"] != job_id
+
+    assert asyncio.run(pool.drain()) == 2
+    job = client.get(f"/ml/jobs/{job_id}", headers=headers).json()
+    assert (job["status"], job["attempts"], job["result"]) == ("succeeded", 1, {"predicted_gpa": 3.12})
+    assert client.get(f"/student-info/{student_id}/gpa").json()["predicted_gpa"] == 3.12
+
+    # An unavailable container is retried, then the job fails
+    down = ml_client.MLClient(base_url="http://ml.test", transport=httpx.MockTransport(lambda request: httpx.Response(503)))
+    monkeypatch.setattr(ml_client, "_client", down)
+    monkeypatch.setattr(ml_client, "ML_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    job_id = client.post(
+        f"/ml/predict-gpa/{student_id}", params={"background": True, "force": True}, headers=headers
+    ).json()["job_id"]
+    asyncio.run(pool.drain())
+    job = client.get(f"/ml/jobs/{job_id}", headers=headers).json()
+    assert (job["status"], job["attempts"]) == ("failed", 2)
+    assert job["error"].startswith("ML service unavailable")
+
+    # Only students whose features changed (or were never scored) are re-scored
+    _fake_ml_client(monkeypatch)
+    client.put(f"/student-info/{student_id}", json={"study_hours": 20.0}, headers=headers)
+    db = app_session()
+    try:
+        rescore = jobs.enqueue_job(db, "rescore_stale")
+    finally:
+        db.close()
+    asyncio.run(pool.drain())
+    db = app_session()
+    try:
+        result = jobs.get_job(db, rescore.id).result
+    finally:
+        db.close()
+    assert result["stale"] >= 2 and result["jobs"] >= 1
+    assert client.get(f"/student-info/{student_id}/gpa").json()["predicted_gpa"] == 3.2
+    assert client.get(f"/student-info/{other_id}/gpa").json()["predicted_gpa"] == 3.12
+
+    # Sweeps skip students whose earlier job is still pending, and features the model rejected
+    from app.database import StudentFeatures
+    from app.routes.ml_predictions import _enqueue_stale
+
+    def sweep():
+        db = app_session()
+        try:
+            _enqueue_stale(db)
+            return db.get(StudentFeatures, student_id)
+        finally:
+            db.close()
+
+    client.put(f"/student-info/{student_id}", json={"study_hours": 25.0}, headers=headers)
+    queued_by = sweep().rescore_job_id
+    assert queued_by is not None
+    assert sweep().rescore_job_id == queued_by
+
+    rejecting = ml_client.MLClient(
+        base_url="http://ml.test", transport=httpx.MockTransport(lambda request: httpx.Response(422, json={}))
+    )
+    monkeypatch.setattr(ml_client, "_client", rejecting)
+    asyncio.run(pool.drain())
+    features = sweep()
+    assert features.rejected_hash == features.feature_hash
+    assert features.rescore_job_id == queued_by
+
+    # New features are scored again
+    client.put(f"/student-info/{student_id}", json={"study_hours": 26.0}, headers=headers)
+    assert sweep().rescore_job_id != queued_by
+    _fake_ml_client(monkeypatch)
+    asyncio.run(pool.drain())
+
+
+def test_job_leases_requeue_only_silent_workers():
+    from datetime import timedelta
+    from app import jobs
+    from app.database import PredictionJob, utcnow
+
+    db = next(app.dependency_overrides[get_db]())
+    try:
+        silent = jobs.enqueue_job(db, "lease_silent").id
+        alive = jobs.enqueue_job(db, "lease_alive").id
+        first = {job.id: job for job in jobs._claim(db, 100)}
+        # Both leases lapse, but only one worker is still renewing it
+        db.query(PredictionJob).filter(PredictionJob.id.in_([silent, alive])).update(
+            {"heartbeat_at": utcnow() - timedelta(seconds=jobs.JOB_LEASE_SECONDS * 2)}, synchronize_session=False,
+        )
+        db.commit()
+        assert jobs._heartbeat(db, first[alive])
+
+        second = {job.id: job for job in jobs._claim(db, 100)}
+        assert silent in second and alive not in second
+        assert second[silent].attempts == 2
+
+        # The silent worker's late outcome does not overwrite the second attempt
+        jobs._finish(db, first[silent], status="failed", error="late")
+        assert not jobs._heartbeat(db, first[silent])
+        assert jobs.get_job(db, silent).status == "running"
+        jobs._finish(db, second[silent], status="succeeded")
+        jobs._finish(db, first[alive], status="succeeded")
+        db.expire_all()
+        assert [jobs.get_job(db, job_id).status for job_id in (silent, alive)] == ["succeeded", "succeeded"]
+    finally:
+        db.close()
@@ -1,11 +1,20 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, StaticPool
+from sqlalchemy import create_engine, event, StaticPool
 from sqlalchemy.orm import sessionmaker
 
 # Import database models and app AFTER setting up test database
-from app.database import Base, get_db
+from app.auth import ACCESS, create_token
+from app.database import Base, get_db, get_read_db, _enable_sqlite_foreign_keys
 from app.main import app
+from app.cache import CACHES
+from app import overload
+from app.recommendations import doctor_catalog
+from app.search import doctor_search
+
+# The suite logs in far more often than the per-client login rate limit allows
+overload.login_rate_limiter = None
 
 # --- SETUP IN-MEMORY DATABASE FOR TESTING ---
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -14,6 +23,8 @@ engine = create_engine(
     connect_args={"check_same_thread": False},
     poolclass=StaticPool, 
 )
+# Enforce foreign keys like the app's engines do
+event.listen(engine, "connect", _enable_sqlite_foreign_keys)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Override the get_db dependency to use the test database
@@ -25,12 +36,17 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 # Create tables BEFORE creating the test client
 Base.metadata.create_all(bind=engine)
 
 client = TestClient(app)
 
+def _owner_headers(role, subject_id):
+    # Minted directly; these tests exercise the routes, not the login flow
+    return {"Authorization": f"Bearer {create_token(role, subject_id, ACCESS, 300)}"}
+
 @pytest.fixture(autouse=True)
 def setup_database():
     """Recreate tables before each test and drop them after."""
@@ -38,6 +54,11 @@ def setup_database():
     Base.metadata.drop_all(bind=engine)
     # Create fresh tables
     Base.metadata.create_all(bind=engine)
+    # Cached reads must not leak rows from a previous test's database
+    for cache in CACHES.values():
+        asyncio.run(cache.clear())
+    doctor_search.clear()
+    doctor_catalog.clear()
     yield
     # Clean up after test
     Base.metadata.drop_all(bind=engine)
@@ -95,4 +116,607 @@ def test_student_login():
     
     assert response.status_code == 200
     assert response.json()["username"] == "loginuser"
-    assert "id" in response.json()
\ No newline at end of file
+    assert "id" in response.json()
+def test_ml_client_retries_then_opens_circuit(monkeypatch):
+    """Test 4: Transient ML failures are retried and repeated failures trip the breaker"""
+    import asyncio
+    import httpx
+    from app import ml_client
+
+    monkeypatch.setattr(ml_client, "ML_RETRY_BACKOFF", 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(502)
+
+    client = ml_client.MLClient(base_url="http://ml.test", transport=httpx.MockTransport(handler))
+    client.breaker = ml_client.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(ml_client.MLServiceUnavailable):
+                await client.predict({"student_id": 1})
+        # Breaker is open now: fail fast without touching the container
+        with pytest.raises(ml_client.MLServiceUnavailable) as exc:
+            await client.predict({"student_id": 1})
+        await client.aclose()
+        return exc.value
+
+    error = asyncio.run(run())
+    assert len(calls) == 2 * (ml_client.ML_RETRIES + 1)
+    assert error.retry_after and error.retry_after > 0
+    assert client.breaker.state == "open"
+
+    # A cancelled half-open trial gives the trial slot back
+    async def hang(request):
+        await asyncio.sleep(10)
+
+    async def cancel_trial():
+        hanging = ml_client.MLClient(base_url="http://ml.test", transport=httpx.MockTransport(hang))
+        hanging.breaker = ml_client.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        hanging.breaker.record_failure()
+        trial = asyncio.create_task(hanging.predict({"student_id": 1}))
+        await asyncio.sleep(0.05)
+        assert hanging.breaker.trial_in_flight
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        await hanging.aclose()
+        return hanging.breaker
+
+    assert asyncio.run(cancel_trial()).trial_in_flight is False
+
+    # A 4xx is a rejected input, not an outage: no breaker failure
+    async def rejected():
+        strict = ml_client.MLClient(base_url="http://ml.test", transport=httpx.MockTransport(lambda request: httpx.Response(422)))
+        strict.breaker = ml_client.CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        with pytest.raises(ml_client.MLRequestRejected) as exc:
+            await strict.predict({"student_id": 1})
+        await strict.aclose()
+        return exc.value.status_code, strict.breaker.state
+
+    assert asyncio.run(rejected()) == (422, "closed")
+
+    # A JSON body that is not an object is malformed, not an outage
+    async def non_object(body):
+        odd = ml_client.MLClient(base_url="http://ml.test", transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body)))
+        odd.breaker = ml_client.CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        with pytest.raises(ml_client.MLRequestRejected):
+            await odd.predict({"student_id": 1})
+        await odd.aclose()
+        return odd.breaker.state
+
+    for body in (b"[3.1]", b'"3.1"', b"null"):
+        assert asyncio.run(non_object(body)) == "closed"
+
+def test_login_rehashes_outdated_cost():
+    """Test 5: Logging in upgrades a hash made with an old bcrypt cost factor"""
+    from app.database import Student, get_password_hash, password_hash_rounds, BCRYPT_ROUNDS
+
+    db = TestingSessionLocal()
+    db.add(Student(username="legacy", email="legacy@example.com",
+                   hashed_password=get_password_hash("oldpass", rounds=4)))
+    db.commit()
+
+    response = client.post("/students/login", params={"username": "legacy", "password": "oldpass"})
+    assert response.status_code == 200
+
+    db.expire_all()
+    stored = db.query(Student).filter(Student.username == "legacy").first().hashed_password
+    db.close()
+    assert password_hash_rounds(stored) == BCRYPT_ROUNDS
+
+def test_register_rejected_when_hash_queue_full(monkeypatch):
+    """Test 6: A saturated hashing pool sheds load with 503 and Retry-After"""
+    from app import hashing
+
+    monkeypatch.setattr(hashing, "HASH_QUEUE_LIMIT", 0)
+    response = client.post(
+        "/students/register",
+        json={"username": "busy", "email": "busy@example.com", "password": "pw"}
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(hashing.HASH_RETRY_AFTER)
+
+def test_bulk_import_reports_bad_rows(monkeypatch):
+    """Test 7: Bulk import creates valid rows and reports the rest per row"""
+    from app.routes import students
+
+    monkeypatch.setattr(students, "IMPORT_API_KEY", "secret")
+    client.post("/students/register", json={"username": "taken", "email": "taken@example.com", "password": "pw"})
+
+    body = (
+        "username,email,password,first_name,last_name,uni_name,faculty,department,major,dob,"
+        "academic_year,athletic_status,country_of_origin,country_of_residence,gender,primary_language,study_hours\n"
+        'alice,alice@example.com,pw1,Alice,"Smith, Jr",Uni,Eng,CS,AI,2001-01-01,2,None,LB,LB,F,Arabic,10\n'
+        "bob,bob@example.com,pw2,,,,,,,,,,,,,,\n"
+        "carol,not-an-email,pw3,,,,,,,,,,,,,,\n"
+        "taken,other@example.com,pw4,,,,,,,,,,,,,,\n"
+    )
+    response = client.post(
+        "/students/import", content=body,
+        headers={"Content-Type": "text/csv", "X-Import-Key": "secret"}
+    )
+    report = response.json()
+    assert response.status_code == 200
+    assert report["rows"] == 4
+    assert report["created"] == 2
+    assert report["profiles_created"] == 1
+    assert [error["row"] for error in report["errors"]] == [3, 4]
+
+    profile = client.get(f"/student-info/check/{client.post('/students/login', params={'username': 'alice', 'password': 'pw1'}).json()['id']}")
+    assert profile.json()["exists"] is True
+
+    assert client.post("/students/import", content=body).status_code == 403
+
+    # A row breaking a CHECK constraint fails alone, whether caught before or by the database
+    from app import bulk_import
+
+    def import_years(prefix, years):
+        rows = "".join(
+            f"{prefix}{i},{prefix}{i}@example.com,pw,A,B,Uni,Eng,CS,AI,2001-01-01,{year},None,LB,LB,F,Arabic,10\n"
+            for i, year in enumerate(years)
+        )
+        return client.post(
+            "/students/import", content=body.splitlines(keepends=True)[0] + rows,
+            headers={"Content-Type": "text/csv", "X-Import-Key": "secret"}
+        ).json()
+
+    report = import_years("checked", [1, 9, 3])
+    assert (report["created"], [error["row"] for error in report["errors"]]) == (2, [2])
+    assert report["errors"][0]["error"] == "academic_year: must be between 0 and 5"
+    monkeypatch.setattr(bulk_import, "_check_constraints", lambda profile: None)
+    report = import_years("unchecked", [1, 9, 3])
+    assert (report["created"], report["profiles_created"], [error["row"] for error in report["errors"]]) == (2, 2, [2])
+    assert report["errors"][0]["error"].startswith("Rejected by database")
+    assert client.get(f"/student-info/check/{client.post('/students/login', params={'username': 'unchecked2', 'password': 'pw'}).json()['id']}").json()["exists"]
+
+    # Duplicates across chunks are caught by the database check; only the first errors are listed
+    monkeypatch.setattr(students, "IMPORT_CHUNK_SIZE", 2)
+    monkeypatch.setattr(bulk_import, "IMPORT_MAX_REPORTED_ERRORS", 2)
+    rows = "".join(f"dup{i % 2},dup{i % 2}@example.com,pw,,,,,,,,,,,,,,\n" for i in range(5))
+    report = client.post(
+        "/students/import", content=body.splitlines(keepends=True)[0] + rows,
+        headers={"Content-Type": "text/csv", "X-Import-Key": "secret"}
+    ).json()
+    assert (report["created"], report["failed"], report["errors_omitted"]) == (2, 3, 1)
+    assert [error["row"] for error in report["errors"]] == [3, 4]
+
+def test_routes_run_on_async_sessions(monkeypatch):
+    """Test 8: The same routes work when get_db yields an AsyncSession"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app import migrations
+
+    # The lifespan would otherwise check the (unmigrated) app database
+    monkeypatch.setattr(migrations, "SCHEMA_CHECK", "off")
+
+    async_engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    AsyncTestingSession = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as db:
+            yield db
+
+    async def create_tables():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    app.dependency_overrides[get_db] = override_get_async_db
+    try:
+        with TestClient(app) as async_client:
+            async_client.portal.call(create_tables)
+            student_id = async_client.post(
+                "/students/register",
+                json={"username": "async_user", "email": "async@example.com", "password": "pw"}
+            ).json()["id"]
+            login = async_client.post("/students/login", params={"username": "async_user", "password": "pw"})
+            assert login.json()["id"] == student_id
+            assert async_client.get(f"/student-info/check/{student_id}").json()["exists"] is False
+            async_client.portal.call(async_engine.dispose)
+    finally:
+        app.dependency_overrides[get_db] = override_get_db
+
+def test_pool_metrics_track_checkouts_and_timeouts(tmp_path, monkeypatch):
+    """Test 9: The instrumented pool reports usage, overflow and timeouts"""
+    from sqlalchemy import exc as sa_exc
+    from app import database
+    from app.metrics import POOL_METRICS
+
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 1)
+    monkeypatch.setattr(database, "DB_POOL_TIMEOUT", 0.05)
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    pool_engine = create_engine(url, **database.engine_options(url, "unit_pool"))
+
+    first, second = pool_engine.connect(), pool_engine.connect()
+    stats = POOL_METRICS["unit_pool"].snapshot()
+    assert stats["checked_out"] == 2
+    assert stats["overflow"] == 1
+    with pytest.raises(sa_exc.TimeoutError):
+        pool_engine.connect()
+    first.close()
+    second.close()
+
+    listed = {row["engine"]: row for row in client.get("/metrics/db-pool").json()}
+    assert listed["unit_pool"]["timeouts"] == 1
+    assert listed["unit_pool"]["checked_out"] == 0
+    assert listed["unit_pool"]["checkout_wait_seconds"]["count"] == 3
+    pool_engine.dispose()
+    del POOL_METRICS["unit_pool"]
+
+def test_migrations_upgrade_legacy_schema(tmp_path):
+    """Test 10: Migrations bring a pre-versioning database up to date, idempotently"""
+    from sqlalchemy import inspect, text
+    from app import migrations
+
+    legacy_engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE students (id INTEGER PRIMARY KEY, username VARCHAR, email VARCHAR, hashed_password VARCHAR)"))
+        conn.execute(text("CREATE TABLE student_gpa (id INTEGER PRIMARY KEY, student_id INTEGER UNIQUE, predicted_gpa FLOAT)"))
+        conn.execute(text("CREATE TABLE ratings (id INTEGER PRIMARY KEY, student_id INTEGER, doctor_id INTEGER, rating INTEGER)"))
+        conn.execute(text("CREATE TABLE doctors (id INTEGER PRIMARY KEY, username VARCHAR, hashed_password VARCHAR, contact VARCHAR, price_per_hour FLOAT)"))
+        conn.execute(text("CREATE TABLE doctor_info (id INTEGER PRIMARY KEY, doctor_id INTEGER, uni_name VARCHAR, faculty VARCHAR, department VARCHAR, start_teaching_year INTEGER)"))
+
+    assert migrations.upgrade(legacy_engine) == migrations.LATEST_VERSION
+    assert migrations.upgrade(legacy_engine) == migrations.LATEST_VERSION
+
+    inspector = inspect(legacy_engine)
+    assert "feature_hash" in {col["name"] for col in inspector.get_columns("student_gpa")}
+    assert "ix_doctors_price_per_hour" in {index["name"] for index in inspector.get_indexes("doctors")}
+    assert inspector.has_table("doctor_rating_summary")
+    assert {"version", "updated_at"} <= {col["name"] for col in inspector.get_columns("doctor_info")}
+
+    migrations._checked_version = None
+    assert migrations.check_schema(legacy_engine) == migrations.LATEST_VERSION
+    migrations._checked_version = None
+    legacy_engine.dispose()
+
+def test_request_metrics_by_route_template():
+    """Test 11: Requests are recorded per route template with their SQL statement counts"""
+    from app.metrics import ROUTE_METRICS
+
+    client.get("/doctor-info/check/101")
+    client.get("/doctor-info/check/202")
+    metrics = ROUTE_METRICS[("GET", "/doctor-info/check/{doctor_id}")]
+    assert metrics.latency.count >= 2
+    assert metrics.statuses[200] >= 2
+    assert metrics.db_statements >= 2
+    assert metrics.response_bytes > 0
+
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/doctor-info/check/{doctor_id}",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/doctor-info/check/{doctor_id}",le="+Inf"}' in body
+    assert "/doctor-info/check/101" not in body
+    assert "db_pool_checkout_wait_seconds_count" in body
+
+    # One TYPE line per family, directly followed by all of that family's samples
+    lines = body.splitlines()
+    families = [line.split()[2] for line in lines if line.startswith("# TYPE ")]
+    assert len(families) == len(set(families))
+    assert "# TYPE jobs_enqueued_total counter" in lines
+    assert "# TYPE read_cache_hit_rate gauge" in lines
+    assert "# TYPE prediction_cache_lru_hits_total counter" in lines
+    assert "# TYPE prediction_cache_lru_size gauge" in lines
+    assert "# TYPE read_cache_coalesced_total counter" in lines
+    for family in ("http_requests_total", "db_statements_total"):
+        rows = [i for i, line in enumerate(lines) if line.startswith(family + "{")]
+        assert rows == list(range(lines.index(f"# TYPE {family} counter") + 1, rows[-1] + 1))
+
+def test_importing_the_app_leaves_logging_alone():
+    """Test 20: Structured logging is set up by the worker's lifespan, not by importing app.main"""
+    import subprocess
+    import sys
+
+    # A fresh interpreter: other tests run the lifespan in this one
+    probe = "import logging, app.main; print(len(logging.getLogger().handlers))"
+    result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "0"
+
+def test_profile_create_is_single_upsert():
+    """Test 12: Profile creation maps FK and unique conflicts to 404 and 400; GPA saves upsert"""
+    from app.metrics import ROUTE_METRICS
+    from app.routes.ml_predictions import _save_gpa
+    from app.database import StudentGPA
+
+    student_id = client.post("/students/register", json={
+        "username": "upsert_std", "email": "upsert@example.com", "password": "pw123456"
+    }).json()["id"]
+    profile = {
+        "first_name": "Up", "last_name": "Sert", "uni_name": "LU", "faculty": "Science",
+        "department": "Physics", "major": "Physics", "dob": "2002-01-01", "academic_year": 2,
+        "athletic_status": "none", "country_of_origin": "Lebanon", "country_of_residence": "Lebanon",
+        "gender": "female", "primary_language": "Arabic", "study_hours": 12,
+    }
+    route = ROUTE_METRICS.get(("POST", "/student-info/"))
+    statements_before = route.db_statements if route else 0
+
+    created = client.post("/student-info/", json={**profile, "student_id": student_id}, headers=_owner_headers("student", student_id))
+    assert created.status_code == 201
+    assert created.json()["data"]["student_id"] == student_id
+    # The profile upsert and the feature-store upsert (one CTE statement on PostgreSQL)
+    assert ROUTE_METRICS[("POST", "/student-info/")].db_statements - statements_before == 2
+
+    assert client.post("/student-info/", json={**profile, "student_id": student_id}, headers=_owner_headers("student", student_id)).status_code == 400
+    assert client.post("/student-info/", json={**profile, "student_id": 987654}, headers=_owner_headers("student", 987654)).status_code == 404
+    assert client.post("/doctor-info/", json={
+        "doctor_id": 987654, "uni_name": "LU", "faculty": "Science", "department": "Physics", "start_teaching_year": 2010
+    }, headers=_owner_headers("doctor", 987654)).status_code == 404
+
+    db = TestingSessionLocal()
+    try:
+        _save_gpa(db, student_id, 3.1, "a" * 64)
+        _save_gpa(db, student_id, 3.4, "b" * 64)
+        rows = db.query(StudentGPA).filter(StudentGPA.student_id == student_id).all()
+        assert [(row.predicted_gpa, row.feature_hash) for row in rows] == [(3.4, "b" * 64)]
+    finally:
+        db.close()
+
+def test_routes_declare_response_models():
+    """Test 13: Every API route has a response model and profiles serialize from plain columns"""
+    from fastapi.routing import APIRoute
+    from app.database import DoctorInfoResponse
+
+    untyped = [
+        route.path for route in app.routes
+        if isinstance(route, APIRoute) and route.response_model is None and route.path not in ("/", "/metrics")
+    ]
+    assert untyped == []
+
+    doctor_id = client.post("/doctors/register", json={
+        "username": "typed_dr", "password": "pw123456", "contact": "x", "price": 20.0
+    }).json()["id"]
+    client.post("/doctor-info/", json={
+        "doctor_id": doctor_id, "uni_name": "LU", "faculty": "Arts", "department": "Music", "start_teaching_year": 2001
+    }, headers=_owner_headers("doctor", doctor_id))
+    response = client.get(f"/doctor-info/{doctor_id}")
+    assert response.status_code == 200
+    assert set(response.json()) == set(DoctorInfoResponse.model_fields)
+    assert response.json()["department"] == "Music"
+
+def test_read_through_cache_single_flight_and_invalidation():
+    """Test 14: Cold keys load once under concurrency; profile and directory writes invalidate"""
+    from app.cache import LocalCacheBackend, ReadThroughCache
+    from app.metrics import ROUTE_METRICS
+
+    cache = ReadThroughCache("unit", LocalCacheBackend(maxsize=10, ttl=60))
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": len(loads)}
+
+    async def burst():
+        return await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(20)))
+
+    assert asyncio.run(burst()) == [{"value": 1}] * 20
+    assert len(loads) == 1
+    assert cache.stats()["coalesced"] == 19
+
+    doctor_id = client.post("/doctors/register", json={
+        "username": "cached_dr", "password": "pw123456", "contact": "x", "price": 20.0
+    }).json()["id"]
+    client.post("/doctor-info/", json={
+        "doctor_id": doctor_id, "uni_name": "LU", "faculty": "Law", "department": "Civil", "start_teaching_year": 2001
+    }, headers=_owner_headers("doctor", doctor_id))
+    route = ("GET", "/doctor-info/{doctor_id}")
+    assert client.get(f"/doctor-info/{doctor_id}").json()["department"] == "Civil"
+    statements = ROUTE_METRICS[route].db_statements
+    assert client.get(f"/doctor-info/{doctor_id}").json()["department"] == "Civil"
+    assert ROUTE_METRICS[route].db_statements == statements
+
+    assert client.get("/doctor-info/filter/", params={"faculty": "Law"}).json()[0]["department"] == "Civil"
+    client.put(f"/doctor-info/{doctor_id}", json={"department": "Criminal"}, headers=_owner_headers("doctor", doctor_id))
+    assert client.get(f"/doctor-info/{doctor_id}").json()["department"] == "Criminal"
+    assert client.get("/doctor-info/filter/", params={"faculty": "Law"}).json()[0]["department"] == "Criminal"
+
+    names = {row["cache"] for row in client.get("/metrics/caches").json()}
+    assert {"student_profiles", "doctor_profiles", "doctor_directory"} <= names
+
+def test_batch_profile_lookups():
+    """Test 15: Batch check and fetch answer many ids in request order with one query"""
+    from app.database import MAX_BATCH_IDS
+    from app.metrics import ROUTE_METRICS
+
+    doctor_ids = []
+    for n in range(3):
+        doctor_id = client.post("/doctors/register", json={
+            "username": f"batch_dr_{n}", "password": "pw123456", "contact": f"c{n}", "price": 10.0 + n
+        }).json()["id"]
+        doctor_ids.append(doctor_id)
+    for doctor_id in doctor_ids[:2]:
+        client.post("/doctor-info/", json={
+            "doctor_id": doctor_id, "uni_name": "LU", "faculty": "Arts", "department": "Music", "start_teaching_year": 2001
+        }, headers=_owner_headers("doctor", doctor_id))
+
+    ids = [doctor_ids[2], doctor_ids[0], 424242, doctor_ids[0]]
+    checks = client.post("/doctor-info/check/batch", json={"ids": ids}).json()
+    assert [(row["doctor_id"], row["exists"]) for row in checks] == [
+        (doctor_ids[2], False), (doctor_ids[0], True), (424242, False)
+    ]
+    assert ROUTE_METRICS[("POST", "/doctor-info/check/batch")].db_statements == 1
+
+    fetched = client.post("/doctor-info/batch", json={"ids": ids}).json()
+    assert [row["doctor_id"] for row in fetched["profiles"]] == [doctor_ids[0]]
+    assert fetched["profiles"][0]["owner"]["contact"] == "c0"
+    assert fetched["missing"] == [doctor_ids[2], 424242]
+
+    assert client.post("/student-info/check/batch", json={"ids": [1, 2]}).json()[0]["exists"] is False
+    assert client.post("/student-info/batch", json={"ids": list(range(MAX_BATCH_IDS + 1))}).status_code == 422
+    assert client.post("/student-info/batch", json={"ids": []}).status_code == 422
+
+def test_read_sessions_fall_back_to_primary(tmp_path, monkeypatch):
+    """Test 16: Reads use the replica when reachable and the primary while it is down"""
+    from app import database
+
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    monkeypatch.setattr(database, "replica_health", database.ReplicaHealth())
+
+    monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(bind=replica))
+    session = database._open_read_session()
+    assert session.get_bind() is replica
+    session.close()
+
+    monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(bind=broken))
+    session = database._open_read_session()
+    assert session.get_bind() is database.engine
+    session.close()
+    assert database.replica_health.failures == 1
+    assert not database.replica_health.healthy
+
+    # Within the retry window the replica is not even attempted
+    monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(bind=replica))
+    session = database._open_read_session()
+    assert session.get_bind() is database.engine
+    session.close()
+    assert database.replica_health.fallbacks == 2
+    replica.dispose()
+    broken.dispose()
+
+def test_overload_sheds_and_rate_limits_logins(monkeypatch):
+    """Test 17: Full queues and queue timeouts get 503, repeated logins get 429, "/" is never shed"""
+    from app.overload import ConcurrencyLimiter, LoginRateLimiter, Overloaded
+
+    async def contend():
+        limiter = ConcurrencyLimiter("unit", limit=1, max_queue=1, queue_timeout=0.05)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+        with pytest.raises(Overloaded):
+            await waiting
+        limiter.release()
+        await limiter.acquire()
+        return limiter.snapshot()
+
+    stats = asyncio.run(contend())
+    assert (stats["admitted"], stats["rejected_queue_full"], stats["rejected_queue_timeout"]) == (2, 1, 1)
+
+    saturated = ConcurrencyLimiter("reads", limit=1, max_queue=0, queue_timeout=0.05)
+    saturated.active = 1
+    monkeypatch.setitem(overload.LIMITERS, "reads", saturated)
+    shed = client.get("/doctor-info/check/1")
+    assert shed.status_code == 503
+    assert shed.headers["Retry-After"] == str(overload.OVERLOAD_RETRY_AFTER)
+    assert client.get("/").status_code == 200
+
+    monkeypatch.setattr(overload, "login_rate_limiter", LoginRateLimiter(capacity=2, window=60))
+    params = {"username": "nobody", "password": "wrong"}
+    assert [client.post("/students/login", params=params).status_code for _ in range(3)] == [401, 401, 429]
+    assert int(client.post("/doctors/login", json=params).headers["Retry-After"]) >= 1
+    assert client.get("/metrics/overload").json()["login_rate_limited"] == 2
+
+def test_feature_store_follows_profile_writes():
+    """Test 18: Profile writes keep student_features current; missing or outdated rows are rebuilt on read"""
+    from datetime import date
+    import numpy as np
+    from app.database import StudentFeatures, StudentInfo
+    from app.features import FEATURE_VERSION, build_ml_input, encode_vector, feature_hash, load_features
+
+    student_id = client.post("/students/register", json={
+        "username": "features_std", "email": "features@example.com", "password": "pw123456"
+    }).json()["id"]
+    client.post("/student-info/", json={
+        "student_id": student_id, "first_name": "Fea", "last_name": "Ture", "uni_name": "LU",
+        "faculty": "Science", "department": "Physics", "major": "Physics", "dob": "2002-01-01",
+        "academic_year": 2, "athletic_status": "none", "country_of_origin": "Lebanon",
+        "country_of_residence": "Lebanon", "gender": "female", "primary_language": "Arabic", "study_hours": 12,
+    }, headers=_owner_headers("student", student_id))
+    token = client.post("/students/login", params={"username": "features_std", "password": "pw123456"}).json()["access_token"]
+    client.put(f"/student-info/{student_id}", json={"study_hours": 20.0}, headers={"Authorization": f"Bearer {token}"})
+
+    db = TestingSessionLocal()
+    try:
+        expected = build_ml_input(db.query(StudentInfo).filter(StudentInfo.student_id == student_id).one())
+        stored = db.get(StudentFeatures, student_id)
+        assert (stored.features["study_hours"], stored.feature_hash, stored.version) == (
+            20.0, feature_hash(expected), FEATURE_VERSION
+        )
+        assert np.frombuffer(stored.vector).tolist() == [date(2002, 1, 1).toordinal(), 2, 20.0, 0, 0]
+
+        def loaded(*criteria):
+            return {
+                loaded_id: (entry.ml_input, entry.feature_hash, entry.vector.tolist())
+                for loaded_id, entry in load_features(db, *criteria).items()
+            }
+
+        current = {student_id: (expected, feature_hash(expected), encode_vector(expected).tolist())}
+        assert loaded(StudentInfo.student_id == student_id) == current
+
+        # Rows from before the store, or from an older FEATURE_VERSION, are rebuilt
+        stored.version = FEATURE_VERSION - 1
+        stored.features = {}
+        db.commit()
+        assert loaded(StudentInfo.student_id == student_id) == current
+        db.expire_all()
+        assert db.get(StudentFeatures, student_id).version == FEATURE_VERSION
+        db.query(StudentFeatures).delete()
+        db.commit()
+        assert loaded(StudentInfo.student_id.in_([student_id, 987654])) == current
+        assert db.query(StudentFeatures).count() == 1
+    finally:
+        db.close()
+
+def test_reads_after_writes_skip_the_lagging_replica(tmp_path):
+    """Test 19: Cache loads and index patches that follow a write read the primary, not the replica"""
+    from sqlalchemy import select
+    from app.cache import LocalCacheBackend, ReadThroughCache
+    from app.database import Doctor, DoctorInfo
+
+    cache = ReadThroughCache("unit", LocalCacheBackend(maxsize=10, ttl=60))
+
+    async def load(source):
+        return {"from": source}
+
+    async def loads():
+        await cache.invalidate("k")
+        fresh = await cache.get_or_load("k", lambda: load("replica"), lambda: load("primary"))
+        await cache.backend.delete("k")
+        # The first fresh load settles the key; later misses may use the replica again
+        settled = await cache.get_or_load("k", lambda: load("replica"), lambda: load("primary"))
+        await cache.bump_generation("group")
+        grouped = await cache.get_or_load("1:page", lambda: load("replica"), lambda: load("primary"), group="group")
+        return fresh["from"], settled["from"], grouped["from"]
+
+    assert asyncio.run(loads()) == ("primary", "replica", "primary")
+
+    doctor_id = client.post("/doctors/register", json={
+        "username": "lagging_dr", "password": "pw123456", "contact": "x", "price": 20.0
+    }).json()["id"]
+    client.post("/doctor-info/", json={
+        "doctor_id": doctor_id, "uni_name": "LU", "faculty": "Law", "department": "Civil", "start_teaching_year": 2001
+    }, headers=_owner_headers("doctor", doctor_id))
+
+    # A replica that holds the rows as they were before the update below
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(bind=replica)
+    with engine.connect() as primary_conn, replica.begin() as replica_conn:
+        for table in (Doctor.__table__, DoctorInfo.__table__):
+            replica_conn.execute(table.insert(), [row._asdict() for row in primary_conn.execute(select(table))])
+    ReplicaSession = sessionmaker(bind=replica)
+
+    def replica_db():
+        db = ReplicaSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_read_db] = replica_db
+    try:
+        assert client.get(f"/doctor-info/{doctor_id}").json()["department"] == "Civil"
+        assert client.get("/doctors/search", params={"q": "Civil"}).json()[0]["doctor_id"] == doctor_id
+        assert client.get("/doctor-info/filter/", params={"faculty": "Law"}).json()[0]["department"] == "Civil"
+
+        client.put(
+            f"/doctor-info/{doctor_id}", json={"department": "Criminal"}, headers=_owner_headers("doctor", doctor_id)
+        )
+        assert client.get(f"/doctor-info/{doctor_id}").json()["department"] == "Criminal"
+        assert client.get("/doctor-info/filter/", params={"faculty": "Law"}).json()[0]["department"] == "Criminal"
+        found = client.get("/doctors/search", params={"q": "Criminal"}).json()
+        assert [row["doctor_id"] for row in found] == [doctor_id]
+    finally:
+        app.dependency_overrides[get_read_db] = override_get_db
+        replica.dispose()